@@ -0,0 +1,154 @@
+'''Contains AsyncBus, a Bus for use inside an asyncio event loop'''
+
+import asyncio
+import inspect
+
+from bus import Bus, BusMessage, _BatchSubscriber, _message_ids
+from dispatch import print_error
+
+
+class Subscription:
+    '''Feeds one subscriber from a bounded asyncio.Queue.
+
+    The subscriber may be a plain function or a coroutine function. It
+    runs in its own task, so a slow subscriber only holds up whoever is
+    waiting for room in its queue.
+    '''
+
+    def __init__(self, subscriber, maxsize, on_error=print_error):
+        self.subscriber = subscriber
+        self.on_error = on_error
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self._task = None
+
+    def _start(self):
+        '''Starts the consumer task, once there is a loop to run it'''
+        if self._task is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._task = loop.create_task(self._consume())
+
+    async def put(self, msg):
+        '''Queues a message, waiting for room if the queue is full'''
+        self._start()
+        await self.queue.put(msg)
+
+    def __call__(self, msg):
+        # Synchronous senders (plain Buses, attach notices) can't wait
+        # for room, so anything that doesn't fit is dropped
+        self._start()
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def __eq__(self, other):
+        # lets Bus.unsubscribe find the subscription by its subscriber
+        return other is self or other == self.subscriber
+
+    def __hash__(self):
+        return hash(self.subscriber)
+
+    async def _consume(self):
+        while True:
+            msg = await self.queue.get()
+            try:
+                result = self.subscriber(msg)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                self.on_error(self.subscriber, msg)
+            finally:
+                self.queue.task_done()
+
+    async def join(self):
+        '''Waits until every queued message has been handled'''
+        self._start()
+        await self.queue.join()
+
+    def close(self):
+        '''Stops the consumer task'''
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+async def _put(subscriber, msg):
+    '''Hands msg to a subscriber, waiting for room if it has a queue'''
+    if type(subscriber) is Subscription:
+        await subscriber.put(msg)
+    else:
+        subscriber(msg)
+
+
+class AsyncBus(Bus):
+    '''A Bus whose broadcasts are awaited.
+
+    Every subscriber gets a Subscription with a bounded queue, and
+    broadcast waits for room in each queue it sends to, which pushes
+    back on senders when a consumer falls behind. Routing is the same
+    as Bus, and AsyncBuses can be attached to plain Buses. Messages that
+    arrive from a plain Bus are queued without waiting, and dropped if
+    there is no room.
+    '''
+
+    def __init__(self, name, maxsize=1024):
+        super().__init__(name)
+        self.maxsize = maxsize
+
+    def subscribe(self, topic_filter, subscriber, batch=False, maxsize=None):
+        '''Like Bus.subscribe, but the subscriber may be a coroutine
+        function and runs in its own task. Returns the Subscription'''
+        subscription = Subscription(
+            subscriber, self.maxsize if maxsize is None else maxsize)
+        super().subscribe(topic_filter, subscription, batch=batch)
+        return subscription
+
+    def unsubscribe(self, topic_filter, subscriber):
+        '''Removes a subscriber and stops its task. Returns whether it
+        was subscribed'''
+        for subscription in self.subscribers.get(topic_filter):
+            if type(subscription) is _BatchSubscriber:
+                subscription = subscription.subscriber
+            if subscription == subscriber:
+                break
+        else:
+            return False
+        super().unsubscribe(topic_filter, subscriber)
+        subscription.close()
+        return True
+
+    async def broadcast(self, topic, fmt, *args, **kwargs):
+        '''Sends a message on topic to every interested subscriber in
+        the tree, waiting for room in their queues'''
+        route = self._route(topic)
+        if not route:
+            return
+        msg = fmt.format(*args, **kwargs)
+        bus_msg = BusMessage(
+            topic, msg, self.path, size=len(msg.encode('utf-8')),
+            id=next(_message_ids))
+        for subscriber in route:
+            if type(subscriber) is _BatchSubscriber:
+                await _put(subscriber.subscriber, [bus_msg])
+            else:
+                await _put(subscriber, bus_msg)
+
+    async def broadcast_many(self, messages):
+        '''Like Bus.broadcast_many, but waits for room in the
+        subscribers' queues'''
+        for subscriber, msgs in self._deliveries(messages):
+            if type(subscriber) is _BatchSubscriber:
+                await _put(subscriber.subscriber, msgs)
+            else:
+                for bus_msg in msgs:
+                    await _put(subscriber, bus_msg)
+
+    def _notify(self, notices):
+        # attach and detach are synchronous, so their notices can't be
+        # awaited and go out like a plain Bus's would
+        for topic, fmt, *args in notices:
+            Bus.broadcast(self, topic, fmt, *args)
@@ -0,0 +1,4 @@
+'''Benchmarks. Run them from the repository root, for example:
+
+    $ python -m bench.bench_bus
+'''
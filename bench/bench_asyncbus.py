@@ -0,0 +1,65 @@
+'''Benchmarks AsyncBus against the synchronous Bus'''
+
+import asyncio
+import statistics
+import time
+
+import asyncbus
+import bus
+
+
+def build_tree(cls, size, fanout=4):
+    buses = [cls('bus-{}'.format(i)) for i in range(size)]
+    for i, b in enumerate(buses[1:], 1):
+        buses[(i - 1) // fanout].add_child(b)
+    return buses
+
+
+def report(label, count, elapsed, latencies):
+    latencies.sort()
+    print('{:>5}  {:>9.0f} msgs/s  latency p50 {:>7.1f}us  p99 {:>7.1f}us'
+          .format(label, count / elapsed,
+                  statistics.median(latencies) * 1e6,
+                  latencies[int(len(latencies) * 0.99)] * 1e6))
+
+
+def bench_sync(count, size):
+    buses = build_tree(bus.Bus, size)
+    sent, latencies = {}, []
+    buses[0].subscribe(
+        'sensor',
+        lambda msg: latencies.append(time.perf_counter() - sent[msg.message]))
+    leaf = buses[-1]
+    start = time.perf_counter()
+    for i in range(count):
+        key = str(i)
+        sent[key] = time.perf_counter()
+        leaf.broadcast('sensor.heat', key)
+    report('sync', count, time.perf_counter() - start, latencies)
+
+
+async def bench_async(count, size, maxsize):
+    buses = build_tree(asyncbus.AsyncBus, size)
+    sent, latencies = {}, []
+
+    async def subscriber(msg):
+        latencies.append(time.perf_counter() - sent[msg.message])
+    subscription = buses[0].subscribe('sensor', subscriber, maxsize=maxsize)
+    leaf = buses[-1]
+    start = time.perf_counter()
+    for i in range(count):
+        key = str(i)
+        sent[key] = time.perf_counter()
+        await leaf.broadcast('sensor.heat', key)
+    await subscription.join()
+    report('async', count, time.perf_counter() - start, latencies)
+    subscription.close()
+
+
+def main(count=100000, size=100, maxsize=256):
+    bench_sync(count, size)
+    asyncio.run(bench_async(count, size, maxsize))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''Benchmarks stamping blueprints against rebuilding the same assembly
+with attach'''
+
+import time
+
+import components
+from blueprint import Blueprint
+
+
+class Frame(components.Component):
+    pass
+
+
+class Panel(components.Component):
+    pass
+
+
+def build(fanout=4, depth=3):
+    '''Builds one assembly the slow way, attach by attach'''
+    root = Frame()
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for _ in range(fanout):
+                panel = Panel()
+                parent.bus.attach(panel.bus)
+                next_level.append(panel)
+        level = next_level
+    return root
+
+
+def main(copies=2000):
+    template = build()
+    parts = len(Blueprint.capture(template))
+    start = time.perf_counter()
+    for _ in range(copies):
+        build()
+    attached = time.perf_counter() - start
+    blueprint = Blueprint.capture(template)
+    start = time.perf_counter()
+    blueprint.stamp(copies)
+    stamped = time.perf_counter() - start
+    print('{} copies of {} parts'.format(copies, parts))
+    print('  attach {:>7.2f}s  {:>9.0f} parts/s'.format(
+        attached, copies * parts / attached))
+    print('   stamp {:>7.2f}s  {:>9.0f} parts/s  ({:.1f}x)'.format(
+        stamped, copies * parts / stamped, attached / stamped))
+
+
+if __name__ == '__main__':
+    main()
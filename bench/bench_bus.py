@@ -0,0 +1,163 @@
+'''Benchmarks for bus.py'''
+
+import random
+import time
+
+import bus
+
+
+def timed(func, repeat):
+    '''Returns the average number of seconds one call of func takes,
+    after one untimed warm-up call'''
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_subscribers(counts=(1, 10, 100, 1000, 10000), repeat=20000):
+    '''Per-message cost as diagnostic subscribers pile up on one bus'''
+    print('subscribers  usec/message')
+    for count in counts:
+        b = bus.Bus('root')
+        for i in range(count):
+            b.subscribe('diag.sensor{}'.format(i), lambda msg: None)
+        b.subscribe('guns', lambda msg: None)
+        cost = timed(lambda: b.broadcast('guns.fire', 'pew'), repeat)
+        print('{:>11}  {:>12.2f}'.format(count, cost * 1e6))
+
+
+def build_tree(size, fanout=4):
+    '''Builds a tree of size buses, returning them in creation order'''
+    buses = [bus.Bus('bus-{}'.format(i)) for i in range(size)]
+    for i, b in enumerate(buses[1:], 1):
+        buses[(i - 1) // fanout].add_child(b)
+    return buses
+
+
+def bench_tree_broadcast(sizes=(10, 100, 1000, 10000), repeat=2000):
+    '''Cost of one broadcast from a leaf as the tree grows'''
+    print('buses  usec/message')
+    for size in sizes:
+        buses = build_tree(size)
+        buses[0].subscribe('guns', lambda msg: None)
+        leaf = buses[-1]
+        cost = timed(lambda: leaf.broadcast('guns.fire', 'pew'), repeat)
+        print('{:>5}  {:>12.1f}'.format(size, cost * 1e6))
+
+
+def bench_route_compile(sizes=(100, 1000, 10000), repeat=200):
+    '''Cost of compiling a route from a leaf when a single bus in the
+    tree is interested, which is what every topology change costs'''
+    print('buses  usec/compile')
+    for size in sizes:
+        buses = build_tree(size)
+        buses[1].subscribe('guns', lambda msg: None)
+        leaf = buses[-1]
+        cost = timed(lambda: leaf._compile_route('guns.fire'), repeat)
+        print('{:>5}  {:>12.1f}'.format(size, cost * 1e6))
+
+
+def bench_batched(count=100000):
+    '''Throughput of broadcast against broadcast_many for a sensor
+    loop publishing on a few topics'''
+    buses = build_tree(100)
+    sensor = buses[-1]
+    for i in range(4):
+        buses[i].subscribe('sensor', lambda msgs: None, batch=True)
+    topics = ['sensor.heat', 'sensor.power', 'sensor.radiation']
+    readings = [(topics[i % 3], str(i)) for i in range(count)]
+
+    def one_at_a_time():
+        for topic, message in readings:
+            sensor.broadcast(topic, message)
+
+    def all_at_once():
+        sensor.broadcast_many(readings)
+
+    for label, func in (('broadcast', one_at_a_time),
+                        ('broadcast_many', all_at_once)):
+        cost = timed(func, 5)
+        print('{:>14}  {:>10.0f} msgs/s'.format(label, count / cost))
+
+
+def bench_redundant(size=10000, links_per_bus=(0, 2, 8)):
+    '''Broadcast cost on trees with increasingly many redundant links.
+    Routes follow the tree, so the links should not matter'''
+    rng = random.Random(0)
+    print('links/bus  usec/compile')
+    for links in links_per_bus:
+        buses = build_tree(size)
+        for b in buses:
+            for other in rng.sample(buses, links):
+                b.attach(other)
+        for b in buses[::100]:
+            b.subscribe('engines', lambda msg: None)
+        leaf = buses[-1]
+        cost = timed(lambda: leaf._compile_route('engines.status'), 20)
+        print('{:>9}  {:>12.1f}'.format(links, cost * 1e6))
+
+
+def bench_build_ship(assemblies=1000, parts=99):
+    '''Builds a 100k-bus ship out of assemblies, with one attach per
+    part and then with attach_many'''
+    def one_at_a_time():
+        hull = bus.Bus('hull')
+        for a in range(assemblies):
+            assembly = bus.Bus('assembly-{}'.format(a))
+            for p in range(parts):
+                assembly.attach(bus.Bus('part-{}'.format(p)))
+            hull.attach(assembly)
+        return hull
+
+    def all_at_once():
+        hull = bus.Bus('hull')
+        subassemblies = []
+        for a in range(assemblies):
+            assembly = bus.Bus('assembly-{}'.format(a))
+            assembly.attach_many(
+                [bus.Bus('part-{}'.format(p)) for p in range(parts)])
+            subassemblies.append(assembly)
+        hull.attach_many(subassemblies)
+        return hull
+
+    for label, func in (('attach', one_at_a_time),
+                        ('attach_many', all_at_once)):
+        start = time.perf_counter()
+        hull = func()
+        elapsed = time.perf_counter() - start
+        print('{:>11}  {} buses in {:.2f}s'.format(
+            label, hull.root.child_count + 1, elapsed))
+
+
+def bench_attach_watched(sizes=(2000, 4000, 8000, 16000)):
+    '''Builds trees with attach while something on the root listens to
+    every topic, as the terminal's bare subscribe does, so every attach
+    sends notices that need the sender's path'''
+    print('buses  usec/attach')
+    for size in sizes:
+        root = bus.Bus('root')
+        root.subscribe('', lambda msg: None)
+        buses = [root]
+        start = time.perf_counter()
+        for i in range(1, size):
+            child = bus.Bus('bus-{}'.format(i))
+            buses[(i - 1) // 3].attach(child)
+            buses.append(child)
+        elapsed = time.perf_counter() - start
+        print('{:>5}  {:>11.1f}'.format(size, elapsed / (size - 1) * 1e6))
+
+
+def main():
+    bench_subscribers()
+    bench_tree_broadcast()
+    bench_route_compile()
+    bench_batched()
+    bench_redundant()
+    bench_build_ship()
+    bench_attach_watched()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+'''Benchmarks CableSimulator events per second on a tree of cabled
+buses'''
+
+import random
+import time
+
+import bus
+import cables
+
+
+def build_tree(size, cable, fanout=4):
+    buses = [bus.Bus('bus-{}'.format(i)) for i in range(size)]
+    for i, b in enumerate(buses[1:], 1):
+        buses[(i - 1) // fanout].attach(b, cable)
+    return buses
+
+
+def main(count=100000, size=1000, seed=0):
+    rng = random.Random(seed)
+    cable = cables.Cable(bandwidth=1e6, latency=0.001, buffer=64000,
+                         burst=4000)
+    buses = build_tree(size, cable)
+    received = []
+    for b in rng.sample(buses, 10):
+        b.subscribe('sensor', received.append)
+    sim = cables.CableSimulator()
+    for i in range(count):
+        sim.send(rng.choice(buses), 'sensor.heat', 'x' * 100, at=i * 1e-5)
+    start = time.perf_counter()
+    events = sim.run()
+    elapsed = time.perf_counter() - start
+    print('{} events in {:.2f}s ({:.0f} events/s), {} delivered, '
+          '{} dropped, {:.3f}s simulated'.format(
+              events, elapsed, events / elapsed, sim.delivered,
+              sim.dropped, sim.now))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''Times constructing components and reports memory per component
+for Component objects and a ComponentStore'''
+
+import time
+import tracemalloc
+
+import components
+
+
+class Part(components.Component):
+    pass
+
+
+def measure(label, count, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = build(count)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:>10}  {:>7.0f} bytes/component  {:>9.0f} components/s'.format(
+        label, size / count, count / elapsed))
+    return kept
+
+
+def build_objects(count):
+    return [Part() for _ in range(count)]
+
+
+def build_store(count):
+    store = components.ComponentStore()
+    store.add_many(Part, count)
+    return store
+
+
+def bench_construction(count):
+    '''Times making components that are never wired up, like a bulk
+    purchase that goes straight into the inventory'''
+    start = time.perf_counter()
+    parts = build_objects(count)
+    elapsed = time.perf_counter() - start
+    print('constructed {} components in {:.2f}s ({:.0f}/s)'.format(
+        count, elapsed, count / elapsed))
+    start = time.perf_counter()
+    for part in parts[:count // 10]:
+        part.bus
+    elapsed = time.perf_counter() - start
+    print('wired up {} of them in {:.2f}s ({:.0f}/s)'.format(
+        count // 10, elapsed, count // 10 / elapsed))
+
+
+def main(count=100000, construct=1000000):
+    bench_construction(construct)
+    measure('Component', count, build_objects)
+    store = measure('store', count, build_store)
+    start = time.perf_counter()
+    store.total_mass()
+    print('total mass of {} components in {:.2f}ms'.format(
+        count, (time.perf_counter() - start) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+'''Drives a framed server in another process with client.py's load
+generator at rising request rates, printing one JSON summary per rate
+so runs can be compared'''
+
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+
+import client
+
+
+def main(players=500, rates=(1000, 5000, 10000, 20000), duration=5):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    players = min(players, hard - 100)
+    proc = subprocess.Popen(
+        [sys.executable, '-c',
+         'import resource, server;'
+         'resource.setrlimit(resource.RLIMIT_NOFILE, 2 * ({},));'
+         'server.main(["--port", "0", "--framed"])'.format(hard)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(proc.stdout.readline().split()[-1])
+        for rate in rates:
+            summary = asyncio.run(client.generate_load(
+                port=port, players=players, rate=rate, duration=duration,
+                seed=rate))
+            print(json.dumps(summary), flush=True)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    main()
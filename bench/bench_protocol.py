@@ -0,0 +1,74 @@
+'''Benchmarks the framed protocol against the raw echo protocol over
+localhost: round-trip latency, and messages per second with and
+without pipelining'''
+
+import asyncio
+import socket
+import statistics
+import threading
+import time
+
+import client
+import server
+
+
+def start(server_class):
+    '''Runs a server on its own thread and event loop'''
+    loop = asyncio.new_event_loop()
+    game = server_class(port=0)
+    loop.run_until_complete(game.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return game
+
+
+def report(label, count, elapsed, latencies=None):
+    line = '{:>16}  {:>9.0f} msgs/s'.format(label, count / elapsed)
+    if latencies:
+        latencies.sort()
+        line += '  latency p50 {:>6.1f}us  p99 {:>6.1f}us'.format(
+            statistics.median(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6)
+    print(line)
+
+
+def bench_raw(port, count):
+    sock = socket.create_connection(('localhost', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.recv(4096)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        sent = time.perf_counter()
+        sock.sendall(b'ping')
+        # with no framing, this only works because we wait every time
+        sock.recv(4096)
+        latencies.append(time.perf_counter() - sent)
+    report('raw echo', count, time.perf_counter() - start, latencies)
+    sock.sendall(b'/q')
+    sock.close()
+
+
+def bench_framed(port, count, depth):
+    with client.FramedClient('localhost', port) as conn:
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(count):
+            sent = time.perf_counter()
+            conn.request('ping')
+            latencies.append(time.perf_counter() - sent)
+        report('framed', count, time.perf_counter() - start, latencies)
+        lines = ['ping'] * depth
+        start = time.perf_counter()
+        for _ in range(count // depth):
+            conn.pipeline(lines)
+        report('framed x{}'.format(depth), count,
+               time.perf_counter() - start)
+
+
+def main(count=20000, depth=100):
+    bench_raw(start(server.GameServer).port, count)
+    bench_framed(start(server.FramedGameServer).port, count, depth)
+
+
+if __name__ == '__main__':
+    main()
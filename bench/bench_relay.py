@@ -0,0 +1,69 @@
+'''Stress test for relay.py: many local clients subscribe to one topic
+and the relay fans messages out to all of them. Reports deliveries per
+second, and what happens with a client that never reads'''
+
+import asyncio
+import time
+
+import bus
+import relay
+
+
+async def subscribe(ship, count):
+    clients = []
+    for _ in range(count):
+        client = await relay.RelayClient.connect(ship.host, ship.port)
+        client.subscribe('ship', 'sensor')
+        await client.flush()
+        clients.append(client)
+    while sum(1 for peer in ship.peers if peer.subscriptions) < count:
+        await asyncio.sleep(0.01)
+    return clients
+
+
+async def drain(client, count):
+    for _ in range(count):
+        await client.receive()
+
+
+async def fanout(clients, count, size, slow=0, overflow=relay.DROP_OLDEST):
+    ship = relay.Relay({'ship': bus.Bus('ship')}, port=0,
+                       max_buffer=64 * 1024, overflow=overflow)
+    await ship.start()
+    readers = await subscribe(ship, clients)
+    laggards = await subscribe(ship, slow)
+    padding = 'x' * size
+    start = time.perf_counter()
+    reading = asyncio.gather(*(drain(client, count) for client in readers))
+    for i in range(count):
+        ship.buses['ship'].broadcast('sensor.heat', '{} {}', i, padding)
+        if i % 16 == 0:
+            # let the relay write and the clients read
+            await asyncio.sleep(0)
+    await reading
+    elapsed = time.perf_counter() - start
+    dropped = sum(peer.dropped for peer in ship.peers)
+    print('{:>5} clients {:>3} slow  {:>9.0f} deliveries/s  '
+          '{:>6.0f} msgs/s  encoded {}  dropped {}'.format(
+              clients, slow, clients * count / elapsed, count / elapsed,
+              ship.encoded, dropped))
+    for client in readers + laggards:
+        await client.close()
+    await ship.shutdown()
+
+
+async def bench(count, size):
+    for clients in (1, 10, 100, 500):
+        await fanout(clients, count, size)
+    # slow clients have to overflow their kernel socket buffers before
+    # the relay starts dropping for them
+    await fanout(100, count, size, slow=10)
+    await fanout(100, count, size, slow=10, overflow=relay.COALESCE)
+
+
+def main(count=10000, size=1000):
+    asyncio.run(bench(count, size))
+
+
+if __name__ == '__main__':
+    main()
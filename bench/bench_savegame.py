@@ -0,0 +1,39 @@
+'''Times saving and opening a ship with a million parts'''
+
+import os
+import tempfile
+import time
+
+import components
+import savegame
+from inventory import Inventory
+
+
+class Plate(components.Component):
+    pass
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print('{:>24}  {:>9.2f}ms'.format(
+        label, (time.perf_counter() - start) * 1e3))
+    return result
+
+
+def main(count=1000000):
+    inv = Inventory()
+    inv.store_many(Plate.create_many(count))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ship.save')
+        timed('save', savegame.save, path, inv)
+        print('{:>24}  {:>9.1f} bytes/component'.format(
+            'file size', os.path.getsize(path) / count))
+        game = timed('open', savegame.load, path)
+        timed('resolve one', game.resolve, 'plate-ABCD')
+        timed('load inventory', game.inventory)
+        game.close()
+
+
+if __name__ == '__main__':
+    main()
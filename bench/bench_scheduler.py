@@ -0,0 +1,55 @@
+'''Benchmarks scheduler.py: scheduling and cancelling timers, and
+simulated flight where most components are idle'''
+
+import random
+import time
+
+import scheduler
+
+
+def report(label, count, elapsed):
+    print('{:>28}  {:>9.0f}/s'.format(label, count / elapsed))
+
+
+def bench_schedule(count):
+    clock = scheduler.Scheduler()
+    times = [random.random() * 1000 for _ in range(count)]
+    start = time.perf_counter()
+    timers = [clock.call_at(when, int) for when in times]
+    report('call_at', count, time.perf_counter() - start)
+    start = time.perf_counter()
+    for timer in timers[::2]:
+        timer.cancel()
+    report('cancel', count // 2, time.perf_counter() - start)
+    start = time.perf_counter()
+    ran = clock.run()
+    report('run (half cancelled)', ran, time.perf_counter() - start)
+
+
+def bench_flight(active, seconds):
+    '''active components with a recurring timer each, guns cycling say.
+    Idle components have no timers, so they don't appear at all'''
+    clock = scheduler.Scheduler()
+    fired = [0]
+
+    def cycle():
+        fired[0] += 1
+    for _ in range(active):
+        clock.call_every(random.uniform(0.1, 1.0), cycle)
+    start = time.perf_counter()
+    clock.advance(seconds)
+    elapsed = time.perf_counter() - start
+    print('{} active: {:.0f}s of flight in {:.2f}s '
+          '({:.0f}x real time, {:.0f} events/s)'.format(
+              active, seconds, elapsed, seconds / elapsed,
+              fired[0] / elapsed))
+
+
+def main(count=200000):
+    bench_schedule(count)
+    for active in (50, 500, 5000):
+        bench_flight(active, 600)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''Load test for server.py: opens many concurrent connections to a
+server in another process and reports connections per second, echo
+round trips per second and server memory per connection'''
+
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+
+def rss(pid):
+    '''Returns the resident memory of a process in bytes (Linux only)'''
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+async def open_client(port, motd_length):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    await reader.readexactly(motd_length)
+    return reader, writer
+
+
+async def echo(reader, writer):
+    writer.write(b'ping')
+    await reader.readexactly(4)
+
+
+async def load(port, pid, count, batch):
+    import server
+    motd_length = len(server.WELCOME)
+    before = rss(pid)
+    clients = []
+    start = time.perf_counter()
+    for first in range(0, count, batch):
+        clients.extend(await asyncio.gather(*(
+            open_client(port, motd_length)
+            for _ in range(first, min(count, first + batch)))))
+    elapsed = time.perf_counter() - start
+    print('{} connections in {:.2f}s ({:.0f}/s)'.format(
+        count, elapsed, count / elapsed))
+    print('server memory {:.1f}KB per connection'.format(
+        (rss(pid) - before) / count / 1024))
+    start = time.perf_counter()
+    await asyncio.gather(*(echo(*client) for client in clients))
+    elapsed = time.perf_counter() - start
+    print('{} concurrent echoes in {:.2f}s ({:.0f}/s)'.format(
+        count, elapsed, count / elapsed))
+    for _, writer in clients:
+        writer.close()
+
+
+def main(count=10000, batch=500):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    # the client end of each connection needs a descriptor here too
+    count = min(count, hard - 100)
+    proc = subprocess.Popen(
+        [sys.executable, '-c',
+         'import resource, server;'
+         'resource.setrlimit(resource.RLIMIT_NOFILE, 2 * ({},));'
+         'server.main(["--port", "0"])'.format(hard)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(proc.stdout.readline().split()[-1])
+        asyncio.run(load(port, proc.pid, count, batch))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''Benchmarks simulation.py on a big ship: how long it takes to compile
+and how many ticks per second it steps'''
+
+import time
+
+import components
+import simulation
+
+
+class PowerCore(components.Component):
+    power_output = 5000.0
+    heat_output = 500.0
+    cooling = 20.0
+
+
+class Gun(components.Component):
+    power_draw = 300.0
+    cooling = 2.0
+
+
+class Conduit(components.Component):
+    pass
+
+
+def build(size, branching=10):
+    '''Makes a ship of size components: cores each powering a bank of
+    guns and conduits, with the cores chained together'''
+    parts = []
+    cores = PowerCore.create_many(max(1, size // (branching + 1)))
+    for core in cores:
+        parts.append(core)
+        guns = Gun.create_many(branching // 2)
+        conduits = Conduit.create_many(branching - branching // 2)
+        core.bus.attach_many(part.bus for part in guns + conduits)
+        parts.extend(guns + conduits)
+    for previous, core in zip(cores, cores[1:]):
+        previous.bus.attach(core.bus)
+    return parts
+
+
+def main(size=100000, ticks=1000, dt=0.05):
+    parts = build(size)
+    start = time.perf_counter()
+    ship = simulation.compile_ship(parts)
+    print('compiled {} components and {} connections in {:.2f}s'.format(
+        len(ship), len(ship.edges.rows), time.perf_counter() - start))
+    start = time.perf_counter()
+    ship.run(ticks, dt)
+    elapsed = time.perf_counter() - start
+    print('{} ticks in {:.2f}s ({:.0f} ticks/s, {:.1f}M component '
+          'ticks/s)'.format(ticks, elapsed, ticks / elapsed,
+                            ticks * len(ship) / elapsed / 1e6))
+    print('hottest', ship.hottest(3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''Benchmarks testbench.py: a big assembly through many scenarios on
+one worker and on every CPU, and how big the snapshot sent to each
+worker is'''
+
+import os
+import pickle
+import time
+
+import testbench
+from bench.bench_simulation import build
+
+
+def main(size=20000, scenarios=16):
+    parts = build(size)
+    root = parts[0]
+    start = time.perf_counter()
+    snapshot = testbench.Snapshot(testbench.assembly(root))
+    data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+    print('{} components compiled in {:.2f}s, snapshot {:.0f} bytes each'
+          .format(len(snapshot.model), time.perf_counter() - start,
+                  len(data) / len(snapshot.model)))
+    loads = [testbench.Scenario('load-{}'.format(i), {'*': i / scenarios},
+                                duration=60, dt=0.1)
+             for i in range(scenarios)]
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        report = testbench.run(root, loads, workers)
+        elapsed = time.perf_counter() - start
+        print('{} scenarios on {} workers in {:.2f}s ({:.1f}/s), {}'.format(
+            len(report.results), workers, elapsed,
+            len(report.results) / elapsed,
+            'passed' if report.passed else 'failed'))
+
+
+if __name__ == '__main__':
+    main()
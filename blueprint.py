@@ -0,0 +1,136 @@
+'''Blueprints: sub-assemblies of components captured once and built
+again as many times as needed'''
+
+from collections import namedtuple
+import copy
+import gc
+
+import bus
+import components
+from common import letterer_range
+
+# Attribute values of these types can be shared between copies
+_IMMUTABLE = (bool, int, float, complex, str, bytes, type(None), frozenset)
+
+Part = namedtuple('Part', 'kind attributes parent cable')
+Part.__doc__ = '''One component of a blueprint: its class, its public
+attributes, the index of the part its bus hangs off (None for the root)
+and the cable between them'''
+
+
+def _shareable(value):
+    if isinstance(value, tuple):
+        return all(map(_shareable, value))
+    return isinstance(value, _IMMUTABLE)
+
+
+class Blueprint:
+    '''A compiled copy of a sub-assembly: a component and everything
+    attached below it on its bus.
+
+    stamp builds copies from the template directly. Names are reserved
+    a block per class, buses are wired from the stored parent list
+    instead of attached one by one, and no bus notices are broadcast.
+    '''
+
+    def __init__(self, parts, links=()):
+        self.parts = tuple(parts)
+        # (i, j, cable) redundant links between parts
+        self.links = tuple(links)
+        self._kinds = []
+        kind_numbers = {}
+        # for each part, which class it is and which of that class
+        self._slots = []
+        for part in self.parts:
+            if part.kind not in kind_numbers:
+                kind_numbers[part.kind] = len(self._kinds)
+                self._kinds.append(part.kind)
+            self._slots.append(kind_numbers[part.kind])
+        self._per_copy = [self._slots.count(kind)
+                          for kind in range(len(self._kinds))]
+        self._parents = [part.parent for part in self.parts]
+        self._cables = [part.cable for part in self.parts]
+        self._shared = [all(map(_shareable, part.attributes.values()))
+                        for part in self.parts]
+
+    @classmethod
+    def capture(cls, component):
+        '''Makes a blueprint of component and every component whose bus
+        is below its bus'''
+        order = [component.bus]
+        index = {component.bus: 0}
+        parts, links = [], []
+        for node in order:
+            owner = components.owner_of(node)
+            if owner is None:
+                raise ValueError('{!r} does not belong to a component'
+                                 .format(node))
+            attributes = {k: v for k, v in vars(owner).items()
+                          if not k.startswith('_') and k != 'name'}
+            if node is component.bus:
+                parent, cable = None, None
+            else:
+                parent = index[node.parent]
+                cable = node.cables.get(node.parent)
+            parts.append(Part(type(owner), attributes, parent, cable))
+            for child in node.children:
+                index[child] = len(order)
+                order.append(child)
+        for node in order:
+            for linked in node.links:
+                if linked in index and index[linked] > index[node]:
+                    links.append((index[node], index[linked],
+                                  node.cables.get(linked)))
+        return cls(parts, links)
+
+    def __len__(self):
+        return len(self.parts)
+
+    def stamp(self, count=1, attach_to=None):
+        '''Builds count copies and returns the root component of each.
+        With attach_to, every copy is attached to that bus in one go'''
+        # A big stamp makes enough objects to set off the cyclic garbage
+        # collector many times over, and none of them can be garbage yet
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            roots = self._stamp(count)
+        finally:
+            if collecting:
+                gc.enable()
+        if attach_to is not None:
+            attach_to.attach_many(root.bus for root in roots)
+        return roots
+
+    def _stamp(self, count):
+        '''Does the work of stamp, returning the roots'''
+        letters = []
+        made = []
+        for kind, per_copy in zip(self._kinds, self._per_copy):
+            first = kind._counter
+            kind._counter += per_copy * count
+            letters.append(letterer_range(first, first + per_copy * count))
+            made.append((first, []))
+        templates = [kind.shop_name + '-{}' for kind in self._kinds]
+        roots = []
+        for _ in range(count):
+            copies = []
+            for part, slot, shared in zip(
+                    self.parts, self._slots, self._shared):
+                component = part.kind.__new__(part.kind)
+                attributes = part.attributes if shared \
+                    else copy.deepcopy(part.attributes)
+                vars(component).update(attributes)
+                component.name = templates[slot].format(
+                    next(letters[slot]).upper())
+                made[slot][1].append(component)
+                copies.append(component)
+            buses = bus.Bus.build_tree(
+                [component.name for component in copies],
+                self._parents, self._cables, self.links)
+            for component, component_bus in zip(copies, buses):
+                component._bus = component_bus
+            roots.append(copies[0])
+        for kind, (first, stamped) in zip(self._kinds, made):
+            kind._register(first, stamped)
+        return roots
@@ -1,11 +1,25 @@
 '''Contains the Bus class and related functions'''
 
-from collections import namedtuple
+from collections import Counter, namedtuple
+import heapq
+import itertools
+from operator import itemgetter
 import pathlib
-import uuid
+import threading
 
+from common import new_id
 
-BusMessage = namedtuple('BusMessage', 'topic message sender size')
+
+BusMessage = namedtuple('BusMessage', 'topic message sender size id')
+BusMessage.__doc__ = '''A message on a bus. size is the length of message
+in bytes once encoded as UTF-8, which is what cables carry'''
+
+_message_ids = itertools.count()
+
+# Guards bus topology, subscriptions and the caches derived from them,
+# so buses can be rewired from one thread while others broadcast.
+# Subscribers are always called without holding it.
+_lock = threading.RLock()
 
 
 def basic_subscriber(msg):
@@ -13,9 +27,203 @@ def basic_subscriber(msg):
     print('[{}]@{}:\n\t{}'.format(msg.topic, msg.sender, msg.message))
 
 
-def is_prefix(a, b):
-    '''Returns whether a is a prefix of path b'''
-    return b.as_posix().startswith(a.as_posix())
+def topic_segments(topic):
+    '''Splits a dotted topic into its segments. The empty topic has no
+    segments'''
+    return topic.split('.') if topic else []
+
+
+def topic_prefixes(topic):
+    '''Returns every topic filter that matches topic, from the least to
+    the most specific
+
+    >>> topic_prefixes('guns.all.fire')
+    ['', 'guns', 'guns.all', 'guns.all.fire']
+    '''
+    prefixes = ['']
+    for segment in topic_segments(topic):
+        prefixes.append(
+            prefixes[-1] + '.' + segment if prefixes[-1] else segment)
+    return prefixes
+
+
+class TopicTrie:
+    '''Index of subscribers keyed on dotted topic filters.
+
+    A filter matches a topic when the filter's segments are a prefix of
+    the topic's segments, so 'guns' matches 'guns' and 'guns.all' but
+    not 'gunship'. The empty filter matches every topic. Any number of
+    subscribers can share a filter, and matching a topic only touches
+    one node per segment of the topic.
+    '''
+
+    __slots__ = ('subscribers', 'children')
+
+    def __init__(self):
+        self.subscribers = []
+        self.children = {}
+
+    def add(self, topic_filter, subscriber):
+        '''Adds a subscriber under topic_filter'''
+        node = self
+        for segment in topic_segments(topic_filter):
+            node = node.children.setdefault(segment, TopicTrie())
+        node.subscribers.append(subscriber)
+
+    def remove(self, topic_filter, subscriber):
+        '''Removes a subscriber from topic_filter. Returns whether it
+        was there to remove'''
+        trail = [self]
+        segments = topic_segments(topic_filter)
+        for segment in segments:
+            node = trail[-1].children.get(segment)
+            if node is None:
+                return False
+            trail.append(node)
+        try:
+            trail[-1].subscribers.remove(subscriber)
+        except ValueError:
+            return False
+        # prune nodes that no longer lead to any subscribers
+        for parent, node, segment in zip(
+                reversed(trail[:-1]), reversed(trail), reversed(segments)):
+            if node.subscribers or node.children:
+                break
+            del parent.children[segment]
+        return True
+
+    def get(self, topic_filter):
+        '''Returns the subscribers added under exactly topic_filter'''
+        node = self
+        for segment in topic_segments(topic_filter):
+            node = node.children.get(segment)
+            if node is None:
+                return []
+        return list(node.subscribers)
+
+    def match(self, topic):
+        '''Returns the subscribers whose filter matches topic, from the
+        least to the most specific filter'''
+        node = self
+        matched = list(node.subscribers)
+        for segment in topic_segments(topic):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            matched.extend(node.subscribers)
+        return matched
+
+    def items(self):
+        '''Yields (topic_filter, subscriber) pairs for every
+        subscription in the trie'''
+        stack = [('', self)]
+        while stack:
+            prefix, node = stack.pop()
+            for subscriber in node.subscribers:
+                yield prefix, subscriber
+            for segment, child in node.children.items():
+                stack.append((prefix + '.' + segment if prefix else segment,
+                              child))
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __bool__(self):
+        return bool(self.subscribers or self.children)
+
+
+class _TreeIndex:
+    '''Marks the Euler-tour numbering of one Bus tree as current.
+
+    Every bus in a tree shares the same _TreeIndex once the tree has
+    been numbered. Changing the shape of the tree invalidates it, which
+    makes every bus in the tree stale at once without visiting them.
+    '''
+
+    __slots__ = ('valid',)
+
+    def __init__(self, valid=True):
+        self.valid = valid
+
+
+_STALE = _TreeIndex(valid=False)
+
+# Routing versions are unique across every tree, so a route cached under
+# one tree's version can never look current in another
+_routing_versions = itertools.count()
+
+# How many topics each bus keeps a compiled route for, see _route
+ROUTE_CACHE_SIZE = 1024
+
+
+class _Routing:
+    '''The routing version shared by every bus in one tree. Anything
+    that changes which subscribers a route reaches bumps it, which
+    invalidates the routes cached in that tree and no other'''
+
+    __slots__ = ('version',)
+
+    def __init__(self):
+        self.version = next(_routing_versions)
+
+    def bump(self):
+        self.version = next(_routing_versions)
+
+
+class _BatchSubscriber:
+    '''Wraps a subscriber that wants lists of messages instead of one
+    message per call'''
+
+    __slots__ = ('subscriber',)
+
+    def __init__(self, subscriber):
+        self.subscriber = subscriber
+
+    def __call__(self, msg):
+        self.subscriber([msg])
+
+    def __eq__(self, other):
+        return (isinstance(other, _BatchSubscriber) and
+                other.subscriber == self.subscriber)
+
+    def __hash__(self):
+        return hash(self.subscriber)
+
+
+class Batch:
+    '''Collects broadcasts from one bus and sends them together with
+    Bus.broadcast_many when the with block exits cleanly.
+
+    >>> with Bus('sensor').batch() as batch:
+    ...     batch.broadcast('sensor.heat', '{} K', 300)
+    '''
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.messages = []
+
+    def broadcast(self, topic, fmt, *args, **kwargs):
+        '''Queues a message, formatting it only if someone will
+        receive it'''
+        if self.bus._route(topic):
+            self.messages.append((topic, fmt.format(*args, **kwargs)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.bus.broadcast_many(self.messages)
+        self.messages = []
+
+    # for buses whose broadcast_many is a coroutine, see asyncbus.py
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.bus.broadcast_many(self.messages)
+        self.messages = []
 
 
 class Bus:
@@ -23,20 +231,87 @@ class Bus:
 
     def __init__(self, name):
         self.name = name
-        self.id = uuid.uuid4()
+        self.id = new_id()
         self.parent = None
         self.children = []
-        self.subscribers = {}
+        # attachments that are not part of the tree, see attach
+        self.links = []
+        # the cable used for each attachment that has one, by neighbour
+        self.cables = {}
+        self.subscribers = TopicTrie()
+        # Euler-tour interval, depth and root, see _reindex
+        self._tree = _STALE
+        self._tin = self._tout = self._depth = 0
+        self._root = self
+        # cached path, cleared for a whole subtree when it moves
+        self._path = None
+        # compiled delivery lists by topic and by deepest matching
+        # filter, and the routing version they were compiled under
+        self._routes = {}
+        self._filter_routes = {}
+        self._routes_version = -1
+        self._routing = _Routing()
+        # how many subscriptions use each topic filter anywhere in this
+        # bus's subtree, so routing can skip uninterested subtrees
+        self._subtree_filters = Counter()
+        # how many buses are in this bus's subtree, itself included
+        self._size = 1
 
-    def subscribe(self, topic_filter, subscriber):
+    def subscribe(self, topic_filter, subscriber, batch=False,
+                  dispatcher=None):
         '''Adds a subscriber. Any time a message comes through this
         Bus, if the topic_filter matches the topic, the subscriber
-        will be called with the message'''
-        self.subscribers[topic_filter] = subscriber
+        will be called with the message. Several subscribers may share
+        the same topic_filter.
+
+        With batch=True the subscriber is instead called with a list of
+        messages: everything it should see from one broadcast_many, or
+        a single message from broadcast. The list may be shared with
+        other subscribers, so it must not be modified.
+
+        With a dispatch.Dispatcher, the subscriber runs on one of the
+        dispatcher's worker threads instead of the sender's.
+        '''
+        if dispatcher is not None:
+            subscriber = dispatcher.mailbox(subscriber)
+        if batch:
+            subscriber = _BatchSubscriber(subscriber)
+        with _lock:
+            self.subscribers.add(topic_filter, subscriber)
+            self._update_subtree(0, {topic_filter: 1})
+
+    def unsubscribe(self, topic_filter, subscriber):
+        '''Removes a subscriber added with subscribe. Returns whether
+        it was subscribed'''
+        with _lock:
+            if not (self.subscribers.remove(topic_filter, subscriber) or
+                    self.subscribers.remove(
+                        topic_filter, _BatchSubscriber(subscriber))):
+                return False
+            self._update_subtree(0, {topic_filter: 1}, sign=-1)
+            return True
+
+    def _update_subtree(self, size, filters, sign=1):
+        '''Adds (or with sign=-1 removes) buses and filter counts to the
+        subtree summaries of this bus and all of its ancestors'''
+        if filters:
+            self._routing.bump()
+        node = self
+        while node is not None:
+            node._size += sign * size
+            summary = node._subtree_filters
+            for topic_filter, count in filters.items():
+                count = summary[topic_filter] + sign * count
+                if count:
+                    summary[topic_filter] = count
+                else:
+                    summary.pop(topic_filter, None)
+            node = node.parent
 
     @property
     def child_count(self):
-        return sum(1 + child.child_count for child in self.children)
+        '''Returns how many buses are below this one'''
+        return self._size - 1
 
     @property
     def lineage(self):
@@ -47,93 +322,504 @@ class Bus:
             yield obj.parent
             obj = obj.parent
 
+    @property
+    def root(self):
+        '''Returns the root of the tree this bus is in'''
+        if self._tree.valid:
+            return self._root
+        obj = self
+        while obj.parent:
+            obj = obj.parent
+        return obj
+
+    def _reindex(self):
+        '''Numbers the tree this bus is in with an Euler tour, if its
+        shape changed since it was last numbered. Afterwards a bus
+        contains another exactly when the other's _tin falls within its
+        [_tin, _tout) interval.'''
+        if self._tree.valid:
+            return
+        with _lock:
+            if self._tree.valid:
+                return
+            # only marked valid once numbering is finished, as contains
+            # and depth read it without taking the lock
+            tree = _TreeIndex(valid=False)
+            root = self.root
+            root._depth = 0
+            order = []
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                node._tree = tree
+                node._root = root
+                node._tin = len(order)
+                node._tout = node._tin + 1
+                order.append(node)
+                for child in reversed(node.children):
+                    child._depth = node._depth + 1
+                    stack.append(child)
+            # children come after their parent in the tour, so walking
+            # it backwards closes every subtree before its parent's
+            for node in reversed(order):
+                if node.parent is not None and \
+                        node.parent._tout < node._tout:
+                    node.parent._tout = node._tout
+            tree.valid = True
+
+    def _invalidate(self):
+        '''Marks the tree this bus is in as reshaped'''
+        self._tree.valid = False
+        self._routing.bump()
+
+    def contains(self, other):
+        '''Returns whether other is this bus or one of its
+        descendants'''
+        self._reindex()
+        other._reindex()
+        return (self._tree is other._tree and
+                self._tin <= other._tin < self._tout)
+
+    @property
+    def depth(self):
+        '''Returns how many ancestors this bus has'''
+        self._reindex()
+        return self._depth
+
     @property
     def path(self):
         '''Returns the path of the current bus in the hierarchy'''
-        path = pathlib.PurePosixPath(self.name)
-        for ancestor in self.lineage:
-            path = ancestor.name / path
-        return path
+        path = self._path
+        if path is not None:
+            return path
+        with _lock:
+            # fill in missing paths from the nearest cached ancestor down
+            stale = [self]
+            for ancestor in self.lineage:
+                if ancestor._path is not None:
+                    break
+                stale.append(ancestor)
+            for obj in reversed(stale):
+                if obj.parent is None:
+                    obj._path = pathlib.PurePosixPath(obj.name)
+                else:
+                    obj._path = obj.parent._path / obj.name
+            return self._path
 
-    def _push(self, msg):
-        '''Rebroadcast to parents and children and notify any
-        interested subscribers. This method is called by others.
+    def _moved(self, routing):
+        '''Forgets the cached paths of this bus and everything below it,
+        which are the only paths that change when it gets a new parent
+        or loses its old one, and makes them share the routing version
+        of the tree they are now in'''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._path = None
+            node._routing = routing
+            stack.extend(node.children)
 
-        Rules:
-        1. Only send to a parent if you're a prefix of the sender
-        2. Only send to children who are not a prefix of the sender
+    def _compile_route(self, topic):
+        '''Walks the tree outward from this bus and returns every
+        subscriber interested in topic, in delivery order.
 
+        A message is delivered to the sender's own subscribers first,
+        then down each child's subtree in turn, then to the parent,
+        which repeats the process with its other children and its own
+        parent. Every bus is visited at most once, and subtrees whose
+        filter summary shows no interest in topic are skipped.
         '''
-        #send to subscribers
-        for topic_filter, subscriber in self.subscribers.items():
-            if msg.topic.startswith(topic_filter):
-                subscriber(msg)
+        prefixes = topic_prefixes(topic)
+        everywhere = self.root._subtree_filters
+        if not any(everywhere[p] for p in prefixes):
+            return ()
+        route = []
+        stack = [(self, None)]
+        while stack:
+            node, came_from = stack.pop()
+            route.extend(node.subscribers.match(topic))
+            # pushed in reverse so children are walked before the parent
+            hops = node._hops(came_from, prefixes, everywhere)
+            stack.extend(zip(reversed(hops), itertools.repeat(node)))
+        return tuple(route)
+
+    def _hops(self, came_from, prefixes, everywhere):
+        '''Returns the buses a message that reached this bus from
+        came_from should be passed on to: interested children in order,
+        then the parent if anyone outside this subtree is interested.
 
-        # broadcast to children
-        for child in self.children:
-            if not is_prefix(child.path, msg.sender):
-                child._push(msg)
+        prefixes are the topic's prefixes, and everywhere is the filter
+        summary of the root of the tree.
+        '''
+        hops = []
+        below = self._subtree_filters
+        if any(below[p] for p in prefixes):
+            for child in self.children:
+                if child is came_from:
+                    continue
+                if any(child._subtree_filters[p] for p in prefixes):
+                    hops.append(child)
+        parent = self.parent
+        if parent is not None and parent is not came_from and \
+                any(everywhere[p] > below[p] for p in prefixes):
+            hops.append(parent)
+        return hops
 
-        # broadcast to parents
-        if self.parent is not None and is_prefix(self.path, msg.sender):
-            self.parent._push(msg)
+    def _route(self, topic):
+        '''Returns the cached delivery list for messages this bus sends
+        on topic, compiling it if the topology or subscriptions of its
+        tree have changed since it was cached.
+
+        Topics that match the same filters get the same route, so routes
+        are compiled once per deepest matching filter. Only the last
+        ROUTE_CACHE_SIZE topics are remembered on top of that, so
+        endless distinct topics can't fill memory.
+        '''
+        if self._routes_version == self._routing.version:
+            route = self._routes.get(topic)
+            if route is not None:
+                return route
+        with _lock:
+            if self._routes_version != self._routing.version:
+                self._routes = {}
+                self._filter_routes = {}
+                self._routes_version = self._routing.version
+            route = self._routes.get(topic)
+            if route is not None:
+                return route
+            everywhere = self.root._subtree_filters
+            deepest = None
+            for prefix in topic_prefixes(topic):
+                if everywhere[prefix]:
+                    deepest = prefix
+            if deepest is None:
+                route = ()
+            else:
+                route = self._filter_routes.get(deepest)
+                if route is None:
+                    route = self._filter_routes[deepest] = \
+                        self._compile_route(deepest)
+            routes = self._routes
+            if len(routes) >= ROUTE_CACHE_SIZE:
+                # the oldest topic goes first
+                del routes[next(iter(routes))]
+            routes[topic] = route
+            return route
 
     def broadcast(self, topic, fmt, *args, **kwargs):
+        '''Sends a message on topic to every interested subscriber in
+        the tree. The message is only formatted if someone will
+        receive it'''
+        route = self._route(topic)
+        if not route:
+            return
         msg = fmt.format(*args, **kwargs)
-        bus_msg = BusMessage(topic, msg, self.path, size=0)
-        self._push(bus_msg)
+        bus_msg = BusMessage(
+            topic, msg, self.path, size=len(msg.encode('utf-8')),
+            id=next(_message_ids))
+        for subscriber in route:
+            subscriber(bus_msg)
+
+    def broadcast_many(self, messages):
+        '''Sends already formatted (topic, message) pairs in one go.
+
+        Each subscriber sees its messages in the order given. Batch
+        subscribers get them all in a single call, others get one call
+        per message.
+        '''
+        for subscriber, msgs in self._deliveries(messages):
+            if type(subscriber) is _BatchSubscriber:
+                subscriber.subscriber(msgs)
+            else:
+                for bus_msg in msgs:
+                    subscriber(bus_msg)
+
+    def _deliveries(self, messages):
+        '''Routes (topic, message) pairs, returning (subscriber,
+        messages) pairs in delivery order'''
+        # group messages by topic first, which is one dict lookup per
+        # message rather than one per message per subscriber
+        by_topic = {}
+        sender = self.path
+        for position, (topic, message) in enumerate(messages):
+            try:
+                group = by_topic[topic]
+            except KeyError:
+                route = self._route(topic)
+                group = by_topic[topic] = (route, [], []) if route else None
+            if group is not None:
+                group[1].append(BusMessage(
+                    topic, message, sender, len(message.encode('utf-8')),
+                    next(_message_ids)))
+                group[2].append(position)
+        by_route = [group for group in by_topic.values() if group]
+        if len(by_route) == 1:
+            (route, msgs, _), = by_route
+            return [(subscriber, msgs) for subscriber in route]
+        return self._merge_routes(by_route)
+
+    @staticmethod
+    def _merge_routes(routed):
+        '''Turns (route, messages, positions) groups into (subscriber,
+        messages) pairs, merging the groups of subscribers that are on
+        several routes back into sending order'''
+        order = {}
+        for route, msgs, positions in routed:
+            for subscriber in route:
+                try:
+                    order[id(subscriber)][1].append((msgs, positions))
+                except KeyError:
+                    order[id(subscriber)] = (subscriber, [(msgs, positions)])
+        pending = []
+        merges = {}  # subscribers on the same routes share one merge
+        for subscriber, groups in order.values():
+            if len(groups) == 1:
+                pending.append((subscriber, groups[0][0]))
+                continue
+            key = tuple(id(msgs) for msgs, _ in groups)
+            if key not in merges:
+                merged = heapq.merge(
+                    *(zip(positions, msgs) for msgs, positions in groups),
+                    key=itemgetter(0))
+                merges[key] = [msg for _, msg in merged]
+            pending.append((subscriber, merges[key]))
+        return pending
+
+    def batch(self):
+        '''Returns a Batch that collects broadcasts from this bus until
+        its with block exits'''
+        return Batch(self)
 
     def add_child(self, child):
-        self.children.append(child)
-        child.parent = self
+        with _lock:
+            self._invalidate()
+            child._invalidate()
+            self.children.append(child)
+            child.parent = self
+            child._moved(self._routing)
+            self._update_subtree(child._size, child._subtree_filters)
 
     def remove_child(self, child):
-        self.children.remove(child)
-        child.parent = None
+        with _lock:
+            self._invalidate()
+            self.children.remove(child)
+            child.parent = None
+            child._moved(_Routing())
+            self._update_subtree(
+                child._size, child._subtree_filters, sign=-1)
+
+    def _notify(self, notices):
+        '''Broadcasts (topic, fmt, *args) notices collected while the
+        topology lock was held'''
+        for topic, fmt, *args in notices:
+            self.broadcast(topic, fmt, *args)
+
+    def _evert(self):
+        '''Re-roots the tree this bus is in so that this bus becomes
+        its root, by reversing the parent links between it and the old
+        root. The paths cached in the tree are left for add_child to
+        clear, which always follows'''
+        path = [self, *self.lineage]
+        if len(path) == 1:
+            return
+        self._invalidate()
+        # after re-rooting, each bus on the path owns the whole tree
+        # except what used to be below the previous bus on the path
+        total = path[-1]._subtree_filters
+        summaries = [Counter(total)]
+        summaries.extend(total - below._subtree_filters for below in path)
+        total_size = path[-1]._size
+        sizes = [total_size]
+        sizes.extend(total_size - below._size for below in path)
+        for node, summary, size in zip(path, summaries, sizes):
+            node._subtree_filters = summary
+            node._size = size
+        for child, parent in zip(path, path[1:]):
+            parent.children.remove(child)
+            child.children.append(parent)
+            parent.parent = child
+        self.parent = None
 
-    def attach(self, other):
+    @property
+    def neighbours(self):
+        '''Returns every bus directly attached to this one, whether as
+        parent, child or redundant link'''
+        parent = [self.parent] if self.parent is not None else []
+        return parent + self.children + self.links
+
+    def attach(self, other, cable=None):
         '''Attach two buses. Will decide who is the parent and who is
-        the child'''
+        the child. The cable, if any, describes the physical link and
+        is kept in both buses' cables; see cables.py.
+
+        If the buses are already connected through other buses, the new
+        attachment becomes a redundant link: messages keep following
+        the existing tree, and the link takes over if the tree is cut
+        somewhere it can bridge.
+        '''
+        with _lock:
+            notices = self._attach(other, cable)
+        self._notify(notices)
+
+    def _attach(self, other, cable=None):
+        '''Does the work of attach, returning the notices to send'''
         parent = self
         child = other
-        if self.parent and other.parent:
-            msg = '{} Unable to attach to {}, both already have parents'
-            self.broadcast('bus.error', msg.format(self, other))
-            other.broadcast('bus.error', msg.format(other, self))
-            return
-        elif self in other.lineage or other in self.lineage:
+        notices = []
+        if other is self or other in self.neighbours:
             msg = '{} and {} are already attached.'
-            self.broadcast('bus.error', msg.format(self, other))
-            return
+            return [('bus.error', msg.format(self, other))]
+        elif self.root is other.root:
+            self.links.append(other)
+            other.links.append(self)
+            self._wire(other, cable)
+            return [('bus.info', '{} is now redundantly linked to {}',
+                     self, other)]
         elif not self.parent and not other.parent:
             if self.child_count < other.child_count:
                 parent, child = child, parent
-            self.broadcast(
+            notices.append((
                 'bus.debug',
-                'Root {} has more children than root {}', parent, child)
+                'Root {} has more children than root {}', parent, child))
         elif not other.parent:
-            self.broadcast('bus.debug', '{} has no parent', other)
+            notices.append(('bus.debug', '{} has no parent', other))
         elif not self.parent:
             parent, child = child, parent
-            self.broadcast('bus.debug', '{} has no parent', self)
+            notices.append(('bus.debug', '{} has no parent', self))
         else:
-            self.broadcast('bus.error', "This shouldn't happen!")
+            # both are inside trees: re-root the smaller tree at its end
+            # of the attachment so it can hang off the other one
+            if self.root.child_count > other.root.child_count:
+                other._evert()
+            else:
+                parent, child = child, parent
+                self._evert()
+            notices.append(('bus.debug', '{} is now a root', child))
 
         parent.add_child(child)
-        self.broadcast(
-            'bus.info', '{} is now a child of {}', child, parent)
+        self._wire(other, cable)
+        notices.append(('bus.info', '{} is now a child of {}', child, parent))
+        return notices
+
+    def attach_many(self, others, cable=None):
+        '''Attaches many buses to this one, all with the same cable.
+        Buses that are the roots of their own trees all become children
+        of this bus in a single pass, with one summary update for the
+        whole batch. Anything else is attached one at a time with
+        attach.'''
+        notices = []
+        with _lock:
+            root = self.root
+            roots, rest, seen = [], [], set()
+            for other in others:
+                if other.parent is None and other is not root and \
+                        other not in seen:
+                    roots.append(other)
+                    seen.add(other)
+                else:
+                    rest.append(other)
+            if roots:
+                self._invalidate()
+                size, filters = 0, Counter()
+                for child in roots:
+                    child._invalidate()
+                    child.parent = self
+                    child._moved(self._routing)
+                    self._wire(child, cable)
+                    size += child._size
+                    filters.update(child._subtree_filters)
+                self.children.extend(roots)
+                self._update_subtree(size, filters)
+                notices.append(('bus.info', '{} buses are now children of {}',
+                                len(roots), self))
+            for other in rest:
+                notices.extend(self._attach(other, cable))
+        self._notify(notices)
+
+    @classmethod
+    def build_tree(cls, names, parents, cables=None, links=()):
+        '''Makes a new tree of buses in one pass, without attach or its
+        notices. parents[i] is the index of the parent of the bus named
+        names[i], or None for the root, and must be less than i.
+        cables[i], if given, is the cable between bus i and its parent,
+        and links are (i, j, cable) redundant links. Returns the buses in
+        the same order as names'''
+        buses = [cls(name) for name in names]
+        for bus, parent in zip(buses, parents):
+            if parent is not None:
+                buses[parent].children.append(bus)
+                bus.parent = buses[parent]
+                bus._routing = bus.parent._routing
+        # parents come before their children, so walking backwards
+        # finishes each subtree's size before its parent's is needed
+        for bus, parent in zip(reversed(buses), reversed(parents)):
+            if parent is not None:
+                buses[parent]._size += bus._size
+        if cables is not None:
+            for bus, parent, cable in zip(buses, parents, cables):
+                if cable is not None:
+                    bus._wire(buses[parent], cable)
+        for i, j, cable in links:
+            buses[i].links.append(buses[j])
+            buses[j].links.append(buses[i])
+            if cable is not None:
+                buses[i]._wire(buses[j], cable)
+        return buses
 
     def detach(self, other):
-        '''Detach this Bus from its parent'''
-        if other is self.parent:
-            other.remove_child(self)
-        elif other in self.children:
-            self.remove_child(other)
+        '''Detach this Bus from another it is attached to. If a
+        redundant link bridges the cut, it is promoted into the tree so
+        that both sides stay connected'''
+        with _lock:
+            if other in self.links:
+                self.links.remove(other)
+                other.links.remove(self)
+                self._wire(other, None)
+                return
+            elif other is self.parent:
+                other.remove_child(self)
+                self._wire(other, None)
+                notices = other._heal(self)
+            elif other in self.children:
+                self.remove_child(other)
+                self._wire(other, None)
+                notices = self._heal(other)
+            else:
+                notices = [(
+                    'error.bus',
+                    'Unable to detach {.name} and {.name}: neither is a '
+                    'parent of the other'.format(self, other))]
+        self._notify(notices)
+
+    def _wire(self, other, cable):
+        '''Records the cable between this bus and other, or forgets it
+        if cable is None'''
+        if cable is None:
+            self.cables.pop(other, None)
+            other.cables.pop(self, None)
         else:
-            self.broadcast(
-                'error.bus',
-                'Unable to detach {.name} and {.name}: neither is a parent of '
-                'the other'.format(self, other))
+            self.cables[other] = other.cables[self] = cable
+
+    def _heal(self, child):
+        '''Looks for a redundant link between the subtree of a bus just
+        detached from this one and the rest of the tree, and if there is
+        one, attaches through it instead. Returns the notices to send'''
+        subtree = []
+        stack = [child]
+        while stack:
+            node = stack.pop()
+            subtree.append(node)
+            stack.extend(node.children)
+        below = set(subtree)
+        for node in subtree:
+            for linked in node.links:
+                if linked not in below:
+                    node.links.remove(linked)
+                    linked.links.remove(node)
+                    node._evert()
+                    linked.add_child(node)
+                    return [('bus.info', '{} is now rerouted through {}',
+                             child, linked)]
+        return []
 
     def __repr__(self):
         return 'Bus({.path})'.format(self)
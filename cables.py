@@ -0,0 +1,214 @@
+'''Simulates messages crossing bandwidth-limited cables between Buses'''
+
+from collections import namedtuple
+import heapq
+import itertools
+
+from bus import Bus, BusMessage, _message_ids, topic_prefixes
+
+
+Cable = namedtuple('Cable', 'bandwidth latency buffer burst')
+Cable.__new__.__defaults__ = (None, 0)
+Cable.__doc__ = '''A physical link between two buses.
+
+bandwidth is in bytes per simulated second and latency in seconds.
+buffer is how many bytes may be waiting ahead of a message before it
+is dropped instead (None for no limit), and burst is how many bytes
+can go out at once before the bandwidth limit applies.
+'''
+
+# Used for attachments made without a cable
+UNLIMITED = Cable(bandwidth=float('inf'), latency=0)
+
+# How many plans a CableSimulator remembers, see CableSimulator._plan
+PLAN_CACHE_SIZE = 65536
+# How many links a CableSimulator holds before sweeping out those whose
+# buses are no longer attached
+LINK_SWEEP_SIZE = 4096
+
+
+class _Link:
+    '''One direction of a cable, rate limited with a token bucket.
+
+    The bucket is kept as the time it will next be full (the generic
+    cell rate algorithm), so a message costs a few arithmetic operations
+    and no per-message queue entries.
+    '''
+
+    __slots__ = ('cable', 'full_at', 'sent', 'dropped', 'delayed', 'waited')
+
+    def __init__(self, cable):
+        self.cable = cable
+        self.full_at = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.delayed = 0
+        # how long the last message sent had to wait for the bucket
+        self.waited = 0.0
+
+    def transmit(self, now, size):
+        '''Returns when a message of size bytes offered at now arrives
+        at the far end, or None if the cable's buffer is full. waited is
+        set to how long it queues behind the burst before going out'''
+        cable = self.cable
+        bandwidth = cable.bandwidth
+        full_at = self.full_at if self.full_at > now else now
+        # the message can start once the bucket has room for it
+        start = full_at - cable.burst / bandwidth
+        if start <= now:
+            start = now
+        elif cable.buffer is not None and \
+                (start - now) * bandwidth > cable.buffer:
+            self.dropped += 1
+            return None
+        else:
+            # it goes out later, behind what the burst let through
+            self.delayed += 1
+        self.waited = start - now
+        self.full_at = full_at + size / bandwidth
+        self.sent += 1
+        return start + size / bandwidth + cable.latency
+
+
+def _remember(plans, key, cached, entry):
+    '''Stores entry under key, making room first if key is new and
+    plans is full. The oldest plan goes first'''
+    if cached is None and len(plans) >= PLAN_CACHE_SIZE:
+        del plans[next(iter(plans))]
+    plans[key] = entry
+
+
+class CableSimulator:
+    '''A discrete-event simulation of broadcasts crossing cables.
+
+    Messages hop from bus to bus along the same routes Bus.broadcast
+    uses, but every hop goes through the cable between the two buses.
+    Subscribers are called when the message arrives, at which point
+    now is the simulated time. Messages that have to queue behind a
+    cable's burst are delayed, and messages that don't fit in its
+    buffer are dropped; either way the bus that sent them broadcasts on
+    bus.overload.
+    '''
+
+    def __init__(self, default_cable=UNLIMITED):
+        self.default_cable = default_cable
+        self.now = 0.0
+        self.delivered = 0
+        self.dropped = 0
+        self.delayed = 0
+        self._events = []
+        self._seq = itertools.count()
+        self._links = {}
+        self._sweep_at = LINK_SWEEP_SIZE
+        # the routing version, subscribers and next hops by
+        # (bus, came_from, topic) and (bus, came_from, deepest filter)
+        self._plans = {}
+        self._filter_plans = {}
+
+    def send(self, bus, topic, message, at=None):
+        '''Schedules bus to broadcast message on topic at a simulated
+        time (default: now)'''
+        at = self.now if at is None else at
+        msg = BusMessage(topic, message, bus.path,
+                         len(message.encode('utf-8')),
+                         next(_message_ids))
+        heapq.heappush(self._events, (at, next(self._seq), bus, None, msg))
+
+    def __len__(self):
+        '''Returns how many messages are in flight'''
+        return len(self._events)
+
+    def link(self, source, target):
+        '''Returns the _Link carrying messages from source to target'''
+        key = (source, target)
+        cable = source.cables.get(target, self.default_cable)
+        link = self._links.get(key)
+        if link is None or link.cable is not cable:
+            if link is None and len(self._links) >= self._sweep_at:
+                self._sweep()
+            link = self._links[key] = _Link(cable)
+        return link
+
+    def _sweep(self):
+        '''Forgets the links between buses that are no longer attached,
+        and puts off the next sweep until there are twice as many'''
+        self._links = {(source, target): link
+                       for (source, target), link in self._links.items()
+                       if target in source.neighbours}
+        self._sweep_at = max(LINK_SWEEP_SIZE, 2 * len(self._links))
+
+    def _plan(self, bus, came_from, topic):
+        '''Returns the subscribers of bus that want topic and the links
+        a message on topic that came from came_from continues over.
+
+        Like Bus._route, topics that match the same filters share a
+        plan, made once for the deepest filter anywhere in the tree that
+        matches them. Only the last PLAN_CACHE_SIZE topics, and plans,
+        are remembered, so endless distinct topics can't fill memory.
+        '''
+        key = (bus, came_from, topic)
+        version = bus._routing.version
+        plans = self._plans
+        cached = plans.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        everywhere = bus.root._subtree_filters
+        deepest = None
+        for prefix in topic_prefixes(topic):
+            if everywhere[prefix]:
+                deepest = prefix
+        if deepest is None:
+            plan = (), ()
+        else:
+            plan = self._filter_plan(bus, came_from, deepest, version)
+        _remember(plans, key, cached, (version, plan))
+        return plan
+
+    def _filter_plan(self, bus, came_from, deepest, version):
+        '''Returns the plan for every topic whose deepest matching
+        filter is deepest'''
+        key = (bus, came_from, deepest)
+        plans = self._filter_plans
+        cached = plans.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        hops = bus._hops(came_from, topic_prefixes(deepest),
+                         bus.root._subtree_filters)
+        plan = (tuple(bus.subscribers.match(deepest)),
+                tuple((hop, self.link(bus, hop)) for hop in hops))
+        _remember(plans, key, cached, (version, plan))
+        return plan
+
+    def run(self, until=None):
+        '''Processes events in time order until there are none left or
+        the next one is after until. Returns how many were processed'''
+        events = self._events
+        heappop, heappush = heapq.heappop, heapq.heappush
+        seq = self._seq
+        processed = 0
+        while events and (until is None or events[0][0] <= until):
+            self.now, _, bus, came_from, msg = heappop(events)
+            processed += 1
+            subscribers, hops = self._plan(bus, came_from, msg.topic)
+            for subscriber in subscribers:
+                subscriber(msg)
+            self.delivered += len(subscribers)
+            for hop, link in hops:
+                arrival = link.transmit(self.now, msg.size)
+                if arrival is None:
+                    self.dropped += 1
+                    # sent straight away rather than over the cables
+                    Bus.broadcast(
+                        bus, 'bus.overload', 'Cable to {} is full, dropped {} '
+                        'bytes on {}', hop, msg.size, msg.topic)
+                    continue
+                if link.waited:
+                    self.delayed += 1
+                    Bus.broadcast(
+                        bus, 'bus.overload', 'Cable to {} is congested, {} '
+                        'bytes on {} wait {:.3g}s', hop, msg.size, msg.topic,
+                        link.waited)
+                heappush(events, (arrival, next(seq), hop, bus, msg))
+        if until is not None and until > self.now:
+            self.now = until
+        return processed
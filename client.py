@@ -1,40 +1,298 @@
 __author__ = 'xXxH3LIOSxXx'
 
+import argparse
+import asyncio
+import json
+import random
 import socket
+import time
 
-# Create a TCP/IP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+import protocol
 
-# Connect the socket to the port where the server is listening
-server_address = ('localhost', 6969)
-print('\nConnecting to SpaceShip build server at %s on port %s' % server_address)
-sock.connect(server_address)
+# What simulated players send by default, as (command, weight) pairs
+DEFAULT_MIX = (('inv', 5), ('buy Hull', 2), ('broadcast ship.hail hello', 2),
+               ('subscribe ship', 1))
 
-# Need to add try for this later
-print("Connection successful!"
-      "\nEnter \"/q\" to quit")
 
-# Checking buffer for any motd's
-welcome = sock.recv(4096)
-print('%s' % welcome.decode("utf-8"))
+class FramedClient:
+    '''A blocking connection to a server speaking the framed protocol.
 
-while True:
+    send queues a request and flush sends everything queued at once, so
+    many requests can be in flight before the first response is read.
+    Responses come back in the order the requests were sent.
+    '''
 
-    # Prompt user, accept input, send to socket
-    message = bytes(input('>> '), 'UTF-8')
-    sock.send(message)
+    def __init__(self, host='localhost', port=6969):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = protocol.FrameReader(self.sock)
+        self.writer = protocol.FrameWriter(self.sock)
+        welcome = self.reader.read()
+        self.motd = welcome.payload.decode('utf-8') if welcome else ''
 
-    # If the user inputs the escape sequence /q the socket closes cleanly
-    cmd = message.decode("utf-8")
-    cmd = cmd[:2]
-    #print('%s' % cmd)
+    def send(self, text):
+        '''Queues a line of text'''
+        self.writer.write_text(text)
 
-    if cmd == '/q':
-        print("\nWe're quitting Bob.")
-        break
-    data = sock.recv(4096)
-    print('<others> %s' % data.decode("utf-8"))
+    def send_message(self, msg):
+        '''Queues a BusMessage'''
+        self.writer.write_message(msg)
 
-print('\nClosing connection...')
-sock.close()
-print('Connection closed!')
+    def flush(self):
+        self.writer.flush()
+
+    def receive(self):
+        '''Returns the next response Frame, or None once the server has
+        closed the connection'''
+        return self.reader.read()
+
+    def request(self, text):
+        '''Sends one line and waits for its response'''
+        self.send(text)
+        self.flush()
+        return self.receive()
+
+    def pipeline(self, texts):
+        '''Sends every line in one go, then returns their responses'''
+        for text in texts:
+            self.send(text)
+        self.flush()
+        return [self.receive() for _ in texts]
+
+    def close(self):
+        self.writer.write_text('/q')
+        try:
+            self.writer.flush()
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def parse_mix(text):
+    '''Turns "inv=5,buy Hull=2" into (command, weight) pairs. A
+    command without a weight gets 1'''
+    mix = []
+    for item in text.split(','):
+        command, _, weight = item.rpartition('=')
+        if not command:
+            command, weight = weight, '1'
+        mix.append((command.strip(), float(weight)))
+    return tuple(mix)
+
+
+def percentile(ordered, fraction):
+    '''Returns the value below which fraction of a sorted list lies'''
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoadStats:
+    '''What the simulated players saw'''
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.connected = 0
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def summary(self, elapsed, rate=None):
+        '''Returns a dict that json.dumps can write out. Latencies are
+        in milliseconds'''
+        ordered = sorted(self.latencies)
+        latency = {name: None if value is None else round(value * 1000, 3)
+                   for name, value in (
+                       ('p50', percentile(ordered, 0.5)),
+                       ('p99', percentile(ordered, 0.99)),
+                       ('p999', percentile(ordered, 0.999)),
+                       ('max', ordered[-1] if ordered else None))}
+        return {
+            'players': self.connected,
+            'seconds': round(elapsed, 3),
+            'requests': len(ordered),
+            'target_rate': rate,
+            'throughput': round(len(ordered) / elapsed, 1) if elapsed else 0,
+            'latency_ms': latency,
+            'errors': dict(self.errors),
+            'error_count': sum(self.errors.values()),
+        }
+
+
+async def _player(host, port, commands, interval, deadline, timeout, stats,
+                  rng):
+    '''One simulated player: sends a command every interval seconds
+    until deadline, waiting for each response before the next. A player
+    that falls behind sends straight away until it catches up, but
+    still stops at the deadline.
+
+    Latency is measured from when a request was due rather than when it
+    went out, so a server that falls behind can't hide it by slowing
+    the players down.
+    '''
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout)
+        await asyncio.wait_for(protocol.read_frame(reader), timeout)
+    except (OSError, asyncio.TimeoutError, protocol.ProtocolError):
+        stats.error('connect')
+        return
+    stats.connected += 1
+    commands, weights = zip(*commands)
+    loop = asyncio.get_running_loop()
+    # spread the players out over the first interval
+    due = loop.time() + rng.random() * interval
+    try:
+        while due < deadline and loop.time() < deadline:
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            command = rng.choices(commands, weights)[0]
+            protocol.write_frame(writer, protocol.TEXT,
+                                 command.encode('utf-8'))
+            try:
+                frame = await asyncio.wait_for(
+                    protocol.read_frame(reader), timeout)
+            except asyncio.TimeoutError:
+                stats.error('timeout')
+                return
+            if frame is None:
+                stats.error('closed')
+                return
+            if frame.type == protocol.ERROR:
+                stats.error('error_frame')
+            else:
+                stats.latencies.append(loop.time() - due)
+            due += interval
+    except (OSError, protocol.ProtocolError):
+        stats.error('connection')
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def generate_load(host='localhost', port=6969, players=100, rate=1000,
+                        duration=10, mix=DEFAULT_MIX, timeout=5, seed=None):
+    '''Runs players concurrent framed-protocol players against a server
+    for duration seconds, sending rate requests per second between
+    them, and returns LoadStats.summary'''
+    rng = random.Random(seed)
+    stats = LoadStats()
+    interval = players / rate
+    start = time.perf_counter()
+    deadline = asyncio.get_running_loop().time() + duration
+    await asyncio.gather(*(
+        _player(host, port, mix, interval, deadline, timeout, stats,
+                random.Random(rng.random()))
+        for _ in range(players)))
+    return stats.summary(time.perf_counter() - start, rate)
+
+
+def raw_session(server_address):
+    '''The original unframed REPL'''
+    # Create a TCP/IP socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    # Connect the socket to the port where the server is listening
+    print('\nConnecting to SpaceShip build server at %s on port %s'
+          % server_address)
+    sock.connect(server_address)
+
+    # Need to add try for this later
+    print("Connection successful!"
+          "\nEnter \"/q\" to quit")
+
+    # Checking buffer for any motd's
+    welcome = sock.recv(4096)
+    print('%s' % welcome.decode("utf-8"))
+
+    while True:
+
+        # Prompt user, accept input, send to socket
+        message = bytes(input('>> '), 'UTF-8')
+        sock.send(message)
+
+        # If the user inputs the escape sequence /q the socket closes
+        # cleanly
+        cmd = message.decode("utf-8")
+        cmd = cmd[:2]
+
+        if cmd == '/q':
+            print("\nWe're quitting Bob.")
+            break
+        data = sock.recv(4096)
+        if not data:
+            print('\nThe server closed the connection.')
+            break
+        print('<others> %s' % data.decode("utf-8"))
+
+    print('\nClosing connection...')
+    sock.close()
+    print('Connection closed!')
+
+
+def framed_session(server_address):
+    '''The REPL over the framed protocol'''
+    print('\nConnecting to SpaceShip build server at %s on port %s'
+          % server_address)
+    with FramedClient(*server_address) as client:
+        print("Connection successful!"
+              "\nEnter \"/q\" to quit")
+        print(client.motd)
+        while True:
+            line = input('>> ')
+            if line[:2] == '/q':
+                print("\nWe're quitting Bob.")
+                break
+            frame = client.request(line)
+            if frame is None:
+                print('\nThe server closed the connection.')
+                break
+            print('<others> %s' % frame.payload.decode("utf-8"))
+    print('Connection closed!')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SpaceShip build client')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6969)
+    parser.add_argument('--framed', action='store_true',
+                        help='speak the framed protocol in protocol.py')
+    load = parser.add_argument_group(
+        'load generator', 'simulate many players against a framed server '
+        'and print a JSON summary')
+    load.add_argument('--load', type=int, metavar='PLAYERS',
+                      help='how many players to simulate')
+    load.add_argument('--rate', type=float, default=1000,
+                      help='requests per second from all players together')
+    load.add_argument('--duration', type=float, default=10,
+                      help='seconds to run for')
+    load.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                      help='commands to send and their weights, like '
+                      '"inv=5,buy Hull=2"')
+    load.add_argument('--timeout', type=float, default=5,
+                      help='seconds to wait for a response')
+    load.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    if args.load:
+        summary = asyncio.run(generate_load(
+            args.host, args.port, args.load, args.rate, args.duration,
+            args.mix, args.timeout, args.seed))
+        print(json.dumps(summary, indent=2))
+        return
+    session = framed_session if args.framed else raw_session
+    session((args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,86 @@
 
 import sys
 import cmd
+import contextlib
+import io
+import re
 import shlex
-import spaceship
 import random
+import time
+from collections import defaultdict
 from inventory import Inventory
-from components import Bus
+from bus import Bus, basic_subscriber
 from shop import Shop
 
 
+class ScriptError(Exception):
+    '''A command in a script failed. The original exception is the
+    __cause__'''
+
+    def __init__(self, line_number, line):
+        super().__init__('line {}: {}'.format(line_number, line))
+        self.line_number = line_number
+        self.line = line
+
+
 class SpaceshipCommand(cmd.Cmd):
     intro = 'Welcome to Spaceship Build'
     prompt = '> '
 
-    def __init__(self):
+    def __init__(self, name='spaceship-terminal', quiet=False):
+        self.name = name
+        # quiet leaves out the message for every successful action
+        self.quiet = quiet
         self.bus = Bus('root')
         self.inventory = Inventory()
         self.shop = Shop()
         super().__init__()
+
+    def report(self, *args):
+        '''Prints the result of a successful action, unless quiet'''
+        if not self.quiet:
+            print(*args)
+
+    def run_script(self, lines):
+        '''Runs commands one per line, without the interactive loop.
+        Blank lines and lines starting with # are skipped, and an exit
+        command stops the script. A command that raises stops it with a
+        ScriptError. Returns, for each command, how many times it ran and
+        the total seconds it took'''
+        timings = defaultdict(lambda: [0, 0.0])
+        clock = time.perf_counter
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            command = self.parseline(line)[0] or line
+            start = clock()
+            try:
+                stop = self.onecmd(line)
+            except Exception as e:
+                raise ScriptError(line_number, line) from e
+            timing = timings[command]
+            timing[0] += 1
+            timing[1] += clock() - start
+            if stop:
+                break
+        return dict(timings)
+
+    def run_batch(self, lines, out=sys.stdout):
+        '''Runs a script with everything it prints collected and written
+        to out in one go at the end, even if a command fails. Returns
+        the timings from run_script'''
+        buffer = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buffer):
+                return self.run_script(lines)
+        finally:
+            out.write(buffer.getvalue())
+            out.flush()
         
     def do_exit(self, _):
         '''Exits the game'''
-        print(random.choice([
+        self.report(random.choice([
             'So long!',
             'Toodles!',
             'Sayonara!',
@@ -55,20 +114,34 @@ class SpaceshipCommand(cmd.Cmd):
         topic, message, *_ = shlex.split(arg)
         self.bus.broadcast(topic, message)
 
-    def do_buy(self, type_name):
+    def do_buy(self, arg):
         '''This purchases an item from the shop and puts it into the
-        player's inventory
+        player's inventory. Add xN to buy N of them at once.
 
         > buy raygun
-        Raygun-001 purchased and added to inventory.
+        raygun-A purchased and added to inventory.
+        > buy raygun x3
+        raygun-B to raygun-D purchased and added to inventory.
         '''
-        item = self.shop.buy(type_name)
-        if item is None:
+        match = re.fullmatch(r'\s*(\S+)(?:\s+x(\d+))?\s*', arg)
+        if match is None:
+            print("Usage: buy <item> [xN]")
+            return
+        type_name, count = match.group(1), int(match.group(2) or 1)
+        if count < 1:
+            print("Can't buy fewer than one {!r}.".format(type_name))
+            return
+        items = self.shop.buy_many(type_name, count)
+        if items is None:
             print("Can't buy {!r} there's nothing like that."
                   .format(type_name))
         else:
-            self.inventory.store(item)
-            print(item, "purchased and added to inventory.")
+            self.inventory.store_many(items)
+            if count == 1:
+                self.report(items[0], "purchased and added to inventory.")
+            else:
+                self.report(items[0], "to", items[-1],
+                            "purchased and added to inventory.")
        
         
     def do_subscribe(self, topic_key=''):
@@ -80,7 +153,7 @@ class SpaceshipCommand(cmd.Cmd):
         > subscribe guns
         > subscribe
         '''
-        self.bus.subscribe(topic_key, spaceship.basic_subscriber)
+        self.bus.subscribe(topic_key, basic_subscriber)
 
     def do_inv(self, verbose):
         ''' Prints full inventory'''
@@ -88,3 +161,43 @@ class SpaceshipCommand(cmd.Cmd):
             print(self.inventory.contents())
         else:
             print(self.inventory.summary_contents())
+
+    def do_test(self, arg):
+        '''Puts a component from the inventory, and everything attached
+        below it, through load scenarios on the test bench and prints
+        the report. The scenarios are idle, cruise and full, all three
+        if none are named.
+
+        > test power-core-A
+        > test raygun-B full
+        '''
+        try:
+            import testbench
+        except ImportError as e:
+            print("The test bench needs numpy: {}".format(e))
+            return
+        name, *scenario_names = shlex.split(arg) or ['']
+        component = self.inventory.retrieve(name)
+        if component is None:
+            print("Usage: test <item in inventory> [scenario...]")
+            return
+        unknown = [s for s in scenario_names if s not in testbench.SCENARIOS]
+        if unknown:
+            print("No scenario called {}. Try {}.".format(
+                ', '.join(unknown), ', '.join(testbench.SCENARIOS)))
+            return
+        scenarios = [testbench.SCENARIOS[s]
+                     for s in scenario_names or testbench.SCENARIOS]
+        print(testbench.run(component, scenarios).format())
+
+
+def format_timings(timings):
+    '''Formats the timings from SpaceshipCommand.run_script as a table,
+    slowest command first'''
+    lines = ['{:<12} {:>8} {:>12} {:>12}'.format(
+        'command', 'count', 'total ms', 'mean us')]
+    for command, (count, total) in sorted(
+            timings.items(), key=lambda item: -item[1][1]):
+        lines.append('{:<12} {:>8} {:>12.3f} {:>12.1f}'.format(
+            command, count, total * 1e3, total / count * 1e6))
+    return '\n'.join(lines)
@@ -1,10 +1,14 @@
 '''Utility functions used elsewhere'''
 
+import itertools
+import os
+import random
 import re
 import string
 
 # This is what is exported from the module
-__all__ = ['fprint', 'caps_to_hyphens', 'letterer', 'unletterer']
+__all__ = ['fprint', 'caps_to_hyphens', 'letterer', 'unletterer',
+           'letterer_range', 'new_id']
 
 
 def fprint(template, *args, **kwargs):
@@ -38,7 +42,7 @@ def letterer(num):
     >>> letterer(32)
     'aa'
     >>> letterer(1055), letterer(1056)
-    >>> '77', 'aaa'
+    ('77', 'aaa')
     >>> try:
     ...     letterer(-1)
     ... except ValueError as ve:
@@ -65,23 +69,84 @@ def unletterer(letters):
     0
     >>> unletterer('aa')
     32
+    >>> unletterer('77'), unletterer('aaa')
+    (1055, 1056)
     >>> unletterer('a0')  # a0 => ao
-    35
+    46
     >>> unletterer('a1')  # a1 => al
+    43
     '''
     letters = letters.lower()
-    bad_chars = set(letters).difference(_unletters.keys())
-    if bad_chars:
+    if not letters:
+        raise ValueError('There are no letters to convert')
+    # Every position counts from one rather than zero, so 'a' is a
+    # digit worth 1 and 'aa' comes straight after '7'
+    value = 0
+    try:
+        for let in letters:
+            value = value * 32 + _unletters[let] + 1
+    except KeyError:
+        bad_chars = set(letters).difference(_unletters.keys())
         raise ValueError('{} are not valid characters'.format(
-            ','.join(bad_chars)))
-    revnums = [_unletters[let] for let in reversed(letters)]
-    revnums.append(0)  # extra value for carries
-    value = revnums[0]
-    for power, num in enumerate(revnums[1:], 1):
-        if power < len(revnums) - 1:
-            num += 1
-        if num > 31:
-            carry, num = divmod(num, 32)
-            revnums[power] += carry
-        value += num * 32 ** power
-    return value
\ No newline at end of file
+            ','.join(bad_chars))) from None
+    return value - 1
+
+
+def letterer_range(start, stop):
+    '''Yields letterer(num) for each num in range(start, stop), without
+    converting every number from scratch.
+
+    >>> list(letterer_range(30, 34))
+    ['6', '7', 'aa', 'ab']
+    '''
+    if start < 0:
+        raise ValueError("Number must be 0 or greater")
+    if start >= stop:
+        return
+    digits = [_unletters[let] for let in letterer(start)]
+    remaining = stop - start
+    while True:
+        # only the last letter changes until it runs past '7'
+        prefix = ''.join(_letters[d] for d in digits[:-1])
+        for last in range(digits[-1], min(32, digits[-1] + remaining)):
+            yield prefix + _letters[last]
+        remaining -= 32 - digits[-1]
+        if remaining <= 0:
+            return
+        # carry into the prefix
+        digits[-1] = 0
+        position = len(digits) - 2
+        while position >= 0 and digits[position] == 31:
+            digits[position] = 0
+            position -= 1
+        if position < 0:
+            digits.insert(0, 0)
+        else:
+            digits[position] += 1
+
+
+def _reset_ids():
+    '''Picks a new random prefix and restarts the counter'''
+    global _id_prefix, _id_counter
+    _id_prefix = '{:016x}'.format(random.getrandbits(64))
+    _id_counter = itertools.count()
+
+_reset_ids()
+# a forked child would otherwise hand out the same ids as its parent
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_ids)
+
+
+def new_id():
+    '''Returns an id that no other call, in this or any other process,
+    will return. Ids are 32 hex digits: a random prefix picked once per
+    process followed by a counter, so they sort in the order they were
+    handed out within a process.
+
+    >>> len(new_id())
+    32
+    >>> a, b = new_id(), new_id()
+    >>> a[:16] == b[:16] and a < b
+    True
+    '''
+    return '{}{:016x}'.format(_id_prefix, next(_id_counter))
@@ -1,31 +1,115 @@
 '''Contains components and the component superclass'''
 
-import uuid
+from array import array
+from collections import Counter
+from itertools import repeat
+import math
+import random
+import warnings
 
 import bus
-from common import caps_to_hyphens, letterer
+from common import (caps_to_hyphens, letterer, letterer_range, new_id,
+                    unletterer)
+
+# Every component class by shop_name, see resolve
+_registry = {}
+
+
+def _origin(cls):
+    '''Returns what says where cls was defined, the same for a module
+    imported on its own or as part of a package'''
+    return cls.__module__.rpartition('.')[2], cls.__qualname__
 
 
 class ComponentMeta(type):
-    '''Adds the counter to each class independently on creation'''
+    '''Adds the counter to each class independently on creation, and
+    registers the class so its components can be found by name. A
+    class defined again under the same shop_name, say by reloading its
+    module, takes over the name'''
 
     def __new__(metacls, classname, parents, attributes):
         # This ensures each Component subclass has its own counter
         attributes['_counter'] = 0
+        # and its own list of components, indexed by counter
+        attributes['_instances'] = []
         if 'shop_name' not in attributes:
             attributes['shop_name'] = caps_to_hyphens(classname)
-        return super().__new__(metacls, classname, parents, attributes)
+        cls = super().__new__(metacls, classname, parents, attributes)
+        old = _registry.get(cls.shop_name)
+        if old is not None and _origin(old) != _origin(cls):
+            warnings.warn('{}.{} replaces {}.{} as shop_name {!r}'.format(
+                cls.__module__, cls.__qualname__, old.__module__,
+                old.__qualname__, cls.shop_name), RuntimeWarning,
+                stacklevel=2)
+        _registry[cls.shop_name] = cls
+        return cls
+
+
+def resolve(name):
+    '''Returns the component called name, or None if there isn't one.
+    The name itself says which class and which number it is, so this
+    doesn't search for it'''
+    shop_name, _, letters = name.rpartition('-')
+    cls = _registry.get(shop_name)
+    if cls is None:
+        return None
+    try:
+        number = unletterer(letters)
+    except ValueError:
+        return None
+    instances = cls._instances
+    component = instances[number] if number < len(instances) else None
+    # unletterer reads 0 and 1 as o and l, which would otherwise let
+    # two spellings resolve to the same component
+    if component is not None and component.name == name:
+        return component
+    return None
+
+
+def owner_of(node):
+    '''Returns the component whose bus is node, or None if it isn't a
+    component's bus'''
+    component = resolve(node.name)
+    if component is not None and vars(component).get('_bus') is node:
+        return component
+    return None
+
+
+def forget(component):
+    '''Stops resolve from finding component, so it can be freed once
+    nothing else refers to it.
+
+    Every component stays findable, and so in memory, until it is
+    forgotten. Inventory.destroy does this for what it destroys, but
+    anything else thrown away, such as components made by
+    Blueprint.stamp or loaded from a save, has to be forgotten by
+    whoever discards it.
+    '''
+    if resolve(component.name) is component:
+        number = unletterer(component.name.rpartition('-')[2])
+        type(component)._instances[number] = None
 
 
 class Component(metaclass=ComponentMeta):
     '''All components should subclass this'''
 
     @classmethod
-    def _make_name(cls):
+    def _register(cls, first, components):
+        '''Records components under consecutive numbers from first.
+        Numbers reserved without a component stay None'''
+        instances = cls._instances
+        end = first + len(components)
+        if end > len(instances):
+            instances.extend(repeat(None, end - len(instances)))
+        instances[first:end] = components
+
+    def _make_name(self):
         '''Called only once in the constructor to create a component's
         name'''
+        cls = type(self)
         number = cls._counter
         cls._counter += 1
+        cls._register(number, [self])
         return '{}-{}'.format(cls.shop_name, letterer(number).upper())
 
     def __str__(self):
@@ -34,15 +118,191 @@ class Component(metaclass=ComponentMeta):
     def __repr__(self):
         args = ('{}={!r}'.format(k, v)
                 for k, v in sorted(self.__dict__.items())
-                if k not in ('bus', 'id'))
+                if not k.startswith('_'))
         return '{classname}({args})'.format(
             classname=self.__class__.__name__,
             args=', '.join(args))
 
+    @classmethod
+    def create_many(cls, count, *args, **kwargs):
+        '''Makes count components at once, passing args and kwargs to
+        each constructor. The block of names is reserved up front, so
+        they are the same names count separate constructions would get
+        '''
+        first = cls._counter
+        cls._counter += count
+        template = cls.shop_name + '-{}'
+        components = []
+        for letters in letterer_range(first, first + count):
+            component = cls.__new__(cls)
+            component.name = template.format(letters.upper())
+            component.__init__(*args, **kwargs)
+            components.append(component)
+        cls._register(first, components)
+        return components
+
     def __init__(self):
-        self.name = self._make_name()
+        if not hasattr(self, 'name'):
+            # create_many names components before initializing them
+            self.name = self._make_name()
         if not hasattr(self, 'mass'):
             # By default, weighs one kilogram
             self.mass = 1
-        self.id = str(uuid.uuid4())
-        self.bus = bus.Bus(self.name)
+
+    # Most components sit in an inventory and are never wired up, so the
+    # id and bus are only made when something asks for them
+
+    @property
+    def id(self):
+        try:
+            return self._id
+        except AttributeError:
+            self._id = new_id()
+            return self._id
+
+    @property
+    def bus(self):
+        try:
+            return self._bus
+        except AttributeError:
+            self._bus = bus.Bus(self.name)
+            return self._bus
+
+
+class ComponentRef:
+    '''A lightweight stand-in for a Component kept in a ComponentStore.
+
+    It holds only the store and its row, and reads everything else from
+    the store's arrays, so it can be thrown away and made again freely.
+    '''
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def kind(self):
+        '''The Component subclass this stands in for'''
+        return self.store._kinds[self.store._kind_index[self.index]]
+
+    @property
+    def shop_name(self):
+        return self.kind.shop_name
+
+    @property
+    def name(self):
+        return '{}-{}'.format(
+            self.shop_name, letterer(self.store._numbers[self.index]).upper())
+
+    @property
+    def mass(self):
+        return self.store._masses[self.index]
+
+    @mass.setter
+    def mass(self, mass):
+        self.store._masses[self.index] = mass
+
+    @property
+    def id(self):
+        return '{:016x}{:016x}'.format(self.store._id_prefix, self.index)
+
+    @property
+    def bus(self):
+        '''Made the first time it's asked for, most components in a large
+        ship never need one'''
+        buses = self.store._buses
+        bus_ = buses.get(self.index)
+        if bus_ is None:
+            bus_ = buses[self.index] = bus.Bus(self.name)
+        return bus_
+
+    def __eq__(self, other):
+        return (type(other) is ComponentRef and
+                other.store is self.store and other.index == self.index)
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '{classname}(mass={mass!r}, name={name!r})'.format(
+            classname=self.kind.__name__, mass=self.mass, name=self.name)
+
+
+class ComponentStore:
+    '''Holds many components as columns of typed arrays instead of one
+    object each.
+
+    A Component costs an instance dict, a uuid string and a Bus. Here a
+    component is a row: which class it is, its name number and its mass,
+    14 bytes in all. Indexing or iterating gives ComponentRefs.
+    '''
+
+    def __init__(self):
+        self._kinds = []
+        self._kind_numbers = {}
+        self._kind_index = array('H')
+        self._numbers = array('I')
+        self._masses = array('d')
+        self._buses = {}
+        self._id_prefix = random.getrandbits(64)
+
+    def _kind_number(self, cls):
+        try:
+            return self._kind_numbers[cls]
+        except KeyError:
+            self._kinds.append(cls)
+            self._kind_numbers[cls] = len(self._kinds) - 1
+            return len(self._kinds) - 1
+
+    def add(self, cls, mass=None):
+        '''Adds a component of class cls and returns a ref to it. The
+        mass defaults to the class's mass, or one kilogram'''
+        return self[self.add_many(cls, 1, mass).start]
+
+    def add_many(self, cls, count, mass=None):
+        '''Adds count components of class cls, numbered consecutively.
+        Returns the range of rows they were given'''
+        start = len(self)
+        first = cls._counter
+        cls._counter += count
+        self._kind_index.extend(repeat(self._kind_number(cls), count))
+        self._numbers.extend(range(first, first + count))
+        if mass is None:
+            mass = getattr(cls, 'mass', 1)
+        self._masses.extend(repeat(mass, count))
+        return range(start, start + count)
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('ComponentStore index out of range')
+        return ComponentRef(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ComponentRef(self, index)
+
+    def total_mass(self):
+        '''Returns the mass of everything in the store'''
+        return math.fsum(self._masses)
+
+    def mass_by_kind(self):
+        '''Returns a Counter of total mass for each component class'''
+        totals = [0.0] * len(self._kinds)
+        for kind, mass in zip(self._kind_index, self._masses):
+            totals[kind] += mass
+        return Counter(dict(zip(self._kinds, totals)))
+
+    def nbytes(self):
+        '''Returns how many bytes the store's arrays take up'''
+        return sum(column.itemsize * len(column) for column in
+                   (self._kind_index, self._numbers, self._masses))
@@ -0,0 +1,153 @@
+'''Runs Bus subscribers on a pool of worker threads instead of on the
+thread that broadcasts'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import traceback
+
+# What a Mailbox does when a message arrives and it is already full
+BLOCK = 'block'  # make the sender wait for room
+DROP_OLDEST = 'drop-oldest'  # throw away the oldest queued message
+DROP_NEWEST = 'drop-newest'  # throw away the message that just arrived
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+def print_error(subscriber, msg):
+    '''Default error handler, prints the traceback of the exception
+    being handled'''
+    print('Subscriber {!r} failed on {!r}'.format(subscriber, msg))
+    traceback.print_exc()
+
+
+class Mailbox:
+    '''A bounded queue of messages for one subscriber.
+
+    Calling the mailbox queues a message and returns straight away (or
+    waits, with the BLOCK policy). A Dispatcher worker then calls the
+    subscriber with the queued messages in order. At most one worker
+    drains a mailbox at a time, so a subscriber sees the messages from
+    any one sender in the order they were sent.
+    '''
+
+    def __init__(self, dispatcher, subscriber, maxsize, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy {!r}'.format(overflow))
+        if maxsize < 1:
+            raise ValueError('Mailbox size must be 1 or greater')
+        self.dispatcher = dispatcher
+        self.subscriber = subscriber
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = deque()
+        self._not_full = threading.Condition(threading.Lock())
+        self._scheduled = False
+
+    def __call__(self, msg):
+        dropped = 0
+        with self._not_full:
+            queue = self._queue
+            if len(queue) >= self.maxsize:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self.overflow == DROP_OLDEST:
+                    queue.popleft()
+                    self.dropped += 1
+                    dropped = 1
+                else:
+                    while len(queue) >= self.maxsize:
+                        self._not_full.wait()
+            queue.append(msg)
+            schedule = not self._scheduled
+            self._scheduled = True
+        # the dropped message was already counted as pending
+        self.dispatcher._pending(1 - dropped)
+        if schedule:
+            self.dispatcher._schedule(self)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __eq__(self, other):
+        # lets Bus.unsubscribe find the mailbox by its subscriber
+        return other is self or other == self.subscriber
+
+    def __hash__(self):
+        return hash(self.subscriber)
+
+    def _drain(self):
+        '''Delivers up to dispatcher.burst queued messages, then hands
+        the worker back so other mailboxes get a turn'''
+        for _ in range(self.dispatcher.burst):
+            with self._not_full:
+                if not self._queue:
+                    self._scheduled = False
+                    return
+                msg = self._queue.popleft()
+                self._not_full.notify()
+            try:
+                self.subscriber(msg)
+            except Exception:
+                self.dispatcher.on_error(self.subscriber, msg)
+            finally:
+                self.dispatcher._pending(-1)
+        with self._not_full:
+            if not self._queue:
+                self._scheduled = False
+                return
+        self.dispatcher._schedule(self)
+
+
+class Dispatcher:
+    '''A pool of worker threads that Bus subscribers can run on. Pass
+    it to Bus.subscribe, or subscribe a mailbox from it directly to
+    pick a size and overflow policy for that subscriber.
+    '''
+
+    def __init__(self, workers=4, maxsize=1024, overflow=BLOCK, burst=64,
+                 on_error=print_error):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.burst = burst
+        self.on_error = on_error
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='bus-dispatch')
+        self._idle = threading.Condition(threading.Lock())
+        self._in_flight = 0
+
+    def mailbox(self, subscriber, maxsize=None, overflow=None):
+        '''Returns a Mailbox that runs subscriber on this dispatcher.
+        maxsize and overflow default to the dispatcher's own'''
+        return Mailbox(
+            self, subscriber,
+            self.maxsize if maxsize is None else maxsize,
+            self.overflow if overflow is None else overflow)
+
+    def _schedule(self, mailbox):
+        self._executor.submit(mailbox._drain)
+
+    def _pending(self, delta):
+        with self._idle:
+            self._in_flight += delta
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def join(self, timeout=None):
+        '''Waits until every queued message has been delivered. Returns
+        whether that happened before the timeout'''
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: not self._in_flight, timeout)
+
+    def shutdown(self):
+        '''Delivers everything still queued and stops the workers'''
+        self.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
@@ -1,16 +1,77 @@
 '''Player Inventory'''
+from bisect import bisect_left, bisect_right
 from collections import Counter
 
+import components
+
 
 class Inventory:
-    '''This is the inventory. You may store and retrieve items.'''
+    '''This is the inventory. You may store and retrieve items.
+
+    Counts and names for each item type, and a sorted list of every
+    name, are kept up to date as items come and go, so summaries and
+    name searches don't have to look at every item.
+    '''
 
     def __init__(self):
         self._inv = {}
+        self._counts = Counter()
+        self._by_type = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._inv)
+
+    def __contains__(self, item_name):
+        return item_name in self._inv
+
+    def _index(self, item):
+        item_type = type(item)
+        self._counts[item_type] += 1
+        self._by_type.setdefault(item_type, set()).add(item.name)
+
+    def _unindex(self, item):
+        item_type = type(item)
+        self._counts[item_type] -= 1
+        if not self._counts[item_type]:
+            del self._counts[item_type]
+            del self._by_type[item_type]
+        else:
+            self._by_type[item_type].discard(item.name)
+
+    @staticmethod
+    def _release(item):
+        '''Lets a destroyed component be freed, as nothing should find
+        it by name any more'''
+        if isinstance(item, components.Component):
+            components.forget(item)
 
     def store(self, item):
         '''Stores an item in the inventory'''
+        old = self._inv.get(item.name)
+        if old is not None:
+            self._unindex(old)
+        else:
+            names = self._names
+            names.insert(bisect_left(names, item.name), item.name)
         self._inv[item.name] = item
+        self._index(item)
+
+    def store_many(self, items):
+        '''Stores several items in the inventory at once'''
+        new_names = []
+        for item in items:
+            old = self._inv.get(item.name)
+            if old is not None:
+                self._unindex(old)
+            else:
+                new_names.append(item.name)
+            self._inv[item.name] = item
+            self._index(item)
+        # names bought together are usually already in order, which
+        # sort handles in a single merge
+        self._names.extend(new_names)
+        self._names.sort()
 
     def retrieve(self, item_name):
         ''' Returns an item from the inventory'''
@@ -19,16 +80,60 @@ class Inventory:
     def destroy(self, item_name):
         ''' Destroys an item from the inventory'''
         try:
-            del self._inv[item_name]
-            return True
+            item = self._inv.pop(item_name)
         except KeyError:
             return False
+        self._unindex(item)
+        names = self._names
+        del names[bisect_left(names, item_name)]
+        self._release(item)
+        return True
+
+    def destroy_many(self, item_names):
+        '''Destroys several items from the inventory at once. Returns how
+        many there were to destroy'''
+        destroyed = set()
+        for item_name in item_names:
+            item = self._inv.pop(item_name, None)
+            if item is not None:
+                self._unindex(item)
+                self._release(item)
+                destroyed.add(item_name)
+        if destroyed:
+            self._names = [name for name in self._names
+                           if name not in destroyed]
+        return len(destroyed)
 
     def contents(self):
         ''' Returns the full contents of the inventory'''
         return list(self._inv.keys())
 
+    def iter_contents(self):
+        '''Yields the name of everything in the inventory without
+        copying them into a list first'''
+        return iter(self._inv.keys())
+
     def summary_contents(self):
         '''Returns the summary contents of the inventory'''
-        classes = map(type, list(self._inv.values()))
-        return Counter(classes)
\ No newline at end of file
+        return Counter(self._counts)
+
+    def names_of_type(self, item_type):
+        '''Returns the names of every item of item_type'''
+        return set(self._by_type.get(item_type, ()))
+
+    def search(self, prefix):
+        '''Yields, in order, the names that start with prefix, so
+        search('raygun-') finds every raygun'''
+        names = self._names
+        for index in range(bisect_left(names, prefix), len(names)):
+            if not names[index].startswith(prefix):
+                break
+            yield names[index]
+
+    def page(self, after=None, limit=None):
+        '''Returns up to limit names in order, starting with the first
+        name after the given one. Pass the last name of one page as
+        after to get the next'''
+        start = 0 if after is None else bisect_right(self._names, after)
+        stop = None if limit is None else start + limit
+        return self._names[start:stop]
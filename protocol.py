@@ -0,0 +1,245 @@
+'''The framed wire protocol spoken between client.py and server.py.
+
+Every frame is a 4 byte payload length and a 1 byte frame type, both
+big-endian, followed by the payload. Frames never get split or merged
+on the way, so a client can send many requests before reading any
+responses (pipelining) and read the responses back one frame each.
+
+A BusMessage payload is its id and size, then its topic, sender and
+message as length-prefixed utf-8 strings.
+'''
+
+import asyncio
+import collections
+from collections import namedtuple
+import pathlib
+import struct
+
+from bus import BusMessage
+
+_HEADER = struct.Struct('!IB')
+# id, size, topic length, sender length, message length
+_MESSAGE = struct.Struct('!QIHHI')
+
+# Frames bigger than this are refused rather than buffered
+MAX_FRAME = 16 * 1024 * 1024
+# The longest topic or sender a BusMessage can carry, in utf-8 bytes
+MAX_TOPIC = 0xFFFF
+
+# Frame types
+TEXT = 1  # a line of utf-8 text, like the old raw protocol
+MESSAGE = 2  # a BusMessage
+ERROR = 3  # utf-8 text describing what the other end did wrong
+# Relay requests, see relay.py. Their payloads are strings encoded with
+# encode_fields
+SUBSCRIBE = 4  # bus name, topic filter
+UNSUBSCRIBE = 5  # bus name, topic filter
+PUBLISH = 6  # bus name, topic, message
+
+Frame = namedtuple('Frame', 'type payload')
+
+
+class ProtocolError(ValueError):
+    '''The other end sent something that isn't a valid frame'''
+
+
+def encode_frame(frame_type, payload):
+    '''Returns the bytes for one frame'''
+    if len(payload) > MAX_FRAME:
+        raise ProtocolError('Frame of {} bytes is too big'.format(
+            len(payload)))
+    return _HEADER.pack(len(payload), frame_type) + payload
+
+
+def encode_text(text):
+    return encode_frame(TEXT, text.encode('utf-8'))
+
+
+def encode_message(msg):
+    '''Returns the payload for a BusMessage. Raises ProtocolError if its
+    topic or sender is longer than MAX_TOPIC bytes'''
+    topic = msg.topic.encode('utf-8')
+    sender = str(msg.sender).encode('utf-8')
+    message = msg.message.encode('utf-8')
+    if len(topic) > MAX_TOPIC or len(sender) > MAX_TOPIC:
+        raise ProtocolError('Topic or sender is longer than {} bytes'
+                            .format(MAX_TOPIC))
+    return b''.join((
+        _MESSAGE.pack(msg.id, msg.size, len(topic), len(sender),
+                      len(message)),
+        topic, sender, message))
+
+
+def decode_message(payload):
+    '''Returns the BusMessage in a MESSAGE payload'''
+    try:
+        id_, size, topic_len, sender_len, message_len = \
+            _MESSAGE.unpack_from(payload)
+    except struct.error:
+        raise ProtocolError('Message payload is too short') from None
+    start = _MESSAGE.size
+    if len(payload) != start + topic_len + sender_len + message_len:
+        raise ProtocolError('Message payload has the wrong length')
+    payload = bytes(payload)
+    try:
+        topic = payload[start:start + topic_len].decode('utf-8')
+        start += topic_len
+        sender = payload[start:start + sender_len].decode('utf-8')
+        start += sender_len
+        message = payload[start:].decode('utf-8')
+    except UnicodeDecodeError:
+        raise ProtocolError('Message is not valid utf-8') from None
+    return BusMessage(topic, message, pathlib.PurePosixPath(sender),
+                      size, id_)
+
+
+_FIELD = struct.Struct('!I')
+
+
+def encode_fields(*fields):
+    '''Returns a payload holding some strings, each length-prefixed'''
+    chunks = []
+    for field in fields:
+        data = field.encode('utf-8')
+        chunks.append(_FIELD.pack(len(data)))
+        chunks.append(data)
+    return b''.join(chunks)
+
+
+def decode_fields(payload, count):
+    '''Returns the count strings in a payload from encode_fields'''
+    fields = []
+    start = 0
+    try:
+        for _ in range(count):
+            length, = _FIELD.unpack_from(payload, start)
+            start += _FIELD.size
+            if start + length > len(payload):
+                raise ProtocolError('Field runs past the end of the frame')
+            fields.append(payload[start:start + length].decode('utf-8'))
+            start += length
+    except struct.error:
+        raise ProtocolError('Frame has too few fields') from None
+    except UnicodeDecodeError:
+        raise ProtocolError('Field is not valid utf-8') from None
+    if start != len(payload):
+        raise ProtocolError('Frame has too many fields')
+    return fields
+
+
+def _check_length(length):
+    if length > MAX_FRAME:
+        raise ProtocolError('Frame of {} bytes is too big'.format(length))
+
+
+class FrameDecoder:
+    '''Turns a stream of bytes, in whatever pieces they arrive, back into
+    frames. It does no I/O itself, so it works for sockets and asyncio
+    alike'''
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0
+
+    @property
+    def pending(self):
+        '''Whether part of a frame is waiting for the rest of it'''
+        return len(self._buffer) > self._start
+
+    def feed(self, data):
+        '''Adds data and returns the list of frames it completed'''
+        if self._start:
+            # drop what has been decoded already before growing
+            del self._buffer[:self._start]
+            self._start = 0
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        while len(buffer) - start >= _HEADER.size:
+            length, frame_type = _HEADER.unpack_from(buffer, start)
+            _check_length(length)
+            end = start + _HEADER.size + length
+            if end > len(buffer):
+                break
+            frames.append(Frame(frame_type, bytes(buffer[end - length:end])))
+            start = end
+        self._start = start
+        return frames
+
+
+class FrameReader:
+    '''Reads frames from a blocking socket, asking it for as much as it
+    has each time rather than one frame at a time'''
+
+    def __init__(self, sock, chunk=65536):
+        self.sock = sock
+        self.chunk = chunk
+        self._decoder = FrameDecoder()
+        self._ready = collections.deque()
+
+    def read(self):
+        '''Returns the next Frame, or None if the other end closed the
+        connection between frames'''
+        while not self._ready:
+            data = self.sock.recv(self.chunk)
+            if not data:
+                if self._decoder.pending:
+                    raise ProtocolError('Connection closed mid frame')
+                return None
+            self._ready.extend(self._decoder.feed(data))
+        return self._ready.popleft()
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+
+class FrameWriter:
+    '''Collects frames for a blocking socket and sends them all with
+    one call to flush'''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._pending = []
+
+    def write(self, frame_type, payload):
+        self._pending.append(encode_frame(frame_type, payload))
+
+    def write_text(self, text):
+        self._pending.append(encode_text(text))
+
+    def write_message(self, msg):
+        self.write(MESSAGE, encode_message(msg))
+
+    def flush(self):
+        if self._pending:
+            self.sock.sendall(b''.join(self._pending))
+            self._pending = []
+
+
+async def read_frame(reader):
+    '''Reads the next Frame from an asyncio.StreamReader, or returns
+    None if the other end closed the connection between frames'''
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError('Connection closed mid frame') from None
+        return None
+    length, frame_type = _HEADER.unpack(header)
+    _check_length(length)
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError('Connection closed mid frame') from None
+    return Frame(frame_type, payload)
+
+
+def write_frame(writer, frame_type, payload):
+    '''Queues a frame on an asyncio.StreamWriter. Await writer.drain()
+    after a batch of them'''
+    writer.write(encode_frame(frame_type, payload))
@@ -0,0 +1,347 @@
+'''Relays Bus traffic to and from network clients, for multiplayer.
+
+A client names a bus and a topic filter to subscribe to, using the
+same matching as Bus.subscribe, and can publish onto any bus by name.
+The relay subscribes to each (bus, filter) pair once, however many
+clients want it, and encodes each message once for all of them.
+
+Every client has a bounded send buffer. A client that can't keep up
+fills it, and then its overflow policy decides what gives: the oldest
+queued message, the newest one, older messages on the same topic
+(coalescing), or the connection itself. Broadcasting never waits for a
+client, so one laggy player can't stall the ship's bus.
+'''
+
+import argparse
+import asyncio
+from collections import deque
+import contextlib
+import inspect
+import threading
+
+import bus
+import protocol
+from dispatch import DROP_NEWEST, DROP_OLDEST
+from server import GameServer
+
+# The other overflow policies for a client's send buffer
+COALESCE = 'coalesce'  # replace the queued message on the same topic
+DISCONNECT = 'disconnect'  # drop the client
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE, DISCONNECT)
+
+
+class Peer:
+    '''One connected client and its send buffer'''
+
+    def __init__(self, relay, reader, writer, max_buffer, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy {!r}'.format(overflow))
+        self.relay = relay
+        self.reader = reader
+        self.writer = writer
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self.sent = 0
+        self.dropped = 0
+        self.subscriptions = set()
+        # [topic, frame] pairs waiting to be written, and the newest
+        # pair for each topic, which coalescing replaces
+        self._queue = deque()
+        self._latest = {}
+        self._queued_bytes = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def send(self, topic, frame):
+        '''Queues an encoded frame. Never waits'''
+        if self._closed:
+            return
+        if self._queued_bytes + len(frame) > self.max_buffer and \
+                not self._make_room(topic, frame):
+            return
+        entry = [topic, frame]
+        self._queue.append(entry)
+        self._latest[topic] = entry
+        self._queued_bytes += len(frame)
+        self._ready.set()
+
+    def _make_room(self, topic, frame):
+        '''Applies the overflow policy to fit frame in. Returns whether
+        frame still needs queueing'''
+        policy = self.overflow
+        if policy == COALESCE and topic in self._latest:
+            entry = self._latest[topic]
+            self._queued_bytes += len(frame) - len(entry[1])
+            entry[1] = frame
+            self.dropped += 1
+            return False
+        elif policy == DISCONNECT:
+            self.dropped += 1
+            self.close()
+            return False
+        elif policy == DROP_NEWEST:
+            self.dropped += 1
+            return False
+        # DROP_OLDEST, and COALESCE for a topic with nothing queued
+        while self._queue and \
+                self._queued_bytes + len(frame) > self.max_buffer:
+            old_topic, old_frame = self._queue.popleft()
+            if self._latest.get(old_topic) is not None and \
+                    self._latest[old_topic][1] is old_frame:
+                del self._latest[old_topic]
+            self._queued_bytes -= len(old_frame)
+            self.dropped += 1
+        return True
+
+    async def flush_forever(self):
+        '''Writes whatever is queued, waiting for the client to take
+        each batch before writing the next'''
+        while not self._closed:
+            await self._ready.wait()
+            self._ready.clear()
+            if not self._queue:
+                continue
+            data = b''.join(frame for _, frame in self._queue)
+            self.sent += len(self._queue)
+            self._queue.clear()
+            self._latest.clear()
+            self._queued_bytes = 0
+            self.writer.write(data)
+            await self.writer.drain()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+        self.writer.close()
+
+
+class _Fanout:
+    '''The relay's one subscriber for a (bus, topic filter) pair'''
+
+    def __init__(self, relay):
+        self.relay = relay
+        self.peers = set()
+
+    def __call__(self, msg):
+        self.relay._deliver(self.peers, msg)
+
+
+class Relay(GameServer):
+    '''Serves named buses to clients speaking the framed protocol.
+
+    buses maps names to Bus objects. max_buffer is how many bytes may
+    wait to be sent to one client, and overflow what happens once they
+    would exceed it (see OVERFLOW_POLICIES). Clients aren't timed out
+    for being idle, as subscribers may only ever listen.
+    '''
+
+    def __init__(self, buses, host='localhost', port=6970,
+                 max_buffer=1024 * 1024, overflow=DROP_OLDEST):
+        super().__init__(host, port, idle_timeout=None, motd=None)
+        self.buses = dict(buses)
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        self.peers = set()
+        self.encoded = 0
+        # messages that couldn't be encoded, and so went to no client
+        self.unencodable = 0
+        self._fanouts = {}
+        self._loop = None
+        self._loop_thread = None
+        # the last message encoded, which other fanouts matching the
+        # same broadcast can reuse
+        self._last = (None, None)
+
+    async def start(self):
+        '''Starts listening. With port 0, self.port is set to the port
+        the system picked'''
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        await super().start()
+
+    def _deliver(self, peers, msg):
+        if threading.get_ident() != self._loop_thread:
+            # broadcast from another thread: hand over to the loop
+            self._loop.call_soon_threadsafe(self._deliver, peers, msg)
+            return
+        if self._last[0] is msg:
+            frame = self._last[1]
+        else:
+            try:
+                frame = protocol.encode_frame(
+                    protocol.MESSAGE, protocol.encode_message(msg))
+                self.encoded += 1
+            except protocol.ProtocolError:
+                # raising would stop the bus delivering to everyone
+                # after this subscriber, so the clients go without
+                frame = None
+                self.unencodable += 1
+            self._last = (msg, frame)
+        if frame is None:
+            return
+        for peer in peers:
+            peer.send(msg.topic, frame)
+
+    def _subscribe(self, peer, bus_name, topic_filter):
+        key = (bus_name, topic_filter)
+        if key in peer.subscriptions:
+            return
+        fanout = self._fanouts.get(key)
+        if fanout is None:
+            fanout = self._fanouts[key] = _Fanout(self)
+            self.buses[bus_name].subscribe(topic_filter, fanout)
+        fanout.peers.add(peer)
+        peer.subscriptions.add(key)
+
+    def _unsubscribe(self, peer, key):
+        peer.subscriptions.discard(key)
+        fanout = self._fanouts.get(key)
+        if fanout is None:
+            return
+        fanout.peers.discard(peer)
+        if not fanout.peers:
+            del self._fanouts[key]
+            bus_name, topic_filter = key
+            self.buses[bus_name].unsubscribe(topic_filter, fanout)
+
+    def _request(self, peer, frame):
+        '''Carries out one request from a client. Returns an awaitable
+        if it has to wait, which publishing on an AsyncBus does'''
+        if frame.type in (protocol.SUBSCRIBE, protocol.UNSUBSCRIBE):
+            bus_name, topic_filter = protocol.decode_fields(frame.payload, 2)
+            self._bus(bus_name)
+            if frame.type == protocol.SUBSCRIBE:
+                self._subscribe(peer, bus_name, topic_filter)
+            else:
+                self._unsubscribe(peer, (bus_name, topic_filter))
+        elif frame.type == protocol.PUBLISH:
+            bus_name, topic, message = protocol.decode_fields(
+                frame.payload, 3)
+            if len(topic.encode('utf-8')) > protocol.MAX_TOPIC:
+                raise protocol.ProtocolError(
+                    'Topic is longer than {} bytes'.format(
+                        protocol.MAX_TOPIC))
+            return self._bus(bus_name).broadcast(topic, '{}', message)
+        else:
+            raise protocol.ProtocolError(
+                'Unknown frame type {}'.format(frame.type))
+
+    def _bus(self, name):
+        try:
+            return self.buses[name]
+        except KeyError:
+            raise protocol.ProtocolError(
+                'No bus called {!r}'.format(name)) from None
+
+    async def _converse(self, reader, writer):
+        peer = Peer(self, reader, writer, self.max_buffer, self.overflow)
+        self.peers.add(peer)
+        flusher = asyncio.ensure_future(peer.flush_forever())
+        decoder = protocol.FrameDecoder()
+        try:
+            while not peer._closed:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for frame in decoder.feed(data):
+                    try:
+                        pending = self._request(peer, frame)
+                        # awaited here, so a client's publishes stay in
+                        # order and a full AsyncBus stops reading them
+                        if inspect.isawaitable(pending):
+                            await pending
+                    except protocol.ProtocolError as e:
+                        peer.send(None, protocol.encode_frame(
+                            protocol.ERROR, str(e).encode('utf-8')))
+        except protocol.ProtocolError:
+            pass
+        finally:
+            for key in list(peer.subscriptions):
+                self._unsubscribe(peer, key)
+            self.peers.discard(peer)
+            flusher.cancel()
+            peer.close()
+            with contextlib.suppress(OSError, asyncio.CancelledError):
+                await flusher
+
+    def _say_goodbye(self):
+        '''Unsubscribes from every bus and closes every connection'''
+        for peer in list(self.peers):
+            peer.close()
+
+
+class RelayClient:
+    '''An asyncio connection to a Relay'''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='localhost', port=6970):
+        return cls(*await asyncio.open_connection(host, port))
+
+    def subscribe(self, bus_name, topic_filter=''):
+        protocol.write_frame(self.writer, protocol.SUBSCRIBE,
+                             protocol.encode_fields(bus_name, topic_filter))
+
+    def unsubscribe(self, bus_name, topic_filter=''):
+        protocol.write_frame(self.writer, protocol.UNSUBSCRIBE,
+                             protocol.encode_fields(bus_name, topic_filter))
+
+    def publish(self, bus_name, topic, message):
+        protocol.write_frame(self.writer, protocol.PUBLISH,
+                             protocol.encode_fields(bus_name, topic, message))
+
+    async def flush(self):
+        '''Waits until the requests written so far have been sent'''
+        await self.writer.drain()
+
+    async def receive(self):
+        '''Returns the next BusMessage, or None when the relay closes
+        the connection. Raises ProtocolError if the relay reports an
+        error'''
+        frame = await protocol.read_frame(self.reader)
+        if frame is None:
+            return None
+        elif frame.type == protocol.ERROR:
+            raise protocol.ProtocolError(frame.payload.decode('utf-8'))
+        return protocol.decode_message(frame.payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg = await self.receive()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+    async def close(self):
+        self.writer.close()
+        with contextlib.suppress(OSError):
+            await self.writer.wait_closed()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Relays a bus called ship to network clients')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6970)
+    parser.add_argument('--max-buffer', type=int, default=1024 * 1024,
+                        help='bytes that may wait to be sent to a client')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES,
+                        default=DROP_OLDEST)
+    args = parser.parse_args(argv)
+
+    relay = Relay({'ship': bus.Bus('ship')}, args.host, args.port,
+                  args.max_buffer, args.overflow)
+
+    def ready(relay):
+        print('Relaying on {} port {}'.format(relay.host, relay.port),
+              flush=True)
+    asyncio.run(relay.serve(ready))
+
+
+if __name__ == '__main__':
+    main()
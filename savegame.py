@@ -0,0 +1,568 @@
+'''Saves and loads ships and inventories.
+
+A save game is a snapshot file plus an append-only journal next to it
+(the snapshot's path with .journal on the end).
+
+The snapshot starts with a small JSON header describing where
+everything is, followed by columns of fixed-size values: for each
+component class, the name numbers and masses of its components, then
+which components are in the inventory, then the buses and the edges
+between them. Loading maps the file into memory and reads the columns
+in place, so a component only becomes an object when something asks for
+it.
+
+The journal records what changed since the snapshot, one record per
+change, and is replayed on top of it when loading.
+'''
+
+from array import array
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+
+import bus
+import cables
+import components
+from common import letterer, unletterer
+from inventory import Inventory
+
+MAGIC = b'SSBG'
+VERSION = 1
+# magic, version, reserved, header length
+_PREAMBLE = struct.Struct('<4sHHI')
+# opcode, payload length
+_RECORD = struct.Struct('<BI')
+
+# Journal opcodes
+NEW = 1  # a component was made: shop_name, number, mass, extras
+STORE = 2  # a component was put in the inventory: name
+DESTROY = 3  # a component was taken out of the inventory: name
+ATTACH = 4  # two buses were attached: name, name, cable or None
+DETACH = 5  # two buses were detached: name, name
+
+# Edge kinds
+_CHILD = 0
+_LINK = 1
+
+
+def journal_path(path):
+    '''Returns where the journal for the snapshot at path lives'''
+    return str(path) + '.journal'
+
+
+def _align(length):
+    return (length + 7) & ~7
+
+
+def _extras(component):
+    '''Returns the public attributes of a component that aren't stored
+    in their own column'''
+    return {k: v for k, v in vars(component).items()
+            if not k.startswith('_') and k not in ('name', 'mass')}
+
+
+def _number(component):
+    return unletterer(component.name.rpartition('-')[2])
+
+
+class _Writer:
+    '''Lays out the data sections of a snapshot'''
+
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+
+    def add(self, data):
+        '''Adds a section, returning its [offset, length]'''
+        data = bytes(data)
+        offset = self.length
+        self.chunks.append(data)
+        padding = _align(len(data)) - len(data)
+        self.chunks.append(bytes(padding))
+        self.length += len(data) + padding
+        return [offset, len(data)]
+
+    def add_strings(self, strings):
+        '''Adds a section of utf-8 strings and one of where each ends'''
+        ends, blob = array('Q'), bytearray()
+        for string in strings:
+            blob += string.encode('utf-8')
+            ends.append(len(blob))
+        return {'ends': self.add(ends), 'data': self.add(blob)}
+
+
+def _walk(roots):
+    '''Returns every bus connected to roots, each tree in breadth first
+    order from its root'''
+    seen, order = set(), []
+    pending = [root.root for root in roots]
+    while pending:
+        start = pending.pop()
+        if start in seen:
+            continue
+        seen.add(start)
+        tree = [start]
+        for node in tree:
+            for child in node.children:
+                seen.add(child)
+                tree.append(child)
+            pending.extend(linked.root for linked in node.links)
+        order.extend(tree)
+    return order
+
+
+def save(path, inventory=None, buses=(), extra=()):
+    '''Writes a snapshot of the inventory, every bus connected to buses,
+    and any extra components to path, and starts a new, empty journal.
+
+    Components with buses in the saved trees are saved along with them.
+    Every component must be a components.Component, and any public
+    attributes besides name and mass must be JSON serializable.
+    '''
+    members = [] if inventory is None else [
+        inventory.retrieve(name) for name in inventory.iter_contents()]
+    all_buses = _walk(buses)
+    bus_index = {b: i for i, b in enumerate(all_buses)}
+
+    # every component to save, grouped by class
+    owned_buses, owners = {}, []
+    for b in all_buses:
+        component = components.owner_of(b)
+        if component is not None:
+            owned_buses[id(component)] = bus_index[b]
+            owners.append(component)
+    by_class, seen = {}, set()
+    for component in [*members, *owners, *extra]:
+        if not isinstance(component, components.Component):
+            raise TypeError('Only components can be saved, not {!r}'
+                            .format(component))
+        if id(component) not in seen:
+            seen.add(id(component))
+            by_class.setdefault(type(component), []).append(component)
+
+    writer = _Writer()
+    header = {'classes': [], 'buses': None, 'edges': None,
+              'inventory': None}
+    global_index, base = {}, 0
+    for cls, group in by_class.items():
+        # sorted by number, so a name can be found with a binary search
+        numbered = sorted(zip(map(_number, group), range(len(group))))
+        group[:] = [group[row] for _, row in numbered]
+        entry = {
+            'shop_name': cls.shop_name,
+            'count': len(group),
+            'base': base,
+            'counter': cls._counter,
+            'numbers': writer.add(array('I', (n for n, _ in numbered))),
+            'masses': writer.add(array('d', (c.mass for c in group))),
+            'buses': writer.add(array(
+                'i', (owned_buses.get(id(c), -1) for c in group))),
+        }
+        extras = [_extras(c) for c in group]
+        if any(extras):
+            entry['extras'] = writer.add_strings(
+                json.dumps(e) if e else '' for e in extras)
+        header['classes'].append(entry)
+        for row, component in enumerate(group):
+            global_index[id(component)] = base + row
+        base += len(group)
+
+    header['inventory'] = writer.add(array(
+        'I', (global_index[id(item)] for item in members)))
+    header['buses'] = writer.add_strings(b.name for b in all_buses)
+
+    ends_a, ends_b, kinds = array('i'), array('i'), array('B')
+    # bandwidth, latency, buffer, burst; NaN bandwidth for no cable and
+    # NaN buffer for an unlimited one
+    wiring = array('d')
+    for b in all_buses:
+        here = bus_index[b]
+        edges = [(_CHILD, child) for child in b.children]
+        edges.extend((_LINK, linked) for linked in b.links
+                     if bus_index[linked] > here)
+        for kind, other in edges:
+            ends_a.append(here)
+            ends_b.append(bus_index[other])
+            kinds.append(kind)
+            cable = b.cables.get(other)
+            if cable is None:
+                wiring.extend((math.nan, 0, math.nan, 0))
+            else:
+                wiring.extend((
+                    cable.bandwidth, cable.latency,
+                    math.nan if cable.buffer is None else cable.buffer,
+                    cable.burst))
+    header['edges'] = {'count': len(kinds), 'a': writer.add(ends_a),
+                       'b': writer.add(ends_b), 'kinds': writer.add(kinds),
+                       'cables': writer.add(wiring)}
+
+    encoded = json.dumps(header).encode('utf-8')
+    preamble = _PREAMBLE.pack(MAGIC, VERSION, 0, len(encoded))
+    start = _align(len(preamble) + len(encoded))
+    tmp = str(path) + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(preamble)
+        f.write(encoded)
+        f.write(bytes(start - len(preamble) - len(encoded)))
+        for chunk in writer.chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+    # the snapshot now includes everything the old journal recorded
+    open(journal_path(path), 'wb').close()
+
+
+def _complete_length(path):
+    '''Returns how many bytes at the start of the journal at path are
+    whole records, reading only the record headers'''
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + _RECORD.size <= size:
+            f.seek(offset)
+            _, length = _RECORD.unpack(f.read(_RECORD.size))
+            if offset + _RECORD.size + length > size:
+                break
+            offset += _RECORD.size + length
+    return offset
+
+
+class Journal:
+    '''Appends changes made since the last snapshot to its journal.
+    Each record is flushed as it is written'''
+
+    def __init__(self, path):
+        path = journal_path(path)
+        self._file = open(path, 'ab')
+        # a record cut short by a crash would swallow the start of the
+        # next one written, so it is cut off before appending
+        end = _complete_length(path)
+        if end < self._file.tell():
+            self._file.truncate(end)
+
+    def _write(self, opcode, *args):
+        payload = json.dumps(args).encode('utf-8')
+        self._file.write(_RECORD.pack(opcode, len(payload)) + payload)
+        self._file.flush()
+
+    def new(self, component):
+        '''Records a component made since the snapshot'''
+        self._write(NEW, component.shop_name, _number(component),
+                    component.mass, _extras(component))
+
+    def store(self, component):
+        '''Records a component put into the inventory'''
+        self._write(STORE, component.name)
+
+    def destroy(self, name):
+        '''Records a component taken out of the inventory'''
+        self._write(DESTROY, name)
+
+    def attach(self, a, b, cable=None):
+        '''Records two buses being attached'''
+        self._write(ATTACH, a.name, b.name,
+                    None if cable is None else list(cable))
+
+    def detach(self, a, b):
+        '''Records two buses being detached'''
+        self._write(DETACH, a.name, b.name)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_journal(path):
+    '''Yields (opcode, args) for every complete record in the journal
+    for the snapshot at path. A record cut short by a crash ends it'''
+    try:
+        with open(journal_path(path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        opcode, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if offset + length > len(data):
+            return
+        yield opcode, json.loads(data[offset:offset + length])
+        offset += length
+
+
+class SaveGame:
+    '''A snapshot opened for reading, plus its journal.
+
+    Opening reads only the header. Components are made the first time
+    they are looked up, and the inventory and buses when asked for.
+    Component class modules must be imported before loading, so each
+    shop_name can be found.
+
+    resolve always gives the saved component, even in a process that
+    still has the one it was saved from. Once a saved component has
+    been made it also takes over its name in components.resolve, so
+    the loaded ship's buses lead to the loaded components.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._columns = {}
+        self._header = {'classes': []}
+        magic, version, _, length = _PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('{} is not a save game'.format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError('Save game version {} is not supported'
+                             .format(version))
+        header_end = _PREAMBLE.size + length
+        self._header = json.loads(self._map[_PREAMBLE.size:header_end])
+        self._data = _align(header_end)
+        self._made = {}
+        # components made by the journal, by name
+        self._journaled = {}
+        self._classes = {}
+        for entry in self._header['classes']:
+            cls = components._registry.get(entry['shop_name'])
+            if cls is None:
+                self.close()
+                raise ValueError('Unknown component type {!r}'.format(
+                    entry['shop_name']))
+            entry['class'] = cls
+            self._classes[entry['shop_name']] = entry
+            # new components must not reuse a saved component's name
+            cls._counter = max(cls._counter, entry['counter'])
+        self._journal = list(read_journal(path))
+        for opcode, args in self._journal:
+            if opcode == NEW:
+                self._new(*args)
+        self._buses = None
+        self._roots = None
+
+    def _column(self, section, fmt):
+        '''Returns a section of the file as a memoryview of fmt values'''
+        key = (section[0], fmt)
+        view = self._columns.get(key)
+        if view is None:
+            offset, length = section
+            start = self._data + offset
+            view = memoryview(self._map)[start:start + length].cast(fmt)
+            self._columns[key] = view
+        return view
+
+    def _string(self, strings, index):
+        '''Returns string number index from a section of strings'''
+        ends = self._column(strings['ends'], 'Q')
+        start = ends[index - 1] if index else 0
+        offset = self._data + strings['data'][0]
+        return self._map[offset + start:offset + ends[index]].decode('utf-8')
+
+    def _new(self, shop_name, number, mass, extras):
+        '''Makes a component recorded in the journal'''
+        cls = components._registry[shop_name]
+        cls._counter = max(cls._counter, number + 1)
+        component = cls.__new__(cls)
+        component.name = '{}-{}'.format(shop_name, letterer(number).upper())
+        component.mass = mass
+        vars(component).update(extras)
+        cls._register(number, [component])
+        self._journaled[component.name] = component
+
+    def __len__(self):
+        '''Returns how many components the snapshot holds'''
+        return sum(entry['count'] for entry in self._header['classes'])
+
+    def names(self):
+        '''Yields the name of every component in the snapshot without
+        making any of them'''
+        for entry in self._header['classes']:
+            template = entry['shop_name'] + '-{}'
+            for number in self._column(entry['numbers'], 'I'):
+                yield template.format(letterer(number).upper())
+
+    def _class_columns(self, entry):
+        '''Returns the numbers, masses and buses columns of a class'''
+        columns = entry.get('columns')
+        if columns is None:
+            columns = entry['columns'] = (
+                self._column(entry['numbers'], 'I'),
+                self._column(entry['masses'], 'd'),
+                self._column(entry['buses'], 'i'))
+        return columns
+
+    def _component(self, entry, row):
+        '''Makes (or returns the already made) component in row of a
+        class's columns'''
+        key = entry['base'] + row
+        component = self._made.get(key)
+        if component is not None:
+            return component
+        cls = entry['class']
+        numbers, masses, buses = self._class_columns(entry)
+        number = numbers[row]
+        component = cls.__new__(cls)
+        component.name = '{}-{}'.format(
+            cls.shop_name, letterer(number).upper())
+        component.mass = masses[row]
+        if 'extras' in entry:
+            extras = self._string(entry['extras'], row)
+            if extras:
+                vars(component).update(json.loads(extras))
+        bus_index = buses[row]
+        if bus_index >= 0:
+            component._bus = self._all_buses()[bus_index]
+        # replaces any live component with this name, see the docstring
+        cls._register(number, [component])
+        self._made[key] = component
+        return component
+
+    def component(self, index):
+        '''Returns the component at index, counting through the
+        snapshot class by class'''
+        for entry in self._header['classes']:
+            if entry['base'] <= index < entry['base'] + entry['count']:
+                return self._component(entry, index - entry['base'])
+        raise IndexError('SaveGame index out of range')
+
+    def resolve(self, name):
+        '''Returns the component called name as it was saved, from the
+        journal or the snapshot. Names the save doesn't have are looked
+        up with components.resolve, so anything made since still turns
+        up, and None is returned if that doesn't find it either'''
+        component = self._journaled.get(name)
+        if component is not None:
+            return component
+        shop_name, _, letters = name.rpartition('-')
+        entry = self._classes.get(shop_name)
+        if entry is not None:
+            try:
+                number = unletterer(letters)
+            except ValueError:
+                return None
+            numbers = self._class_columns(entry)[0]
+            row = bisect.bisect_left(numbers, number)
+            if row < len(numbers) and numbers[row] == number:
+                component = self._component(entry, row)
+                # unletterer reads 0 and 1 as o and l
+                return component if component.name == name else None
+        return components.resolve(name)
+
+    def _all_buses(self):
+        '''Makes every saved bus and wires them up as they were'''
+        if self._buses is not None:
+            return self._buses
+        strings = self._header['buses']
+        count = len(self._column(strings['ends'], 'Q'))
+        self._buses = [bus.Bus(self._string(strings, i))
+                       for i in range(count)]
+        edges = self._header['edges']
+        ends_a = self._column(edges['a'], 'i')
+        ends_b = self._column(edges['b'], 'i')
+        kinds = self._column(edges['kinds'], 'B')
+        wiring = self._column(edges['cables'], 'd')
+        children = {}
+        links = []
+        for edge in range(edges['count']):
+            a, b = self._buses[ends_a[edge]], self._buses[ends_b[edge]]
+            bandwidth, latency, buffer, burst = wiring[4 * edge:4 * edge + 4]
+            cable = None if math.isnan(bandwidth) else cables.Cable(
+                bandwidth, latency, None if math.isnan(buffer) else buffer,
+                burst)
+            if kinds[edge] == _CHILD:
+                children.setdefault(a, []).append((b, cable))
+            else:
+                links.append((a, b, cable))
+        # Buses were saved breadth first, so attaching from the bottom
+        # up means every parent is still a root when it gets its children
+        # and each attach_many only updates the parent itself
+        for parent in reversed(self._buses):
+            if parent in children:
+                parent.attach_many(child for child, _ in children[parent])
+                for child, cable in children[parent]:
+                    if cable is not None:
+                        parent._wire(child, cable)
+        for a, b, cable in links:
+            a.attach(b, cable)
+        return self._buses
+
+    def buses(self):
+        '''Returns the roots of the saved bus trees, with the journal's
+        attachments and detachments applied'''
+        if self._roots is not None:
+            return self._roots
+        all_buses = self._all_buses()
+        by_name = {}
+        for b in all_buses:
+            by_name.setdefault(b.name, b)
+        for opcode, args in self._journal:
+            if opcode in (ATTACH, DETACH):
+                a, b = (self._bus_named(by_name, name) for name in args[:2])
+                if opcode == ATTACH:
+                    a.attach(b, None if args[2] is None
+                             else cables.Cable(*args[2]))
+                else:
+                    a.detach(b)
+        self._roots = []
+        for b in by_name.values():
+            if b.root not in self._roots:
+                self._roots.append(b.root)
+        return self._roots
+
+    def _bus_named(self, by_name, name):
+        '''Finds a bus by name, making one for a component or on its own
+        if no saved bus has that name'''
+        if name not in by_name:
+            component = self.resolve(name)
+            by_name[name] = component.bus if component is not None \
+                else bus.Bus(name)
+        return by_name[name]
+
+    def inventory(self):
+        '''Returns an Inventory holding what was in the saved one, with
+        the journal applied'''
+        inventory = Inventory()
+        indexes = self._column(self._header['inventory'], 'I')
+        inventory.store_many(self.component(i) for i in indexes)
+        for opcode, args in self._journal:
+            if opcode == STORE:
+                component = self.resolve(args[0])
+                if component is None:
+                    raise ValueError(
+                        'The journal stores {!r}, which is not in the save '
+                        'game'.format(args[0]))
+                inventory.store(component)
+            elif opcode == DESTROY:
+                inventory.destroy(args[0])
+        return inventory
+
+    def close(self):
+        '''Releases the mapped file. Components already made stay
+        usable'''
+        for entry in self._header['classes']:
+            entry.pop('columns', None)
+        for view in self._columns.values():
+            view.release()
+        self._columns = {}
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load(path):
+    '''Opens the save game at path'''
+    return SaveGame(path)
@@ -0,0 +1,184 @@
+'''Timed events for things that happen over time in flight: guns
+cycling, shields recharging, repairs finishing.
+
+A Scheduler keeps a heap of timers ordered by when they are due, so
+scheduling is O(log n), and running jumps straight from one due timer
+to the next. A component with nothing scheduled costs nothing, however
+many ticks go by.
+
+Time is simulated. run(until) processes everything due up to until as
+fast as it can, which is what headless tests want, while run_realtime
+paces the same events against the wall clock, optionally sped up.
+'''
+
+import heapq
+import itertools
+import time
+
+
+class Timer:
+    '''A scheduled callback. Cancelling only marks it, and the scheduler
+    skips it when it comes up, so cancel is O(1)'''
+
+    __slots__ = ('scheduler', 'when', 'interval', 'callback', 'args',
+                 'cancelled', 'scheduled')
+
+    def __init__(self, scheduler, when, interval, callback, args):
+        self.scheduler = scheduler
+        self.when = when
+        # seconds between runs for a recurring timer, else None
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        # whether it is in the scheduler's heap
+        self.scheduled = False
+
+    def cancel(self):
+        '''Stops the timer from running again'''
+        if not self.cancelled:
+            self.cancelled = True
+            if self.scheduled:
+                self.scheduler._cancelled += 1
+                self.scheduler._compact()
+
+    def __repr__(self):
+        return '<Timer {}{} at {}{}>'.format(
+            getattr(self.callback, '__qualname__', self.callback), self.args,
+            self.when, ' cancelled' if self.cancelled else '')
+
+
+class Scheduler:
+    '''Runs callbacks at simulated times.
+
+    now is the simulated time in seconds. Callbacks run with now set to
+    the time they were due, in order of that time, and ones due at the
+    same time run in the order they were scheduled. They may schedule
+    and cancel timers themselves.
+    '''
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.processed = 0
+        self._timers = []
+        self._seq = itertools.count()
+        # cancelled timers still in the heap, see _compact
+        self._cancelled = 0
+
+    def __len__(self):
+        '''Returns how many timers are waiting to run'''
+        return len(self._timers) - self._cancelled
+
+    def call_at(self, when, callback, *args):
+        '''Runs callback(*args) at simulated time when and returns its
+        Timer'''
+        return self._push(Timer(self, when, None, callback, args))
+
+    def _push(self, timer):
+        timer.scheduled = True
+        heapq.heappush(self._timers, (timer.when, next(self._seq), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        '''Runs callback(*args) delay seconds from now'''
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args, start=None):
+        '''Runs callback(*args) every interval seconds, first at start
+        (default: one interval from now), until the Timer is cancelled.
+        Runs keep to the original schedule rather than drifting by how
+        late each one was'''
+        if interval <= 0:
+            raise ValueError('interval must be positive, not {}'.format(
+                interval))
+        when = self.now + interval if start is None else start
+        return self._push(Timer(self, when, interval, callback, args))
+
+    def cancel(self, timer):
+        '''Stops timer from running again'''
+        timer.cancel()
+
+    def _compact(self):
+        '''Rebuilds the heap without cancelled timers once they are most
+        of it, so cancelling lots of timers doesn't leak memory'''
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._timers):
+            for entry in self._timers:
+                if entry[2].cancelled:
+                    entry[2].scheduled = False
+            # in place, as run may be holding on to the list
+            self._timers[:] = [entry for entry in self._timers
+                               if not entry[2].cancelled]
+            heapq.heapify(self._timers)
+            self._cancelled = 0
+
+    def next_due(self):
+        '''Returns when the next timer is due, or None if none are'''
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)[2].scheduled = False
+            self._cancelled -= 1
+        return timers[0][0] if timers else None
+
+    def run(self, until=None):
+        '''Runs timers in time order until there are none left or the
+        next one is after until, then moves now to until. Returns how
+        many ran. With recurring timers, until is needed to stop'''
+        timers = self._timers
+        heappop, heappush = heapq.heappop, heapq.heappush
+        seq = self._seq
+        processed = 0
+        while timers and (until is None or timers[0][0] <= until):
+            when, _, timer = heappop(timers)
+            if timer.cancelled:
+                timer.scheduled = False
+                self._cancelled -= 1
+                continue
+            self.now = when
+            if timer.interval is not None:
+                # rescheduled first, so the callback can cancel it
+                timer.when = when + timer.interval
+                heappush(timers, (timer.when, next(seq), timer))
+            else:
+                timer.scheduled = False
+            timer.callback(*timer.args)
+            processed += 1
+        if until is not None and until > self.now:
+            self.now = until
+        self.processed += processed
+        return processed
+
+    def advance(self, seconds):
+        '''Runs everything due in the next seconds of simulated time'''
+        return self.run(self.now + seconds)
+
+    def run_realtime(self, seconds, speed=1.0, clock=time.monotonic,
+                     sleep=time.sleep):
+        '''Like advance, but waits for each timer to come due on the
+        wall clock, speed times faster than real time'''
+        start, origin = clock(), self.now
+        until = origin + seconds
+        processed = 0
+        while True:
+            due = self.next_due()
+            if due is None or due > until:
+                due = until
+            wait = (due - origin) / speed - (clock() - start)
+            if wait > 0:
+                sleep(wait)
+            processed += self.run(due)
+            if due >= until:
+                return processed
+
+    # Component helpers: callbacks that publish on a component's bus
+
+    def publish_later(self, component, delay, topic, fmt, *args):
+        '''Broadcasts a message on component's bus after delay seconds'''
+        return self.call_later(delay, component.bus.broadcast, topic, fmt,
+                               *args)
+
+    def publish_every(self, component, interval, topic, fmt, *args,
+                      start=None):
+        '''Broadcasts a message on component's bus every interval
+        seconds until the returned Timer is cancelled'''
+        return self.call_every(interval, component.bus.broadcast, topic,
+                               fmt, *args, start=start)
@@ -1,70 +1,211 @@
+'''The SpaceShip build server. Right now all it does is echo what each
+client sends it.
+
+Every connection is a coroutine on a single asyncio event loop rather
+than a thread, so one process can hold tens of thousands of idle
+players.
+'''
+
 __author__ = 'xXxH3LIOSxXx'
 
-from builtins import print
-import socket
-import threading
+import argparse
+import asyncio
+import contextlib
+import signal
 
-# Create a TCP/IP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+import protocol
 
-# Bind the socket to 6969
-server_address = ('localhost', 6969)
-print('\nSpaceShip build server starting up on %s port %s' % server_address)
-sock.bind(server_address)
+WELCOME = bytes('+++++++++++++++++++++++++++++++++++++++++++++++'
+                '\n++++++++++Welcome to SpaceShip build!++++++++++'
+                '\n+++++++++++++++++++++++++++++++++++++++++++++++'
+                '\n\nRight now all this server does is echo your input a '
+                'single time!'
+                '\nType something now to try it out...', 'UTF-8')
+IDLE = b'\nDisconnected: idle for too long\n'
+GOODBYE = b'\nServer shutting down, goodbye!\n'
 
-# Set queue depth for connections, not to be confused with allowed connections
-sock.listen(3)
-# Used to set threadID
-perm_id = 0
-# Used to store all client connections
-threads = []
 
-# Alright, lets do this!  Time to use the more recent Threading library...
-# Overloading the threading class for our own purposes
+class GameServer:
+    '''Accepts players and echoes what they send.
 
+    A client leaves by sending /q, by closing its end, or by staying
+    quiet for idle_timeout seconds. shutdown stops accepting, tells
+    every client goodbye and waits a little for them to go.
+    '''
 
-class ClientThread (threading.Thread):
-    def __init__(self, thread_id, client_connection):
-        threading.Thread.__init__(self)
-        self.thread_id = thread_id
-        self.client_connection = client_connection
+    def __init__(self, host='localhost', port=6969, idle_timeout=300,
+                 motd=WELCOME):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.motd = motd
+        self.accepted = 0
+        self._writers = set()
+        self._tasks = set()
+        self._server = None
 
-    def run(self):
-        new_connection(self.client_connection)
+    async def start(self):
+        '''Starts listening. With port 0, self.port is set to the port
+        the system picked'''
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
 
+    @property
+    def connections(self):
+        '''How many clients are connected'''
+        return len(self._writers)
 
-def new_connection(client_connection):
-        # Send MOTD when client first connects
-        welcome = bytes('+++++++++++++++++++++++++++++++++++++++++++++++'
-                        '\n++++++++++Welcome to SpaceShip build!++++++++++'
-                        '\n+++++++++++++++++++++++++++++++++++++++++++++++'
-                        '\n\nRight now all this server does is echo your input a single time!'
-                        '\nType something now to try it out...', 'UTF-8')
-        client_connection.send(welcome)
+    def reply(self, data):
+        '''Returns the response to data from a client'''
+        return data
 
+    async def _converse(self, reader, writer):
+        '''Talks to one client until it leaves'''
+        writer.write(self.motd)
+        await writer.drain()
         while True:
-            # Receive data from the client
-            data = client_connection.recv(4096)
-            reply = data
-            if data.decode("utf-8") == '/q':
-                print("\nClient disconnected from, ", client_connection)
-                client_connection.close()
+            try:
+                data = await asyncio.wait_for(
+                    reader.read(4096), self.idle_timeout)
+            except asyncio.TimeoutError:
+                writer.write(IDLE)
                 break
+            # an empty read means the client hung up
+            if not data or data.strip() == b'/q':
+                break
+            writer.write(self.reply(data))
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.accepted += 1
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self._writers.add(writer)
+        try:
+            await self._converse(reader, writer)
+        except OSError:
+            # reset by the client, or dropped at shutdown
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._tasks.discard(task)
+            writer.close()
+            with contextlib.suppress(OSError):
+                await writer.wait_closed()
+
+    async def shutdown(self, grace=5):
+        '''Stops accepting, says goodbye to every client and gives them
+        grace seconds to leave before dropping them'''
+        if self._server is not None:
+            self._server.close()
+        self._say_goodbye()
+        tasks = list(self._tasks)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._server is not None:
+            # on newer Pythons this also waits for every connection
+            await self._server.wait_closed()
+
+    def _say_goodbye(self):
+        '''Tells every client the server is going, at the start of
+        shutdown'''
+        for writer in list(self._writers):
+            with contextlib.suppress(OSError, RuntimeError):
+                writer.write(GOODBYE)
+                writer.write_eof()
+
+    async def serve(self, ready=None):
+        '''Runs until SIGINT or SIGTERM, then shuts down. ready, if
+        given, is called once the server is listening'''
+        await self.start()
+        if ready is not None:
+            ready(self)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(signum, stop.set)
+        await stop.wait()
+        await self.shutdown()
+
+
+class FramedGameServer(GameServer):
+    '''A GameServer that speaks the framed protocol in protocol.py.
+
+    Each TEXT or MESSAGE frame is answered with a frame of the same
+    type, in order, so clients may pipeline requests. A TEXT frame of
+    /q ends the session, and unknown frame types get an ERROR frame.
+    '''
+
+    def reply_frame(self, frame):
+        '''Returns the (type, payload) response to a frame'''
+        if frame.type == protocol.TEXT:
+            return protocol.TEXT, self.reply(frame.payload)
+        elif frame.type == protocol.MESSAGE:
+            # decoded to check it's well formed, then echoed as is
+            protocol.decode_message(frame.payload)
+            return protocol.MESSAGE, frame.payload
+        return protocol.ERROR, 'Unknown frame type {}'.format(
+            frame.type).encode('utf-8')
+
+    async def _converse(self, reader, writer):
+        protocol.write_frame(writer, protocol.TEXT, self.motd)
+        await writer.drain()
+        decoder = protocol.FrameDecoder()
+        while True:
+            try:
+                data = await asyncio.wait_for(
+                    reader.read(65536), self.idle_timeout)
+            except asyncio.TimeoutError:
+                protocol.write_frame(writer, protocol.ERROR, IDLE.strip())
+                return
+            if not data:
+                return
+            try:
+                frames = decoder.feed(data)
+            except protocol.ProtocolError as e:
+                protocol.write_frame(
+                    writer, protocol.ERROR, str(e).encode('utf-8'))
+                return
+            # everything pipelined in this read is answered with a
+            # single write
+            responses = []
+            for frame in frames:
+                if frame.type == protocol.TEXT and \
+                        frame.payload.strip() == b'/q':
+                    writer.write(b''.join(responses))
+                    return
+                try:
+                    response = self.reply_frame(frame)
+                except protocol.ProtocolError as e:
+                    response = protocol.ERROR, str(e).encode('utf-8')
+                responses.append(protocol.encode_frame(*response))
+            writer.write(b''.join(responses))
+            await writer.drain()
+
 
-            # Send response
-            client_connection.send(reply)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SpaceShip build server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6969)
+    parser.add_argument('--idle-timeout', type=float, default=300,
+                        help='seconds a client may send nothing for')
+    parser.add_argument('--framed', action='store_true',
+                        help='speak the framed protocol in protocol.py')
+    args = parser.parse_args(argv)
+    server_class = FramedGameServer if args.framed else GameServer
+    server = server_class(args.host, args.port, args.idle_timeout)
 
-while True:
-    # Wait for a connection
-    # Note: .accept() returns a connection between server/client and the clients IP to work with
-    # This return is a DIFFERENT socket on another port defined by the kernel, it also is a blocking call
-    print('\nWaiting for connections...')
-    connection, client_address = sock.accept()
+    def ready(server):
+        print('SpaceShip build server listening on {} port {}'.format(
+            server.host, server.port), flush=True)
+    asyncio.run(server.serve(ready))
+    print('Server stopped after {} connections'.format(server.accepted))
 
-    print('\nClient connecting from', client_address)
 
-    # Split off new threads for each connection
-    threads.append(ClientThread(perm_id, connection))
-    threads[perm_id].start()
-    perm_id += 1
-    #print('\nHere are the threads I currently have: %s' % threads)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
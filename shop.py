@@ -15,6 +15,13 @@ class Shop:
         itemclass = self._inv.get(type_name)
         return itemclass if itemclass is None else itemclass()
 
+    def buy_many(self, type_name, count):
+        '''Buy count of an item from the store at once. Returns a list
+        of the items, or None if the store doesn't have that item'''
+        itemclass = self._inv.get(type_name)
+        return itemclass if itemclass is None else \
+            itemclass.create_many(count)
+
 
 if __name__ == '__main__':
     class Raygun:
@@ -0,0 +1,243 @@
+'''Power and heat for a whole ship, stepped with NumPy.
+
+compile_ship turns components and the buses wiring them together into
+flat arrays, one row per component, and the bus tree and links into an
+edge list (a sparse adjacency matrix in COO form). Every tick is then a
+handful of array operations over the whole ship, with no Python loop
+over components.
+
+The model, all in SI units:
+
+* Components connected through buses share a power grid. Each grid's
+  supply is the sum of its components' power_output, and if that falls
+  short of the sum of their power_draw every consumer on it gets the
+  same fraction of what it asked for.
+* A component turns heat_output watts into heat at full load (its
+  power_draw by default), scaled by how much power it actually got.
+  Suppliers heat up in proportion to how hard they are being run.
+* Heat flows along every bus connection in proportion to the
+  temperature difference, and cooling watts per kelvin are radiated
+  away towards ambient.
+
+Components that don't set these attributes draw and make nothing, and
+have a thermal_mass of 1000 J/K per kilogram.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+# Where temperatures start and what cooling radiates towards, in kelvin
+AMBIENT = 293.15
+# W/K carried by one bus connection unless a component says otherwise
+CONDUCTANCE = 1.0
+# J/K per kilogram for components without a thermal_mass
+SPECIFIC_HEAT = 1000.0
+
+Edges = namedtuple('Edges', 'rows cols conductance')
+Edges.__doc__ = '''A sparse adjacency matrix in COO form: heat flows
+between components rows[i] and cols[i] with conductance[i] W/K'''
+
+
+def _attribute(components, name, default):
+    return np.fromiter((getattr(c, name, default) for c in components),
+                       dtype=np.float64, count=len(components))
+
+
+def compile_ship(components, ambient=AMBIENT, conductance=CONDUCTANCE):
+    '''Returns a ShipModel for components, connected the way their buses
+    are. Buses that lead to components not in the list are ignored'''
+    components = list(components)
+    index = {}
+    for i, component in enumerate(components):
+        # components whose bus was never made aren't wired to anything
+        node = vars(component).get('_bus')
+        if node is not None:
+            index[node] = i
+    rows, cols = [], []
+    for node, i in index.items():
+        j = index.get(node.parent)
+        if j is not None:
+            rows.append(i)
+            cols.append(j)
+        for linked in node.links:
+            # each link is listed on both buses, only keep one
+            j = index.get(linked)
+            if j is not None and i < j:
+                rows.append(i)
+                cols.append(j)
+    rows = np.array(rows, dtype=np.intp)
+    cols = np.array(cols, dtype=np.intp)
+    own = _attribute(components, 'conductance', conductance)
+    # a connection conducts no better than its worse end
+    edges = Edges(rows, cols, np.minimum(own[rows], own[cols]))
+    masses = _attribute(components, 'mass', 1.0)
+    thermal_mass = np.fromiter(
+        (getattr(c, 'thermal_mass', mass * SPECIFIC_HEAT)
+         for c, mass in zip(components, masses)),
+        dtype=np.float64, count=len(components))
+    draw = _attribute(components, 'power_draw', 0.0)
+    heat = np.fromiter(
+        (getattr(c, 'heat_output', d) for c, d in zip(components, draw)),
+        dtype=np.float64, count=len(components))
+    return ShipModel(
+        [c.name for c in components], edges,
+        power_output=_attribute(components, 'power_output', 0.0),
+        power_draw=draw, heat_output=heat,
+        cooling=_attribute(components, 'cooling', 0.0),
+        thermal_mass=thermal_mass, ambient=ambient)
+
+
+def _grids(count, edges):
+    '''Returns which grid each component is on: the connected components
+    of the adjacency, labelled 0 upwards'''
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j in zip(edges.rows.tolist(), edges.cols.tolist()):
+        a, b = find(i), find(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    roots = np.array([find(i) for i in range(count)], dtype=np.intp)
+    return np.unique(roots, return_inverse=True)[1].reshape(count)
+
+
+class ShipModel:
+    '''The arrays for one ship, and its state as it is stepped.
+
+    load holds how hard each component is being asked to work, from 0
+    (off) to 1 (full), and can be changed between steps, for instance
+    to fire the guns. The other arrays are fixed once compiled. After
+    each step, satisfaction holds the fraction of its demand each
+    component's grid could meet, and temperature each component's
+    temperature.
+    '''
+
+    def __init__(self, names, edges, power_output, power_draw,
+                 heat_output, cooling, thermal_mass, ambient=AMBIENT):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        count = len(self.names)
+        self.edges = edges
+        self.power_output = power_output
+        self.power_draw = power_draw
+        self.heat_output = heat_output
+        self.cooling = cooling
+        self.thermal_mass = thermal_mass
+        self.ambient = ambient
+        self.grid = _grids(count, edges)
+        self.grid_count = int(self.grid.max()) + 1 if count else 0
+        self._supplier = power_output > 0
+        # each connection listed once from each end, so the heat flowing
+        # into every component is one weighted bincount over these
+        self._targets = np.concatenate((edges.rows, edges.cols))
+        self._sources = np.concatenate((edges.cols, edges.rows))
+        self._conductance = np.concatenate((edges.conductance,
+                                            edges.conductance))
+        self._connected = np.bincount(self._targets, self._conductance,
+                                      minlength=count)
+        self._weights_for = None
+        self.reset()
+        # the heat each component can shed per kelvin, through its
+        # connections and to space, bounds the stable timestep
+        shed = cooling + self._connected
+        rate = shed / thermal_mass
+        self.max_step = 0.5 / rate.max() if count and rate.max() > 0 \
+            else float('inf')
+
+    def __len__(self):
+        return len(self.names)
+
+    def reset(self):
+        '''Puts everything back to full load at ambient temperature'''
+        count = len(self.names)
+        self.load = np.ones(count)
+        self.satisfaction = np.ones(count)
+        self.temperature = np.full(count, float(self.ambient))
+        self.time = 0.0
+        self._terms_for = None
+
+    def power(self):
+        '''Works out each grid's supply and demand for the current load,
+        and returns the fraction of full load each component runs at'''
+        demand = self.power_draw * self.load
+        supply = self.power_output * self.load
+        grid_demand = np.bincount(self.grid, demand,
+                                  minlength=self.grid_count)
+        grid_supply = np.bincount(self.grid, supply,
+                                  minlength=self.grid_count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            met = np.minimum(1.0, grid_supply / grid_demand)
+            used = np.minimum(1.0, grid_demand / grid_supply)
+        met[grid_demand == 0] = 1.0
+        used[grid_supply == 0] = 0.0
+        self.satisfaction = met[self.grid]
+        return self.load * np.where(self._supplier, used[self.grid],
+                                    self.satisfaction)
+
+    def _terms(self, h):
+        '''Returns what each h second step multiplies temperatures by,
+        what it adds to them, and how much each connection's source
+        temperature adds to its target. Power only has to be worked out
+        again when the load has changed'''
+        rate = h / self.thermal_mass
+        if self._weights_for is None or self._weights_for[0] != h:
+            self._weights_for = (
+                h, self._conductance * rate[self._targets])
+        if self._terms_for is None or self._terms_for[0] != h or \
+                not np.array_equal(self._terms_for[1], self.load):
+            generated = self.heat_output * self.power()
+            # heat flowing out along connections is folded in here, so
+            # a step only has to add up what flows in
+            self._terms_cache = (
+                1 - rate * (self.cooling + self._connected),
+                rate * (generated + self.cooling * self.ambient))
+            self._terms_for = (h, self.load.copy())
+        return self._terms_cache + (self._weights_for[1],)
+
+    def step(self, dt):
+        '''Advances the ship by dt seconds, in smaller steps if dt is too
+        long for heat flow to stay stable'''
+        steps = max(1, int(np.ceil(dt / self.max_step)))
+        keep, gain, weights = self._terms(dt / steps)
+        targets, sources = self._targets, self._sources
+        count = len(self)
+        # with no connections at all no heat flows between components
+        connected = len(targets) > 0
+        temperature = self.temperature
+        for _ in range(steps):
+            stepped = temperature * keep
+            stepped += gain
+            if connected:
+                stepped += np.bincount(
+                    targets, weights * temperature[sources], count)
+            temperature = stepped
+        self.temperature = temperature
+        self.time += dt
+
+    def run(self, ticks, dt):
+        '''Steps ticks times'''
+        for _ in range(ticks):
+            self.step(dt)
+
+    def temperature_of(self, name):
+        return float(self.temperature[self.index[name]])
+
+    def hottest(self, count=10):
+        '''Returns (name, kelvin) for the count hottest components'''
+        count = min(count, len(self))
+        if not count:
+            return []
+        top = np.argpartition(self.temperature, -count)[-count:]
+        top = top[np.argsort(self.temperature[top])[::-1]]
+        return [(self.names[i], float(self.temperature[i])) for i in top]
+
+    def underpowered(self):
+        '''Returns the names of components getting less power than they
+        asked for in the last step'''
+        short = (self.satisfaction < 1) & (self.power_draw * self.load > 0)
+        return [self.names[i] for i in np.flatnonzero(short)]
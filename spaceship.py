@@ -1,9 +1,45 @@
+import argparse
+import sys
+
 import commandline
 
 
-def main():
-    cmd = commandline.SpaceshipCommand('spaceship-terminal')
-    cmd.cmdloop()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build spaceships from the terminal')
+    parser.add_argument(
+        '--script', metavar='FILE',
+        help='run the commands in FILE (- for stdin) instead of '
+        'prompting for them; piped stdin is run the same way')
+    parser.add_argument(
+        '--quiet', action='store_true',
+        help="don't print a message for every successful action")
+    parser.add_argument(
+        '--no-timings', dest='timings', action='store_false',
+        help="don't print how long each command took after a script")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cmd = commandline.SpaceshipCommand('spaceship-terminal', quiet=args.quiet)
+    if args.script is None and sys.stdin.isatty():
+        cmd.cmdloop()
+        return 0
+    if args.script in (None, '-'):
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.script) as f:
+            lines = f.read().splitlines()
+    try:
+        timings = cmd.run_batch(lines)
+    except commandline.ScriptError as e:
+        print('Script failed at {}: {!r}'.format(e, e.__cause__),
+              file=sys.stderr)
+        return 1
+    if args.timings:
+        print(commandline.format_timings(timings), file=sys.stderr)
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,75 @@
+'''Tests for asyncbus.py'''
+
+import asyncio
+
+import asyncbus
+import bus
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_coroutine_subscribers_receive_in_order():
+    async def scenario():
+        root, child = asyncbus.AsyncBus('root'), asyncbus.AsyncBus('child')
+        root.attach(child)
+        received = []
+
+        async def subscriber(msg):
+            await asyncio.sleep(0)
+            received.append(msg.message)
+        subscription = root.subscribe('sensor', subscriber)
+        for i in range(100):
+            await child.broadcast('sensor.heat', '{}', i)
+        await subscription.join()
+        return received
+
+    assert run(scenario()) == [str(i) for i in range(100)]
+
+
+def test_slow_subscriber_applies_backpressure():
+    async def scenario():
+        b = asyncbus.AsyncBus('root', maxsize=2)
+        release = asyncio.Event()
+
+        async def slow(msg):
+            await release.wait()
+        subscription = b.subscribe('', slow)
+        sent = 0
+
+        async def sender():
+            nonlocal sent
+            for i in range(10):
+                await b.broadcast('ping', '{}', i)
+                sent += 1
+        task = asyncio.ensure_future(sender())
+        await asyncio.sleep(0.01)
+        blocked_at = sent
+        release.set()
+        await task
+        await subscription.join()
+        return blocked_at, subscription.queue.qsize()
+
+    blocked_at, left = run(scenario())
+    # one message being handled plus two queued
+    assert blocked_at == 3
+    assert left == 0
+
+
+def test_mixed_tree_and_batches():
+    async def scenario():
+        root = asyncbus.AsyncBus('root')
+        plain = bus.Bus('plain')
+        root.attach(plain)
+        batches = []
+        subscription = root.subscribe('sensor', batches.append, batch=True)
+        await root.broadcast_many([('sensor.a', '1'), ('sensor.b', '2')])
+        plain.broadcast('sensor.c', '3')
+        async with root.batch() as batch:
+            batch.broadcast('sensor.d', '{}', 4)
+        await subscription.join()
+        assert root.unsubscribe('sensor', batches.append) is True
+        return [[m.message for m in msgs] for msgs in batches]
+
+    assert run(scenario()) == [['1', '2'], ['3'], ['4']]
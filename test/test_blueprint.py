@@ -0,0 +1,74 @@
+'''Tests for blueprint.py'''
+
+import pytest
+
+import bus
+import cables
+import components as C
+from blueprint import Blueprint
+
+
+class Turret(C.Component):
+    def __init__(self, barrels=2):
+        self.barrels = barrels
+        self.ammo = []
+        super().__init__()
+
+
+class Mount(C.Component):
+    pass
+
+
+def build_turret():
+    mount = Mount()
+    left, right = Turret(), Turret(barrels=4)
+    cable = cables.Cable(bandwidth=100, latency=0.1)
+    mount.bus.attach(left.bus, cable)
+    mount.bus.attach(right.bus)
+    left.bus.attach(right.bus)
+    return mount, cable
+
+
+def test_stamped_copies_match_the_original():
+    mount, cable = build_turret()
+    blueprint = Blueprint.capture(mount)
+    assert len(blueprint) == 3
+
+    messages = []
+    hub = bus.Bus('hub')
+    hub.subscribe('bus', messages.append)
+    first, second = blueprint.stamp(2, attach_to=hub)
+
+    assert [first.name, second.name] == ['mount-B', 'mount-C']
+    left, right = (C.resolve(b.name) for b in first.bus.children)
+    assert (left.name, right.name) == ('turret-C', 'turret-D')
+    assert (left.barrels, right.barrels) == (2, 4)
+    assert C.resolve('turret-F').bus.parent is second.bus
+    assert first.bus.cables[left.bus] == cable
+    assert right.bus in left.bus.links
+    assert first.bus.child_count == 2 and hub.child_count == 6
+    # mutable attributes aren't shared between copies
+    left.ammo.append('shell')
+    assert C.resolve('turret-E').ammo == []
+    # one notice for attaching both copies, none for building them
+    assert len(messages) == 1
+
+    # the next component bought continues after the stamped names
+    assert Turret().name == 'turret-G'
+
+
+def test_stamped_buses_route_like_attached_ones():
+    mount, _ = build_turret()
+    [copy] = Blueprint.capture(mount).stamp()
+    received = []
+    C.resolve(copy.bus.children[1].name).bus.subscribe('fire', received.append)
+    copy.bus.broadcast('fire', 'now')
+    copy.bus.children[0].broadcast('fire', 'again')
+    assert [msg.message for msg in received] == ['now', 'again']
+
+
+def test_capture_needs_component_buses():
+    mount = Mount()
+    mount.bus.attach(bus.Bus('loose'))
+    with pytest.raises(ValueError):
+        Blueprint.capture(mount)
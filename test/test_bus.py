@@ -0,0 +1,349 @@
+'''Tests for bus.py'''
+
+import bus
+
+
+def collector():
+    received = []
+
+    def subscriber(msg):
+        received.append(msg)
+    subscriber.received = received
+    return subscriber
+
+
+def test_topic_trie_matches_whole_segments():
+    trie = bus.TopicTrie()
+    trie.add('guns', 'guns')
+    trie.add('guns.all', 'guns.all')
+    trie.add('', 'everything')
+    trie.add('gun', 'gun')
+
+    assert trie.match('guns.all.fire') == ['everything', 'guns', 'guns.all']
+    assert trie.match('gunship') == ['everything']
+    assert trie.match('') == ['everything']
+
+
+def test_topic_trie_remove_prunes():
+    trie = bus.TopicTrie()
+    trie.add('a.b.c', 1)
+    assert trie.remove('a.b.c', 1) is True
+    assert trie.remove('a.b.c', 1) is False
+    assert trie.remove('x', 1) is False
+    assert not trie
+
+
+def test_multiple_subscribers_per_filter():
+    b = bus.Bus('root')
+    first, second = collector(), collector()
+    b.subscribe('guns', first)
+    b.subscribe('guns', second)
+    b.broadcast('guns.fire', 'pew')
+
+    assert [m.message for m in first.received] == ['pew']
+    assert [m.message for m in second.received] == ['pew']
+
+    assert b.unsubscribe('guns', first) is True
+    b.broadcast('guns.fire', 'pew pew')
+    assert len(first.received) == 1
+    assert len(second.received) == 2
+
+
+def test_broadcast_reaches_whole_tree_once():
+    root, left, right, leaf = (bus.Bus(n) for n in
+                               ('root', 'left', 'right', 'leaf'))
+    root.add_child(left)
+    root.add_child(right)
+    left.add_child(leaf)
+    subs = {}
+    for b in (root, left, right, leaf):
+        subs[b.name] = collector()
+        b.subscribe('ping', subs[b.name])
+
+    leaf.broadcast('ping', 'hello {}', 'world')
+
+    for name, sub in subs.items():
+        assert [m.message for m in sub.received] == ['hello world'], name
+
+
+def test_similar_sibling_names_both_receive():
+    root, short, longer = bus.Bus('root'), bus.Bus('gun'), bus.Bus('gun-2')
+    root.add_child(short)
+    root.add_child(longer)
+    sub = collector()
+    short.subscribe('', sub)
+
+    longer.broadcast('ping', 'hi')
+
+    assert len(sub.received) == 1
+
+
+def test_paths_and_containment_follow_topology():
+    root, mid, leaf = bus.Bus('root'), bus.Bus('mid'), bus.Bus('leaf')
+    root.add_child(mid)
+    mid.add_child(leaf)
+
+    assert str(leaf.path) == 'root/mid/leaf'
+    assert leaf.depth == 2
+    assert root.contains(leaf) and mid.contains(leaf)
+    assert not leaf.contains(mid)
+
+    root.remove_child(mid)
+    assert str(leaf.path) == 'mid/leaf'
+    assert not root.contains(leaf)
+    assert mid.contains(leaf)
+
+
+def test_tree_index_is_only_valid_once_finished():
+    seen = []
+
+    class Watched(list):
+        # the numbering walk reverses each bus's children as it goes
+        def __reversed__(self):
+            seen.append(mid._tree.valid)
+            return super().__reversed__()
+
+    root, mid, leaf = bus.Bus('root'), bus.Bus('mid'), bus.Bus('leaf')
+    root.add_child(mid)
+    mid.add_child(leaf)
+    mid.children = Watched(mid.children)
+
+    assert root.contains(leaf)
+    assert seen == [False]
+    assert mid._tree.valid
+
+
+def test_moving_a_subtree_only_refreshes_its_paths():
+    root, a, b, a1 = (bus.Bus(n) for n in ('root', 'a', 'b', 'a1'))
+    root.add_child(a)
+    root.add_child(b)
+    a.add_child(a1)
+    b_path = b.path
+    assert str(a1.path) == 'root/a/a1'
+
+    a.remove_child(a1)
+    b.add_child(a1)
+
+    assert str(a1.path) == 'root/b/a1'
+    # the rest of the tree kept its cached paths
+    assert b._path is b_path and a._path is not None
+
+
+def test_delivery_order_matches_tree_walk():
+    root, a, b, a1 = (bus.Bus(n) for n in ('root', 'a', 'b', 'a1'))
+    root.add_child(a)
+    root.add_child(b)
+    a.add_child(a1)
+    order = []
+    for node in (root, a, b, a1):
+        node.subscribe('', lambda msg, name=node.name: order.append(name))
+
+    a.broadcast('ping', 'hi')
+
+    assert order == ['a', 'a1', 'root', 'b']
+
+
+def test_routes_follow_topology_changes():
+    root, child = bus.Bus('root'), bus.Bus('child')
+    sub = collector()
+    root.subscribe('ping', sub)
+    child.broadcast('ping', 'alone')
+    root.add_child(child)
+    child.broadcast('ping', 'attached')
+    root.remove_child(child)
+    child.broadcast('ping', 'detached')
+
+    assert [m.message for m in sub.received] == ['attached']
+
+
+def test_deep_chain_does_not_recurse():
+    chain = [bus.Bus('link-{}'.format(i)) for i in range(2000)]
+    for parent, child in zip(chain, chain[1:]):
+        parent.add_child(child)
+    sub = collector()
+    chain[0].subscribe('', sub)
+
+    chain[-1].broadcast('ping', 'deep')
+
+    assert len(sub.received) == 1
+
+
+def test_uninterested_subtrees_are_pruned():
+    root, a, b = bus.Bus('root'), bus.Bus('a'), bus.Bus('b')
+    root.add_child(a)
+    root.add_child(b)
+    sub = collector()
+    b.subscribe('guns', sub)
+
+    assert a._route('guns.fire') == (sub,)
+    assert a._route('shields.up') == ()
+    assert a._compile_route('guns.fire') == (sub,)
+    assert root._subtree_filters == {'guns': 1}
+
+    root.remove_child(b)
+    assert root._subtree_filters == {}
+    assert a._route('guns.fire') == ()
+
+
+def test_route_cache_is_bounded():
+    root, child = bus.Bus('root'), bus.Bus('child')
+    root.add_child(child)
+    sub = collector()
+    root.subscribe('guns', sub)
+
+    for i in range(100000):
+        child.broadcast('guns.{}'.format(i), 'fire')
+
+    assert len(sub.received) == 100000
+    assert len(child._routes) <= bus.ROUTE_CACHE_SIZE
+    # every guns topic shares the route compiled for the filter
+    assert list(child._filter_routes) == ['guns']
+
+
+def test_other_trees_keep_their_routes():
+    here, there = bus.Bus('here'), bus.Bus('there')
+    sub = collector()
+    here.subscribe('guns', sub)
+    route = here._route('guns.fire')
+
+    other = collector()
+    there.subscribe('guns', other)
+    there.add_child(bus.Bus('elsewhere'))
+    there.unsubscribe('guns', other)
+
+    assert here._routes_version == here._routing.version
+    assert here._route('guns.fire') is route
+
+
+def test_formatting_deferred_without_subscribers():
+    class Explodes:
+        def __format__(self, spec):
+            raise AssertionError('formatted a message nobody receives')
+
+    b = bus.Bus('root')
+    b.broadcast('bus.debug', '{}', Explodes())
+
+
+def test_broadcast_many_batches_and_orders():
+    root, child = bus.Bus('root'), bus.Bus('child')
+    root.add_child(child)
+    single, batched = collector(), collector()
+    root.subscribe('', single)
+    root.subscribe('guns', batched, batch=True)
+
+    child.broadcast_many([('guns.fire', '1'), ('shields.up', '2'),
+                          ('guns.fire', '3')])
+
+    assert [m.message for m in single.received] == ['1', '2', '3']
+    assert len(batched.received) == 1
+    assert [m.message for m in batched.received[0]] == ['1', '3']
+
+    child.broadcast('guns.fire', '4')
+    assert [m.message for m in batched.received[1]] == ['4']
+
+    assert root.unsubscribe('guns', batched) is True
+
+
+def test_batch_context_manager():
+    b = bus.Bus('root')
+    sub = collector()
+    b.subscribe('sensor', sub, batch=True)
+
+    with b.batch() as batch:
+        batch.broadcast('sensor.heat', '{} K', 300)
+        batch.broadcast('sensor.heat', '{} K', 310)
+        batch.broadcast('nobody.listens', '{}', 0)
+        assert sub.received == []
+
+    assert [m.message for m in sub.received[0]] == ['300 K', '310 K']
+
+
+def ring(size):
+    '''Buses attached in a ring, with one redundant link closing it'''
+    buses = [bus.Bus('ring-{}'.format(i)) for i in range(size)]
+    for a, b in zip(buses, buses[1:] + buses[:1]):
+        a.attach(b)
+    return buses
+
+
+def test_redundant_links_deliver_once():
+    buses = ring(5)
+    subs = [collector() for _ in buses]
+    for b, sub in zip(buses, subs):
+        b.subscribe('ping', sub)
+
+    buses[2].broadcast('ping', 'hi')
+
+    assert [len(sub.received) for sub in subs] == [1] * 5
+    ids = {sub.received[0].id for sub in subs}
+    assert len(ids) == 1
+
+
+def test_detaching_tree_edge_reroutes_through_link():
+    buses = ring(4)
+    sub = collector()
+    buses[0].subscribe('engines', sub)
+    # cut every tree edge in turn; the ring link keeps things connected
+    for a, b in zip(buses, buses[1:]):
+        if b in a.children or a in b.children:
+            a.detach(b)
+            break
+    assert sum(len(b.links) for b in buses) == 0
+    for b in buses:
+        b.broadcast('engines.status', 'ok')
+
+    assert len(sub.received) == 4
+
+
+def test_attach_between_two_trees_reroots_smaller():
+    big = [bus.Bus('big-{}'.format(i)) for i in range(4)]
+    small = [bus.Bus('small-{}'.format(i)) for i in range(2)]
+    big[0].add_child(big[1])
+    big[0].add_child(big[2])
+    big[1].add_child(big[3])
+    small[0].add_child(small[1])
+    early = collector()
+    small[0].subscribe('x', early)
+
+    small[1].attach(big[3])
+
+    assert small[1].parent is big[3]
+    assert small[0].parent is small[1]
+    assert small[0].root is big[0]
+    sub = collector()
+    big[2].subscribe('', sub)
+    small[0].broadcast('ping', 'hi')
+    assert len(sub.received) == 1
+    big[2].broadcast('x', 'hi')
+    assert len(early.received) == 1
+    assert big[0]._subtree_filters == {'': 1, 'x': 1}
+
+
+def test_subtree_sizes_track_topology():
+    root, a, b, c = (bus.Bus(n) for n in ('root', 'a', 'b', 'c'))
+    a.add_child(b)
+    root.attach_many([a, c])
+    assert root.child_count == 3
+    assert a.child_count == 1
+    assert b.root is root and b.depth == 2
+
+    root.remove_child(a)
+    assert root.child_count == 1
+    assert b.root is a and b.depth == 1
+
+    b.attach(c)  # both have parents now: a's tree is re-rooted at b
+    assert root.child_count == 3
+    assert b.child_count == 1 and a.child_count == 0
+
+
+def test_build_tree_matches_attached_tree():
+    root, a, b = bus.Bus.build_tree(
+        ['root', 'a', 'b'], [None, 0, 1], links=[(0, 2, None)])
+    assert b.parent is a and a.parent is root
+    assert root.child_count == 2 and a.child_count == 1
+    assert b.path == root.path / 'a' / 'b'
+    assert root in b.links
+    sub = collector()
+    root.subscribe('', sub)
+    b.broadcast('ping', 'hi')
+    assert len(sub.received) == 1
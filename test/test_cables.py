@@ -0,0 +1,150 @@
+'''Tests for cables.py'''
+
+import pytest
+
+import bus
+import cables
+
+
+def test_message_sizes_are_real():
+    b = bus.Bus('root')
+    received = []
+    b.subscribe('', received.append)
+    b.broadcast('ping', 'hello {}', 'world')
+    assert received[0].size == len('hello world')
+
+
+def test_message_sizes_count_encoded_bytes():
+    a, b = bus.Bus('a'), bus.Bus('b')
+    a.attach(b, cable=cables.Cable(bandwidth=10, latency=0))
+    received, arrivals = [], []
+    b.subscribe('', received.append)
+    sim = cables.CableSimulator()
+    b.subscribe('ping', lambda msg: arrivals.append(sim.now))
+
+    a.broadcast('ping', '{}', 'ünïcödé')
+    sim.send(a, 'ping', 'ünïcödé')
+    sim.run()
+
+    # seven characters, four of them two bytes long
+    assert [msg.size for msg in received] == [11, 11]
+    # the plain broadcast arrives at once, the simulated one after
+    # clocking 11 bytes onto the cable
+    assert arrivals == [0.0, pytest.approx(1.1)]
+
+
+def test_latency_and_bandwidth_delay_delivery():
+    a, b, c = bus.Bus('a'), bus.Bus('b'), bus.Bus('c')
+    a.attach(b, cable=cables.Cable(bandwidth=100, latency=0.5))
+    b.attach(c, cable=cables.Cable(bandwidth=1000, latency=0.1))
+    arrivals = []
+    sim = cables.CableSimulator()
+    c.subscribe('ping', lambda msg: arrivals.append(sim.now))
+
+    sim.send(a, 'ping', 'x' * 100)
+    sim.run()
+
+    # 1s to clock 100 bytes onto the first cable, 0.5s latency, then
+    # 0.1s to clock them onto the second and 0.1s latency
+    assert arrivals == [pytest.approx(1.7)]
+
+
+def test_full_buffer_drops_and_reports_overload():
+    a, b = bus.Bus('a'), bus.Bus('b')
+    a.attach(b, cable=cables.Cable(bandwidth=10, latency=0, buffer=20))
+    received, overloads = [], []
+    b.subscribe('data', received.append)
+    a.subscribe('bus.overload', overloads.append)
+    sim = cables.CableSimulator()
+
+    for _ in range(5):
+        sim.send(a, 'data', 'x' * 10)
+    sim.run()
+
+    # one goes straight out, two more wait in the buffer
+    assert len(received) == 3
+    assert sim.dropped == 2
+    # the two in the buffer were delayed, the other two dropped
+    assert [msg.message.split(',')[0] for msg in overloads] == [
+        'Cable to Bus(a/b) is congested', 'Cable to Bus(a/b) is congested',
+        'Cable to Bus(a/b) is full', 'Cable to Bus(a/b) is full']
+    assert sim.link(a, b).dropped == 2
+
+
+def test_burst_goes_out_back_to_back():
+    a, b = bus.Bus('a'), bus.Bus('b')
+    a.attach(b, cable=cables.Cable(bandwidth=10, latency=0, burst=20))
+    arrivals = []
+    sim = cables.CableSimulator()
+    b.subscribe('data', lambda msg: arrivals.append(sim.now))
+
+    for _ in range(4):
+        sim.send(a, 'data', 'x' * 10)
+    sim.run()
+
+    # three go out at once, then the bucket is empty
+    assert arrivals == [pytest.approx(t) for t in (1, 1, 1, 2)]
+
+
+def test_queueing_behind_the_burst_reports_congestion():
+    a, b = bus.Bus('a'), bus.Bus('b')
+    a.attach(b, cable=cables.Cable(bandwidth=10, latency=0, burst=10))
+    received, overloads = [], []
+    b.subscribe('data', received.append)
+    a.subscribe('bus.overload', overloads.append)
+    sim = cables.CableSimulator()
+
+    for _ in range(3):
+        sim.send(a, 'data', 'x' * 10)
+    sim.run()
+
+    # two fit the burst, the third waits a second for the bucket
+    assert len(received) == 3
+    assert sim.dropped == 0 and sim.delayed == 1
+    assert sim.link(a, b).delayed == 1
+    assert [msg.message for msg in overloads] == [
+        'Cable to Bus(a/b) is congested, 10 bytes on data wait 1s']
+
+
+def test_plans_are_shared_by_topics_and_bounded(monkeypatch):
+    monkeypatch.setattr(cables, 'PLAN_CACHE_SIZE', 4)
+    a, b = bus.Bus('a'), bus.Bus('b')
+    a.attach(b)
+    received = []
+    b.subscribe('sensor', received.append)
+    sim = cables.CableSimulator()
+
+    for i in range(100):
+        sim.send(a, 'sensor.{}'.format(i), 'reading')
+        sim.send(a, 'noise.{}'.format(i), 'ignored')
+    sim.run()
+
+    assert len(received) == 100
+    # every sensor topic shares the plan made for the filter
+    assert {key[2] for key in sim._filter_plans} == {'sensor'}
+    assert len(sim._plans) <= 4
+
+    for i in range(10):
+        extra = bus.Bus('extra-{}'.format(i))
+        a.attach(extra)
+        extra.subscribe('sensor', received.append)
+        sim.send(extra, 'sensor', 'reading')
+        sim.run()
+    assert len(sim._plans) <= 4 and len(sim._filter_plans) <= 4
+
+
+def test_links_of_detached_buses_are_swept(monkeypatch):
+    monkeypatch.setattr(cables, 'LINK_SWEEP_SIZE', 4)
+    root = bus.Bus('root')
+    sim = cables.CableSimulator()
+    for i in range(20):
+        leaf = bus.Bus('leaf-{}'.format(i))
+        root.attach(leaf)
+        sim.link(root, leaf)
+        root.detach(leaf)
+    kept = bus.Bus('kept')
+    root.attach(kept)
+    link = sim.link(root, kept)
+
+    assert len(sim._links) <= 4
+    assert sim.link(root, kept) is link
@@ -0,0 +1,52 @@
+'''Tests for the load generator in client.py'''
+
+import asyncio
+
+import client
+import server
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 20))
+
+
+def test_parse_mix():
+    assert client.parse_mix('inv=5, buy Hull=2,look') == (
+        ('inv', 5), ('buy Hull', 2), ('look', 1))
+
+
+def test_percentile():
+    ordered = list(range(1000))
+    assert client.percentile(ordered, 0.5) == 500
+    assert client.percentile(ordered, 0.999) == 999
+    assert client.percentile([], 0.5) is None
+
+
+def test_load_against_a_framed_server():
+    async def scenario():
+        game = server.FramedGameServer(port=0)
+        await game.start()
+        summary = await client.generate_load(
+            port=game.port, players=20, rate=400, duration=0.5, seed=1)
+        await game.shutdown()
+        return summary
+    summary = run(scenario())
+    assert summary['players'] == 20 and summary['error_count'] == 0
+    # roughly the 200 requests asked for
+    assert 150 <= summary['requests'] <= 220
+    latency = summary['latency_ms']
+    assert 0 <= latency['p50'] <= latency['p99'] <= latency['p999']
+
+
+def test_errors_are_counted():
+    async def scenario():
+        # nothing listens on a port once its server has gone
+        game = server.FramedGameServer(port=0)
+        await game.start()
+        port = game.port
+        await game.shutdown()
+        return await client.generate_load(
+            port=port, players=3, rate=10, duration=0.1, timeout=1)
+    summary = run(scenario())
+    assert summary['errors'] == {'connect': 3}
+    assert summary['requests'] == 0 and summary['latency_ms']['p50'] is None
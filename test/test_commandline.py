@@ -0,0 +1,74 @@
+'''Tests for commandline.py'''
+
+import io
+
+import pytest
+
+import commandline
+import components as C
+
+
+class Phaser(C.Component):
+    pass
+
+
+def make_terminal(quiet=False):
+    terminal = commandline.SpaceshipCommand(quiet=quiet)
+    terminal.shop.add_to_inventory(Phaser)
+    return terminal
+
+
+def test_run_batch_buffers_output_and_times_commands():
+    terminal = make_terminal()
+    out = io.StringIO()
+    timings = terminal.run_batch([
+        '# build some phasers',
+        'buy phaser',
+        '',
+        'buy phaser x3',
+        'buy warp-core',
+    ], out)
+
+    lines = out.getvalue().splitlines()
+    assert lines[0].endswith('purchased and added to inventory.')
+    assert ' to ' in lines[1]
+    assert lines[2].startswith("Can't buy 'warp-core'")
+    assert len(terminal.inventory) == 4
+    assert timings['buy'][0] == 3
+    assert 'buy' in commandline.format_timings(timings)
+
+
+def test_quiet_keeps_only_problems():
+    terminal = make_terminal(quiet=True)
+    out = io.StringIO()
+    terminal.run_batch(['buy phaser x2', 'buy nothing', 'exit', 'buy phaser'],
+                       out)
+    assert out.getvalue().splitlines() == [
+        "Can't buy 'nothing' there's nothing like that."]
+    # exit stopped the script
+    assert len(terminal.inventory) == 2
+
+
+def test_failing_command_reports_its_line():
+    terminal = make_terminal()
+    out = io.StringIO()
+    with pytest.raises(commandline.ScriptError) as info:
+        terminal.run_batch(['inv', 'broadcast'], out)
+    assert info.value.line_number == 2
+    # output from before the failure is still written
+    assert out.getvalue() == 'Counter()\n'
+
+
+def test_test_command_runs_the_bench(capsys):
+    pytest.importorskip('numpy')
+    terminal = make_terminal()
+    terminal.onecmd('buy phaser')
+    name = terminal.inventory.contents()[0]
+    terminal.onecmd('test {} idle full'.format(name))
+    out = capsys.readouterr().out
+    assert 'Test bench report for ' + name in out
+    assert 'idle' in out and 'full' in out and 'cruise' not in out
+    terminal.onecmd('test {} warp'.format(name))
+    assert 'No scenario called warp' in capsys.readouterr().out
+    terminal.onecmd('test nothing-A')
+    assert capsys.readouterr().out.startswith('Usage')
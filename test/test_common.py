@@ -0,0 +1,15 @@
+'''Tests for common.py'''
+
+import common
+
+
+def test_unletterer_round_trips_letterer():
+    for num in range(40000):
+        assert common.unletterer(common.letterer(num)) == num
+
+
+def test_letterer_range_matches_letterer():
+    for start, count in [(0, 100), (30, 5), (1050, 10), (33790, 40)]:
+        assert list(common.letterer_range(start, start + count)) == [
+            common.letterer(num) for num in range(start, start + count)]
+    assert list(common.letterer_range(5, 5)) == []
@@ -1,9 +1,11 @@
 '''Tests for components.py'''
 
 from unittest.mock import MagicMock
+import warnings
 
 import pytest
 
+import bus
 import components as C
 
 
@@ -36,3 +38,128 @@ def test_components():
     assert len(inst_a.id) == len(inst_b.id)
     expected = "FakeComponent(attr=1, mass=1, name='fake-component-A')"
     assert repr(inst_a) == expected
+
+
+def test_component_store():
+    class Widget(C.Component):
+        mass = 2.5
+
+    class Gadget(C.Component):
+        pass
+
+    store = C.ComponentStore()
+    widget = store.add(Widget)
+    rows = store.add_many(Gadget, 3)
+    store.add(Widget, mass=4)
+
+    assert len(store) == 5
+    assert rows == range(1, 4)
+    assert widget.name == 'widget-A'
+    assert widget.shop_name == 'widget'
+    assert [ref.name for ref in store] == [
+        'widget-A', 'gadget-A', 'gadget-B', 'gadget-C', 'widget-B']
+    assert repr(store[-1]) == "Widget(mass=4.0, name='widget-B')"
+    assert str(store[2]) == 'gadget-B'
+    assert store[1] == store[1] and store[1] != store[2]
+    assert len({ref.id for ref in store}) == 5
+    assert Widget._counter == 2
+    assert store.total_mass() == 2.5 + 3 + 4
+    store[1].mass = 10
+    assert store.mass_by_kind() == {Widget: 6.5, Gadget: 12}
+    assert store.nbytes() == 5 * 14
+    with pytest.raises(IndexError):
+        store[5]
+
+
+def test_component_store_bus_is_made_on_demand():
+    class Sensor(C.Component):
+        pass
+
+    store = C.ComponentStore()
+    ref = store.add(Sensor)
+    assert not store._buses
+    assert ref.bus is store[0].bus
+    assert ref.bus.name == ref.name
+
+
+def test_component_id_and_bus_are_lazy():
+    class Lazy(C.Component):
+        pass
+
+    inst = Lazy()
+    assert '_bus' not in vars(inst) and '_id' not in vars(inst)
+    first_id, first_bus = inst.id, inst.bus
+    assert inst.id == first_id and inst.bus is first_bus
+    assert first_bus.name == 'lazy-A'
+    assert Lazy().id > first_id
+    assert repr(inst) == "Lazy(mass=1, name='lazy-A')"
+
+
+def test_create_many_matches_sequential_names():
+    class Bulk(C.Component):
+        def __init__(self, attr=0):
+            self.attr = attr
+            super().__init__()
+
+    single = Bulk()
+    many = Bulk.create_many(40, attr=3)
+    after = Bulk()
+
+    assert single.name == 'bulk-A'
+    assert [b.name for b in many[:2]] == ['bulk-B', 'bulk-C']
+    assert many[-1].name == 'bulk-AI'
+    assert after.name == 'bulk-AJ'
+    assert Bulk._counter == 42
+    assert all(b.attr == 3 and b.mass == 1 for b in many)
+
+
+def test_resolve_finds_components_by_name():
+    class Beacon(C.Component):
+        pass
+
+    first = Beacon()
+    many = Beacon.create_many(50)
+    C.ComponentStore().add_many(Beacon, 3)
+    last = Beacon()
+
+    assert C.resolve('beacon-A') is first
+    assert C.resolve(many[40].name) is many[40]
+    assert last.name == 'beacon-AW'
+    assert C.resolve('beacon-AW') is last
+    # numbers reserved by the store have no component behind them
+    assert C.resolve('beacon-AT') is None
+    assert C.resolve('beacon-ZZZ') is None
+    assert C.resolve('beacon-!') is None
+    assert C.resolve('no-such-thing-A') is None
+    C.forget(first)
+    assert C.resolve('beacon-A') is None
+
+
+def test_redefining_a_shop_name_replaces_it():
+    def define():
+        class Antenna(C.Component):
+            pass
+        return Antenna
+
+    first = define()
+    # the same class defined again, as a reload or rerun does, is quiet
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        second = define()
+    assert C._registry['antenna'] is second is not first
+
+    with pytest.warns(RuntimeWarning, match='antenna'):
+        class Aerial(C.Component):
+            shop_name = 'antenna'
+    assert C._registry['antenna'] is Aerial
+
+
+def test_owner_of_finds_the_component_a_bus_belongs_to():
+    class Dish(C.Component):
+        pass
+
+    dish = Dish()
+    assert C.owner_of(dish.bus) is dish
+    # a bus that only shares the name isn't the component's
+    assert C.owner_of(bus.Bus(dish.name)) is None
+    assert C.owner_of(bus.Bus('root')) is None
@@ -0,0 +1,134 @@
+'''Tests for dispatch.py'''
+
+import threading
+
+import bus
+import dispatch
+
+
+def test_subscribers_run_off_thread_in_order():
+    b = bus.Bus('root')
+    received = []
+    threads = set()
+
+    def subscriber(msg):
+        threads.add(threading.current_thread())
+        received.append(msg.message)
+
+    with dispatch.Dispatcher(workers=4) as dispatcher:
+        b.subscribe('sensor', subscriber, dispatcher=dispatcher)
+        for i in range(1000):
+            b.broadcast('sensor.heat', '{}', i)
+        dispatcher.join()
+
+    assert received == [str(i) for i in range(1000)]
+    assert threading.current_thread() not in threads
+
+
+def test_per_sender_order_with_many_senders():
+    root = bus.Bus('root')
+    senders = [bus.Bus('sender-{}'.format(i)) for i in range(4)]
+    root.attach_many(senders)
+    received = []
+    with dispatch.Dispatcher(workers=4) as dispatcher:
+        root.subscribe('ping', received.append, dispatcher=dispatcher)
+
+        def send(sender):
+            for i in range(500):
+                sender.broadcast('ping', '{}', i)
+        threads = [threading.Thread(target=send, args=(s,)) for s in senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        dispatcher.join()
+
+    for sender in senders:
+        mine = [int(m.message) for m in received if m.sender == sender.path]
+        assert mine == list(range(500))
+
+
+def blocked_mailbox(overflow):
+    '''A mailbox of size 2 whose subscriber is stuck on its first
+    message until the returned event is set'''
+    dispatcher = dispatch.Dispatcher(workers=1)
+    release, started = threading.Event(), threading.Event()
+    received = []
+
+    def subscriber(msg):
+        started.set()
+        release.wait()
+        received.append(msg)
+    mailbox = dispatcher.mailbox(subscriber, maxsize=2, overflow=overflow)
+    mailbox(0)
+    started.wait()
+    return dispatcher, mailbox, release, received
+
+
+def test_drop_newest():
+    dispatcher, mailbox, release, received = blocked_mailbox(
+        dispatch.DROP_NEWEST)
+    for i in range(1, 5):
+        mailbox(i)
+    release.set()
+    dispatcher.shutdown()
+    assert received == [0, 1, 2]
+    assert mailbox.dropped == 2
+
+
+def test_drop_oldest():
+    dispatcher, mailbox, release, received = blocked_mailbox(
+        dispatch.DROP_OLDEST)
+    for i in range(1, 5):
+        mailbox(i)
+    release.set()
+    dispatcher.shutdown()
+    assert received == [0, 3, 4]
+    assert mailbox.dropped == 2
+
+
+def test_block_waits_for_room():
+    dispatcher, mailbox, release, received = blocked_mailbox(dispatch.BLOCK)
+    mailbox(1)
+    mailbox(2)
+    sender = threading.Thread(target=mailbox, args=(3,))
+    sender.start()
+    sender.join(0.05)
+    assert sender.is_alive()
+    release.set()
+    sender.join()
+    dispatcher.shutdown()
+    assert received == [0, 1, 2, 3]
+
+
+def test_unsubscribe_dispatched_subscriber():
+    b = bus.Bus('root')
+    received = []
+    with dispatch.Dispatcher(workers=1) as dispatcher:
+        b.subscribe('ping', received.append, dispatcher=dispatcher)
+        assert b.unsubscribe('ping', received.append) is True
+        b.broadcast('ping', 'hi')
+    assert received == []
+
+
+def test_rewiring_while_broadcasting():
+    root = bus.Bus('root')
+    received = []
+    root.subscribe('ping', lambda msg: received.append(msg))
+    stop = threading.Event()
+
+    def rewire():
+        leaf = bus.Bus('leaf')
+        while not stop.is_set():
+            root.attach(leaf)
+            root.detach(leaf)
+
+    rewirer = threading.Thread(target=rewire)
+    rewirer.start()
+    try:
+        for i in range(2000):
+            root.broadcast('ping', '{}', i)
+    finally:
+        stop.set()
+        rewirer.join()
+    assert len(received) == 2000
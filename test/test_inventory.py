@@ -1,3 +1,4 @@
+import components
 import inventory
 from unittest.mock import MagicMock
 from collections import Counter
@@ -185,4 +186,59 @@ def test_multi_summary_contents_same():
     results = inv.summary_contents()
 
     #assert
-    assert expected == results
\ No newline at end of file
+    assert expected == results
+
+def test_store_many():
+    guns = [MagicMock() for _ in range(3)]
+    for i, gun in enumerate(guns):
+        gun.name = 'fakegun-{}'.format(i)
+    inv = inventory.Inventory()
+    inv.store_many(guns)
+    assert sorted(inv.contents()) == ['fakegun-0', 'fakegun-1', 'fakegun-2']
+    assert inv.retrieve('fakegun-1') is guns[1]
+
+def test_indexes_follow_store_and_destroy():
+    class FakeGun:
+        pass
+    class FakeShield:
+        pass
+    guns = []
+    for name in ['gun-C', 'gun-A', 'gun-B']:
+        guns.append(FakeGun())
+        guns[-1].name = name
+    shield = FakeShield()
+    shield.name = 'shield-A'
+    inv = inventory.Inventory()
+    inv.store_many(guns)
+    inv.store(shield)
+    # storing under the same name again replaces the item
+    inv.store(guns[0])
+
+    assert len(inv) == 4
+    assert inv.summary_contents() == Counter({FakeGun: 3, FakeShield: 1})
+    assert inv.names_of_type(FakeGun) == {'gun-A', 'gun-B', 'gun-C'}
+    assert list(inv.search('gun-')) == ['gun-A', 'gun-B', 'gun-C']
+    assert inv.page(limit=2) == ['gun-A', 'gun-B']
+    assert inv.page(after='gun-B', limit=2) == ['gun-C', 'shield-A']
+
+    assert inv.destroy('gun-B') is True
+    assert inv.destroy_many(['gun-A', 'shield-A', 'nothing']) == 2
+    assert list(inv.iter_contents()) == ['gun-C']
+    assert inv.summary_contents() == Counter({FakeGun: 1})
+    assert inv.names_of_type(FakeShield) == set()
+    assert list(inv.search('')) == ['gun-C']
+
+
+def test_destroyed_components_stop_resolving():
+    class Crate(components.Component):
+        pass
+    inv = inventory.Inventory()
+    kept, lost, *many = Crate.create_many(4)
+    inv.store_many([kept, lost, *many])
+
+    inv.destroy(lost.name)
+    inv.destroy_many([crate.name for crate in many])
+
+    assert components.resolve(kept.name) is kept
+    assert components.resolve(lost.name) is None
+    assert all(components.resolve(crate.name) is None for crate in many)
@@ -0,0 +1,104 @@
+'''Tests for protocol.py'''
+
+import asyncio
+import pathlib
+import socket
+import threading
+
+import pytest
+
+import bus
+import client
+import protocol
+import server
+
+
+def test_message_round_trip():
+    msg = bus.BusMessage('guns.fire', 'pew ✨', pathlib.PurePosixPath(
+        'root/gun-A'), 7, 12345678901)
+    assert protocol.decode_message(protocol.encode_message(msg)) == msg
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode_message(protocol.encode_message(msg)[:-1])
+
+
+def test_overlong_topics_are_a_protocol_error():
+    msg = bus.BusMessage('t' * (protocol.MAX_TOPIC + 1), '', 'root', 0, 1)
+    with pytest.raises(protocol.ProtocolError, match='longer than'):
+        protocol.encode_message(msg)
+
+
+def test_frame_reader_reassembles_split_and_merged_frames():
+    ours, theirs = socket.socketpair()
+    data = b''.join(protocol.encode_text(str(i)) for i in range(100))
+    # one frame spread over several sends, several frames in one send
+    theirs.sendall(data[:3])
+    theirs.sendall(data[3:250])
+    theirs.sendall(data[250:])
+    theirs.close()
+    reader = protocol.FrameReader(ours, chunk=64)
+    frames = list(reader)
+    assert [f.payload for f in frames] == [
+        str(i).encode() for i in range(100)]
+    assert all(f.type == protocol.TEXT for f in frames)
+    ours.close()
+
+
+def test_frame_reader_rejects_truncated_frames():
+    ours, theirs = socket.socketpair()
+    theirs.sendall(protocol.encode_text('hello')[:-2])
+    theirs.close()
+    with pytest.raises(protocol.ProtocolError):
+        protocol.FrameReader(ours).read()
+    ours.close()
+
+
+def test_async_read_frame():
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(protocol.encode_frame(protocol.ERROR, b'bad'))
+        reader.feed_data(protocol.encode_text('ok')[:3])
+        reader.feed_eof()
+        assert await protocol.read_frame(reader) == (protocol.ERROR, b'bad')
+        with pytest.raises(protocol.ProtocolError):
+            await protocol.read_frame(reader)
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def framed_server():
+    loop = asyncio.new_event_loop()
+    game = server.FramedGameServer(port=0)
+    loop.run_until_complete(game.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield game
+    asyncio.run_coroutine_threadsafe(game.shutdown(grace=1), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_pipelined_requests_come_back_in_order(framed_server):
+    with client.FramedClient('localhost', framed_server.port) as conn:
+        assert 'Welcome' in conn.motd
+        lines = ['line {}'.format(i) for i in range(500)]
+        frames = conn.pipeline(lines)
+        assert [f.payload.decode() for f in frames] == lines
+        msg = bus.BusMessage('a.b', 'hi', pathlib.PurePosixPath('x'), 2, 1)
+        conn.send_message(msg)
+        conn.flush()
+        frame = conn.receive()
+        assert frame.type == protocol.MESSAGE
+        assert protocol.decode_message(frame.payload) == msg
+        conn.writer.write(99, b'')
+        conn.flush()
+        assert conn.receive().type == protocol.ERROR
+
+
+def test_decoder_refuses_oversized_frames():
+    decoder = protocol.FrameDecoder()
+    assert decoder.feed(protocol.encode_text('hi')[:4]) == []
+    assert decoder.pending
+    with pytest.raises(protocol.ProtocolError):
+        protocol.FrameDecoder().feed(
+            protocol._HEADER.pack(protocol.MAX_FRAME + 1, protocol.TEXT))
@@ -0,0 +1,256 @@
+'''Tests for relay.py'''
+
+import asyncio
+import threading
+
+import pytest
+
+import asyncbus
+import bus
+import protocol
+import relay
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def started(**kwargs):
+    ship = relay.Relay({'ship': bus.Bus('ship')}, port=0, **kwargs)
+    await ship.start()
+    return ship
+
+
+def subscribers(ship, topic_filter):
+    return sum(('ship', topic_filter) in peer.subscriptions
+               for peer in ship.peers)
+
+
+async def subscribed(ship, topic_filter):
+    '''Returns a client once the relay has its subscription'''
+    before = subscribers(ship, topic_filter)
+    client = await relay.RelayClient.connect(ship.host, ship.port)
+    client.subscribe('ship', topic_filter)
+    await client.flush()
+    for _ in range(100):
+        if subscribers(ship, topic_filter) > before:
+            break
+        await asyncio.sleep(0.01)
+    return client
+
+
+def test_subscribers_get_matching_messages():
+    async def scenario():
+        ship = await started()
+        power = await subscribed(ship, 'power')
+        everything = await subscribed(ship, '')
+        ship.buses['ship'].broadcast('power.low', 'at {}%', 5)
+        ship.buses['ship'].broadcast('hull', 'breach')
+        msg = await power.receive()
+        assert (msg.topic, msg.message) == ('power.low', 'at 5%')
+        assert [(await everything.receive()).topic
+                for _ in range(2)] == ['power.low', 'hull']
+        await power.close()
+        await everything.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_each_message_is_encoded_once():
+    async def scenario():
+        ship = await started()
+        clients = [await subscribed(ship, 'power') for _ in range(5)]
+        clients.append(await subscribed(ship, ''))
+        ship.buses['ship'].broadcast('power', 'on')
+        for client in clients:
+            assert (await client.receive()).message == 'on'
+        assert ship.encoded == 1
+        # one bus subscription per filter, however many clients
+        assert len(ship.buses['ship'].subscribers) == 2
+        for client in clients:
+            await client.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_publish_reaches_the_bus_and_other_clients():
+    async def scenario():
+        ship = await started()
+        seen = []
+        ship.buses['ship'].subscribe('chat', seen.append)
+        listener = await subscribed(ship, 'chat')
+        talker = await relay.RelayClient.connect(ship.host, ship.port)
+        talker.publish('ship', 'chat', 'hello')
+        msg = await listener.receive()
+        assert msg.message == 'hello' and seen == [msg]
+        await listener.close()
+        await talker.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_publish_onto_an_async_bus():
+    async def scenario():
+        ship = relay.Relay({'ship': asyncbus.AsyncBus('ship')}, port=0)
+        await ship.start()
+        seen = []
+
+        async def subscriber(msg):
+            seen.append(msg.message)
+        subscription = ship.buses['ship'].subscribe('chat', subscriber)
+        listener = await subscribed(ship, 'chat')
+        talker = await relay.RelayClient.connect(ship.host, ship.port)
+        for word in ('one', 'two', 'three'):
+            talker.publish('ship', 'chat', word)
+        assert [(await listener.receive()).message
+                for _ in range(3)] == ['one', 'two', 'three']
+        await subscription.join()
+        assert seen == ['one', 'two', 'three']
+        await listener.close()
+        await talker.close()
+        await ship.shutdown()
+        subscription.close()
+    run(scenario())
+
+
+def test_overlong_topics_do_not_break_the_bus():
+    async def scenario():
+        ship = await started()
+        everything = await subscribed(ship, '')
+        seen = []
+        ship.buses['ship'].subscribe('', seen.append)
+        topic = 't' * (protocol.MAX_TOPIC + 1)
+        # broadcast on the ship, the relay can't send it on but the
+        # bus's other subscribers still get it
+        ship.buses['ship'].broadcast(topic, 'long')
+        assert [msg.message for msg in seen] == ['long']
+        assert ship.unencodable == 1
+        # published by a client, it's refused and the client stays
+        everything.publish('ship', topic, 'long')
+        with pytest.raises(protocol.ProtocolError, match='longer than'):
+            await everything.receive()
+        everything.publish('ship', 'short', 'fine')
+        assert (await everything.receive()).message == 'fine'
+        await everything.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_unknown_bus_is_an_error():
+    async def scenario():
+        ship = await started()
+        client = await relay.RelayClient.connect(ship.host, ship.port)
+        client.subscribe('station', '')
+        with pytest.raises(protocol.ProtocolError, match='station'):
+            await client.receive()
+        await client.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_leaving_unsubscribes_from_the_bus():
+    async def scenario():
+        ship = await started()
+        client = await subscribed(ship, 'power')
+        assert ship.buses['ship'].subscribers
+        await client.close()
+        for _ in range(100):
+            if not ship.peers:
+                break
+            await asyncio.sleep(0.01)
+        assert not ship.peers and not ship._fanouts
+        assert not ship.buses['ship'].subscribers
+        await ship.shutdown()
+    run(scenario())
+
+
+def test_broadcast_from_another_thread():
+    async def scenario():
+        ship = await started()
+        client = await subscribed(ship, '')
+        thread = threading.Thread(
+            target=ship.buses['ship'].broadcast, args=('power', 'on'))
+        thread.start()
+        thread.join()
+        assert (await client.receive()).message == 'on'
+        await client.close()
+        await ship.shutdown()
+    run(scenario())
+
+
+class FakeWriter:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def peer(overflow, max_buffer=30):
+    return relay.Peer(None, None, FakeWriter(), max_buffer, overflow)
+
+
+def queued(peer):
+    return [frame for _, frame in peer._queue]
+
+
+def test_drop_oldest():
+    client = peer(relay.DROP_OLDEST)
+    for frame in (b'a' * 10, b'b' * 10, b'c' * 10, b'd' * 10):
+        client.send('t', frame)
+    assert queued(client) == [b'b' * 10, b'c' * 10, b'd' * 10]
+    assert client.dropped == 1
+
+
+def test_drop_newest():
+    client = peer(relay.DROP_NEWEST)
+    for frame in (b'a' * 10, b'b' * 10, b'c' * 10, b'd' * 10):
+        client.send('t', frame)
+    assert queued(client) == [b'a' * 10, b'b' * 10, b'c' * 10]
+    assert client.dropped == 1
+
+
+def test_coalesce_keeps_the_latest_per_topic():
+    client = peer(relay.COALESCE)
+    client.send('power', b'a' * 10)
+    client.send('hull', b'b' * 10)
+    client.send('power', b'c' * 10)
+    # full, so the newest power message replaces the queued one
+    client.send('power', b'd' * 10)
+    assert queued(client) == [b'a' * 10, b'b' * 10, b'd' * 10]
+    # a topic with nothing queued pushes out the oldest
+    client.send('shields', b'e' * 10)
+    assert queued(client) == [b'b' * 10, b'd' * 10, b'e' * 10]
+    assert client.dropped == 2 and client._queued_bytes == 30
+
+
+def test_disconnect():
+    client = peer(relay.DISCONNECT)
+    for frame in (b'a' * 10, b'b' * 10, b'c' * 10, b'd' * 10):
+        client.send('t', frame)
+    assert client.writer.closed and client.dropped == 1
+
+
+def test_slow_client_does_not_hold_up_the_others():
+    async def scenario():
+        ship = await started(max_buffer=4096)
+        fast = await subscribed(ship, '')
+        slow = await subscribed(ship, '')
+
+        async def read_all():
+            return [(await fast.receive()).message[:5]
+                    for _ in range(20000)]
+        received = asyncio.ensure_future(read_all())
+        # the slow client never reads, so its socket buffers fill and
+        # the relay has to drop for it
+        for i in range(20000):
+            ship.buses['ship'].broadcast('power', '{:05}{}', i, 'x' * 1000)
+            if i % 3 == 0:
+                await asyncio.sleep(0)
+        assert await received == \
+            ['{:05}'.format(i) for i in range(20000)]
+        assert sum(peer.dropped for peer in ship.peers) > 0
+        await fast.close()
+        await slow.close()
+        await ship.shutdown()
+    run(scenario())
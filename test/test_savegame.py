@@ -0,0 +1,163 @@
+'''Tests for savegame.py'''
+
+import pytest
+
+import bus
+import cables
+import components as C
+import savegame
+from inventory import Inventory
+
+
+class Hull(C.Component):
+    mass = 500
+
+
+class Thruster(C.Component):
+    def __init__(self, power=10):
+        self.power = power
+        super().__init__()
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'ship.save'
+    inv = Inventory()
+    hulls = Hull.create_many(3)
+    inv.store_many(hulls)
+    thruster = Thruster(power=25)
+    inv.store(thruster)
+
+    root = bus.Bus('root')
+    wired = Thruster()
+    cable = cables.Cable(bandwidth=100, latency=0.5)
+    root.attach(wired.bus, cable)
+    root.attach(thruster.bus)
+    # a redundant link inside the tree
+    wired.bus.attach(thruster.bus)
+    savegame.save(path, inv, [root])
+
+    C.forget(thruster)
+    C.forget(wired)
+    for hull in hulls:
+        C.forget(hull)
+
+    with savegame.load(path) as game:
+        assert len(game) == 5
+        assert sorted(game.names()) == sorted(
+            [h.name for h in hulls] + [thruster.name, wired.name])
+        # nothing is made until it's asked for
+        assert not game._made
+        loaded = game.inventory()
+        assert sorted(loaded.contents()) == sorted(inv.contents())
+        copy = game.resolve(thruster.name)
+        assert copy is not thruster
+        assert copy.power == 25 and copy.mass == 1
+        assert game.resolve(hulls[1].name).mass == 500
+        assert C.resolve(hulls[1].name) is game.resolve(hulls[1].name)
+        assert game.resolve('hull-ZZZZ') is None
+
+        [loaded_root] = game.buses()
+        assert loaded_root.name == 'root'
+        wired_copy = game.resolve(wired.name)
+        assert wired_copy.bus.parent is loaded_root
+        assert loaded_root.cables[wired_copy.bus] == cable
+        assert copy.bus in wired_copy.bus.links
+
+    # new components don't reuse saved names
+    assert Hull().name not in {h.name for h in hulls}
+
+
+def test_resolve_prefers_the_save_to_live_components(tmp_path):
+    path = tmp_path / 'ship.save'
+    inv = Inventory()
+    hull = Hull()
+    inv.store(hull)
+    savegame.save(path, inv)
+    hull.mass = 999
+
+    with savegame.load(path) as game:
+        saved = game.resolve(hull.name)
+        assert saved is not hull and saved.mass == 500
+        assert game.inventory().retrieve(hull.name) is saved
+        # names the save doesn't have are still found
+        assert game.resolve(Hull().name) is not None
+        assert game.resolve('hull-ZZZZ') is None
+
+
+def test_journal_replays_on_top_of_snapshot(tmp_path):
+    path = tmp_path / 'ship.save'
+    inv = Inventory()
+    first, second = Hull.create_many(2)
+    inv.store_many([first, second])
+    root = bus.Bus('root')
+    savegame.save(path, inv, [root])
+
+    with savegame.Journal(path) as journal:
+        extra = Thruster(power=3)
+        journal.new(extra)
+        journal.store(extra)
+        journal.destroy(first.name)
+        journal.attach(root, extra.bus, cables.Cable(bandwidth=10, latency=1))
+    C.forget(extra)
+
+    with savegame.load(path) as game:
+        loaded = game.inventory()
+        assert sorted(loaded.contents()) == sorted([second.name, extra.name])
+        assert loaded.retrieve(extra.name).power == 3
+        [loaded_root] = game.buses()
+        assert [b.name for b in loaded_root.children] == [extra.name]
+        assert loaded_root.cables[loaded_root.children[0]].latency == 1
+
+    # saving again folds the journal into the snapshot
+    savegame.save(path, loaded, [loaded_root])
+    assert list(savegame.read_journal(path)) == []
+
+
+def test_torn_journal_record_is_ignored(tmp_path):
+    path = tmp_path / 'ship.save'
+    savegame.save(path)
+    with savegame.Journal(path) as journal:
+        journal.destroy('hull-A')
+    with open(savegame.journal_path(path), 'ab') as f:
+        f.write(savegame._RECORD.pack(savegame.STORE, 100) + b'["hu')
+    assert list(savegame.read_journal(path)) == [
+        (savegame.DESTROY, ['hull-A'])]
+
+
+def test_journal_appends_after_a_torn_record(tmp_path):
+    path = tmp_path / 'ship.save'
+    inv = Inventory()
+    hulls = Hull.create_many(12)
+    inv.store_many(hulls)
+    savegame.save(path, inv)
+    with open(savegame.journal_path(path), 'ab') as f:
+        f.write(savegame._RECORD.pack(savegame.STORE, 100) + b'["hu')
+
+    with savegame.Journal(path) as journal:
+        for hull in hulls[:10]:
+            journal.destroy(hull.name)
+
+    with savegame.load(path) as game:
+        assert sorted(game.inventory().contents()) == sorted(
+            hull.name for hull in hulls[10:])
+
+
+def test_journal_storing_an_unknown_component(tmp_path):
+    path = tmp_path / 'ship.save'
+    savegame.save(path)
+    # stored without the journal recording it being made
+    lost = Thruster()
+    with savegame.Journal(path) as journal:
+        journal.store(lost)
+    C.forget(lost)
+
+    with savegame.load(path) as game:
+        with pytest.raises(ValueError, match='not in the save game'):
+            game.inventory()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.save'
+    path.write_bytes(b'hello, this is not a save game')
+    with pytest.raises(ValueError, match='not a save game'):
+        savegame.load(path)
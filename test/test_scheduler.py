@@ -0,0 +1,119 @@
+'''Tests for scheduler.py'''
+
+import pytest
+
+import components
+import scheduler
+
+
+def test_runs_in_time_order():
+    clock = scheduler.Scheduler()
+    ran = []
+    clock.call_at(3, ran.append, 'c')
+    clock.call_at(1, ran.append, 'a')
+    clock.call_later(2, ran.append, 'b')
+    # same time as b, scheduled later, so runs after it
+    clock.call_at(2, ran.append, 'b2')
+    assert clock.run() == 4
+    assert ran == ['a', 'b', 'b2', 'c'] and clock.now == 3
+
+
+def test_run_stops_at_until():
+    clock = scheduler.Scheduler()
+    ran = []
+    clock.call_at(1, ran.append, 1)
+    clock.call_at(5, ran.append, 5)
+    assert clock.run(until=2) == 1
+    assert ran == [1] and clock.now == 2 and len(clock) == 1
+    clock.advance(3)
+    assert ran == [1, 5] and clock.now == 5
+
+
+def test_callbacks_see_their_due_time():
+    clock = scheduler.Scheduler()
+    seen = []
+    clock.call_at(1.5, lambda: seen.append(clock.now))
+    clock.advance(10)
+    assert seen == [1.5] and clock.now == 10
+
+
+def test_recurring_timers_keep_to_schedule():
+    clock = scheduler.Scheduler()
+    seen = []
+    timer = clock.call_every(0.5, lambda: seen.append(clock.now))
+    clock.advance(2)
+    assert seen == [0.5, 1.0, 1.5, 2.0]
+    timer.cancel()
+    clock.advance(2)
+    assert len(seen) == 4 and len(clock) == 0
+
+
+def test_recurring_timer_can_cancel_itself():
+    clock = scheduler.Scheduler()
+    shots = []
+
+    def fire():
+        shots.append(clock.now)
+        if len(shots) == 3:
+            timer.cancel()
+    timer = clock.call_every(1, fire, start=0)
+    clock.advance(10)
+    assert shots == [0, 1, 2]
+    assert len(clock) == 0
+
+
+def test_cancel():
+    clock = scheduler.Scheduler()
+    ran = []
+    timers = [clock.call_at(i, ran.append, i) for i in range(1000)]
+    for timer in timers[::2]:
+        clock.cancel(timer)
+    assert len(clock) == 500
+    # mostly cancelled, so the heap was compacted
+    for timer in timers[1:900:2]:
+        timer.cancel()
+    assert len(clock) == 50 and len(clock._timers) < 1000
+    clock.run()
+    assert ran == list(range(901, 1000, 2))
+    # cancelling one that already ran does nothing
+    timers[-1].cancel()
+    assert len(clock) == 0
+
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        scheduler.Scheduler().call_every(0, print)
+
+
+def test_run_realtime_faster_than_real_time():
+    clock = scheduler.Scheduler()
+    ran = []
+    clock.call_every(10, lambda: ran.append(clock.now))
+    wall = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        wall[0] += seconds
+    clock.run_realtime(30, speed=10, clock=lambda: wall[0], sleep=sleep)
+    assert ran == [10, 20, 30] and clock.now == 30
+    assert slept == [pytest.approx(1)] * 3
+
+
+class Shield(components.Component):
+    pass
+
+
+def test_components_publish_on_their_bus():
+    shield = Shield()
+    heard = []
+    shield.bus.subscribe('shield', lambda msg: heard.append(
+        (msg.topic, msg.message)))
+    clock = scheduler.Scheduler()
+    recharge = clock.publish_every(shield, 2, 'shield.charge', '{}%', 10)
+    clock.publish_later(shield, 3, 'shield.up', 'online')
+    clock.advance(4)
+    recharge.cancel()
+    clock.advance(4)
+    assert heard == [('shield.charge', '10%'), ('shield.up', 'online'),
+                     ('shield.charge', '10%')]
@@ -0,0 +1,73 @@
+'''Tests for server.py'''
+
+import asyncio
+
+import server
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def started(**kwargs):
+    game = server.GameServer(port=0, **kwargs)
+    await game.start()
+    return game
+
+
+async def connect(game):
+    reader, writer = await asyncio.open_connection(game.host, game.port)
+    assert await reader.readexactly(len(game.motd)) == game.motd
+    return reader, writer
+
+
+def test_echo_and_quit():
+    async def scenario():
+        game = await started()
+        reader, writer = await connect(game)
+        writer.write(b'hello')
+        assert await reader.read(4096) == b'hello'
+        writer.write(b'/q')
+        assert await reader.read() == b''
+        writer.close()
+        await game.shutdown()
+        assert game.accepted == 1 and game.connections == 0
+    run(scenario())
+
+
+def test_client_hanging_up_is_cleaned_up():
+    async def scenario():
+        game = await started()
+        clients = [await connect(game) for _ in range(20)]
+        assert game.connections == 20
+        for _, writer in clients:
+            writer.close()
+        for _ in range(100):
+            if not game.connections:
+                break
+            await asyncio.sleep(0.01)
+        assert game.connections == 0
+        await game.shutdown()
+    run(scenario())
+
+
+def test_idle_clients_are_disconnected():
+    async def scenario():
+        game = await started(idle_timeout=0.05)
+        reader, writer = await connect(game)
+        assert await reader.read() == server.IDLE
+        writer.close()
+        await game.shutdown()
+    run(scenario())
+
+
+def test_shutdown_says_goodbye():
+    async def scenario():
+        game = await started()
+        reader, writer = await connect(game)
+        shutdown = asyncio.ensure_future(game.shutdown(grace=1))
+        assert await reader.read() == server.GOODBYE
+        writer.close()
+        await shutdown
+        assert game.connections == 0
+    run(scenario())
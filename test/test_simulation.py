@@ -0,0 +1,118 @@
+'''Tests for simulation.py'''
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import components  # noqa: E402
+import simulation  # noqa: E402
+
+
+class SimCore(components.Component):
+    power_output = 1000.0
+    heat_output = 100.0
+    cooling = 10.0
+
+
+class SimGun(components.Component):
+    power_draw = 400.0
+    cooling = 1.0
+
+
+class SimConduit(components.Component):
+    pass
+
+
+def wired(*parts):
+    '''Attaches every part after the first to the first'''
+    for part in parts[1:]:
+        parts[0].bus.attach(part.bus)
+    return list(parts)
+
+
+def test_compile_builds_edges_from_buses():
+    core, gun = SimCore(), SimGun()
+    conduit, loose = SimConduit(), SimConduit()
+    core.bus.attach(conduit.bus)
+    conduit.bus.attach(gun.bus)
+    ship = simulation.compile_ship([core, gun, conduit, loose])
+    pairs = {frozenset(pair) for pair in zip(ship.edges.rows.tolist(),
+                                             ship.edges.cols.tolist())}
+    assert pairs == {frozenset((0, 2)), frozenset((1, 2))}
+    # the loose conduit is on a grid of its own
+    assert ship.grid_count == 2 and ship.grid[3] != ship.grid[0]
+
+
+def test_links_are_edges_too():
+    a, b, c = SimConduit(), SimConduit(), SimConduit()
+    a.bus.attach(b.bus)
+    b.bus.attach(c.bus)
+    # already connected, so this makes a redundant link
+    a.bus.attach(c.bus)
+    assert c.bus in a.bus.links
+    ship = simulation.compile_ship([a, b, c])
+    assert len(ship.edges.rows) == 3
+
+
+def test_enough_power():
+    ship = simulation.compile_ship(wired(SimCore(), SimGun(), SimGun()))
+    ship.step(0.1)
+    assert ship.underpowered() == []
+    assert np.all(ship.satisfaction == 1)
+
+
+def test_power_shortage_is_shared():
+    parts = wired(SimCore(), SimGun(), SimGun(), SimGun(), SimGun())
+    ship = simulation.compile_ship(parts)
+    ship.step(0.1)
+    assert ship.satisfaction[1] == pytest.approx(1000 / 1600)
+    assert ship.underpowered() == [gun.name for gun in parts[1:]]
+    # with two guns switched off the rest are fully powered
+    ship.load[3:] = 0
+    ship.step(0.1)
+    assert ship.underpowered() == []
+
+
+def test_grids_do_not_share_power():
+    first = wired(SimCore(), SimGun())
+    second = wired(SimConduit(), SimGun())
+    ship = simulation.compile_ship(first + second)
+    ship.step(0.1)
+    assert ship.underpowered() == [second[1].name]
+
+
+def test_unwired_parts_step_on_their_own():
+    core, gun = SimCore(), SimGun()
+    ship = simulation.compile_ship([core, gun])
+    assert len(ship.edges.rows) == 0
+    ship.run(10, 1)
+    # nothing powers the gun, and nothing draws on the core, so
+    # neither warms up
+    assert ship.underpowered() == [gun.name]
+    assert ship.temperature.dtype == np.float64
+    assert np.all(ship.temperature == ship.ambient)
+
+
+def test_heat_flows_and_settles():
+    core, conduit, gun = SimCore(), SimConduit(), SimGun()
+    core.bus.attach(conduit.bus)
+    conduit.bus.attach(gun.bus)
+    ship = simulation.compile_ship([core, conduit, gun])
+    ship.run(2000, 10)
+    # heat made by the gun and core ends up radiated by their coolers,
+    # with the conduit in between
+    made = 400 + 100 * 0.4
+    shed = (10 * (ship.temperature[0] - ship.ambient) +
+            1 * (ship.temperature[2] - ship.ambient))
+    assert shed == pytest.approx(made, rel=1e-3)
+    assert ship.temperature[2] > ship.temperature[1] > ship.temperature[0]
+    assert ship.hottest(1) == [(gun.name, pytest.approx(
+        ship.temperature[2]))]
+
+
+def test_long_steps_stay_stable():
+    ship = simulation.compile_ship(wired(SimCore(), SimGun()))
+    assert ship.max_step < 1000
+    ship.run(10, 1000)
+    assert np.all(np.isfinite(ship.temperature))
+    assert np.all(ship.temperature >= ship.ambient)
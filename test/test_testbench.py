@@ -0,0 +1,97 @@
+'''Tests for testbench.py'''
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import components  # noqa: E402
+import testbench  # noqa: E402
+
+
+class BenchCore(components.Component):
+    power_output = 500.0
+    heat_output = 50.0
+    cooling = 5.0
+
+
+class BenchGun(components.Component):
+    power_draw = 200.0
+    cooling = 0.5
+    thermal_mass = 100.0
+    max_temperature = 400.0
+
+
+def rig(guns=2):
+    core = BenchCore()
+    for gun in BenchGun.create_many(guns):
+        core.bus.attach(gun.bus)
+    return core
+
+
+def test_assembly_follows_the_bus():
+    core = rig(3)
+    loose = BenchGun()
+    parts = testbench.assembly(core)
+    assert parts[0] is core and len(parts) == 4 and loose not in parts
+    # a component that was never wired up is an assembly of one
+    assert testbench.assembly(loose) == [loose]
+
+
+def test_links_do_not_pull_in_other_subtrees():
+    ship, turret, shield = BenchCore(), rig(2), rig(1)
+    ship.bus.add_child(turret.bus)
+    ship.bus.add_child(shield.bus)
+    first, second = turret.bus.children
+    [shield_gun] = shield.bus.children
+    # redundant links, as everything is already in one tree
+    first.attach(shield_gun)
+    first.attach(second)
+    parts = testbench.assembly(turret)
+    assert [part.bus for part in parts] == [turret.bus, first, second]
+    # the link inside the assembly still carries heat
+    assert len(testbench.Snapshot(parts).model.edges.rows) == 3
+
+
+def test_loads_by_name_kind_and_default():
+    core = rig(3)
+    snapshot = testbench.Snapshot(testbench.assembly(core))
+    gun = snapshot.model.names[2]
+    loads = snapshot.loads(testbench.Scenario('mixed', {'*': 0.5, gun: 0}))
+    # '*' is for consumers, so the core stays fully available
+    assert loads.tolist() == [1.0, 0.5, 0.0, 0.5]
+    loads = snapshot.loads(testbench.Scenario(
+        'throttled', {'bench-core': 0.2, 'bench-gun': 0.1, gun: 1}))
+    assert loads.tolist() == [0.2, 0.1, 1.0, 0.1]
+
+
+def test_scenarios_find_overheating_and_shortages():
+    core = rig(3)
+    snapshot = testbench.Snapshot(testbench.assembly(core))
+    idle = snapshot.run(testbench.Scenario('idle', {'*': 0.1}, 600, 1))
+    assert idle.underpowered == [] and idle.overheated == []
+    full = snapshot.run(testbench.Scenario('full', {}, 600, 1))
+    # 600W asked of a 500W core, and each gun makes 500/3W it can only
+    # shed half a watt per kelvin of
+    guns = snapshot.model.names[1:]
+    assert full.underpowered == guns and full.overheated == guns
+    assert full.peak > 400 and full.hottest in guns
+
+
+def test_run_in_parallel_matches_running_in_process():
+    core = rig(2)
+    scenarios = list(testbench.SCENARIOS.values())
+    report = testbench.run(core, scenarios, workers=2)
+    snapshot = testbench.Snapshot(testbench.assembly(core))
+    assert report.results == [snapshot.run(s) for s in scenarios]
+    assert [r.scenario for r in report.results] == ['idle', 'cruise', 'full']
+    text = report.format()
+    assert core.name in text and text.splitlines()[-1] in ('PASSED',
+                                                           'FAILED')
+
+
+def test_report_passes_only_without_problems():
+    ok = testbench.Result('idle', 300.0, 'a', [], [])
+    hot = testbench.Result('full', 500.0, 'a', [], ['a'])
+    assert testbench.Report('a', [ok]).passed
+    report = testbench.Report('a', [ok, hot])
+    assert not report.passed and 'full: overheated a' in report.format()
@@ -0,0 +1,158 @@
+'''The test bench: puts a component, and everything attached below it,
+through load scenarios to see what overheats or runs short of power.
+
+The assembly is compiled once into a simulation.ShipModel, which is
+just arrays, and that is pickled once and handed to each worker process
+as it starts. Scenarios then only send their name and loads, so a big
+assembly isn't re-pickled for every scenario, and the results come back
+as a few numbers and names each, to be merged into one Report.
+'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import pickle
+
+import numpy as np
+
+import components
+import simulation
+
+Scenario = namedtuple('Scenario', 'name loads duration dt')
+Scenario.__new__.__defaults__ = (60.0, 0.5)
+Scenario.__doc__ = '''A load held for duration simulated seconds. loads
+maps component names or shop names to a load from 0 to 1, with '*' for
+every power consumer not named. Anything left out runs at full load,
+so power supplies are available in full unless named'''
+
+Result = namedtuple('Result', 'scenario peak hottest underpowered overheated')
+Result.__doc__ = '''What happened in one scenario: the highest temperature
+reached, the component that reached it, and the names of components
+that ran short of power or went over their max_temperature'''
+
+# Ready-made scenarios for the test command
+SCENARIOS = {
+    'idle': Scenario('idle', {'*': 0.1}),
+    'cruise': Scenario('cruise', {'*': 0.5}),
+    'full': Scenario('full', {'*': 1.0}),
+}
+
+
+def assembly(component):
+    '''Returns component and every component whose bus is attached below
+    its bus. Links are only simulated between buses that are both in the
+    assembly, so they never bring in anything else'''
+    found = [component]
+    node = vars(component).get('_bus')
+    if node is None:
+        return found
+    queue = list(node.children)
+    for node in queue:
+        queue.extend(node.children)
+        owner = components.owner_of(node)
+        if owner is not None:
+            found.append(owner)
+    return found
+
+
+class Snapshot:
+    '''What a worker needs to run scenarios: the compiled model, each
+    component's shop name, and each component's max_temperature'''
+
+    def __init__(self, parts):
+        self.model = simulation.compile_ship(parts)
+        self.kinds = [type(part).shop_name for part in parts]
+        self.limits = np.array(
+            [getattr(part, 'max_temperature', math.inf) for part in parts],
+            dtype=np.float64)
+
+    def loads(self, scenario):
+        '''Returns the load array for scenario'''
+        loads = np.ones(len(self.kinds))
+        loads[self.model.power_draw > 0] = scenario.loads.get('*', 1.0)
+        for i, (name, kind) in enumerate(zip(self.model.names, self.kinds)):
+            if name in scenario.loads:
+                loads[i] = scenario.loads[name]
+            elif kind in scenario.loads:
+                loads[i] = scenario.loads[kind]
+        return loads
+
+    def run(self, scenario):
+        '''Runs one scenario from ambient and returns its Result'''
+        model = self.model
+        model.reset()
+        model.load = self.loads(scenario)
+        peak = model.temperature.copy()
+        short = np.zeros(len(model), dtype=bool)
+        for _ in range(max(1, round(scenario.duration / scenario.dt))):
+            model.step(scenario.dt)
+            np.maximum(peak, model.temperature, out=peak)
+            short |= (model.satisfaction < 1) & \
+                (model.power_draw * model.load > 0)
+        names = model.names
+        hottest = int(np.argmax(peak)) if len(model) else None
+        return Result(
+            scenario.name,
+            float(peak[hottest]) if hottest is not None else model.ambient,
+            names[hottest] if hottest is not None else None,
+            [names[i] for i in np.flatnonzero(short)],
+            [names[i] for i in np.flatnonzero(peak > self.limits)])
+
+
+# The snapshot in each worker process, installed by _install
+_snapshot = None
+
+
+def _install(data):
+    global _snapshot
+    _snapshot = pickle.loads(data)
+
+
+def _run(scenario):
+    return _snapshot.run(scenario)
+
+
+class Report:
+    '''The Results of every scenario run on one assembly'''
+
+    def __init__(self, root, results):
+        self.root = root
+        self.results = list(results)
+
+    @property
+    def passed(self):
+        '''Whether nothing overheated or ran short of power anywhere'''
+        return not any(result.underpowered or result.overheated
+                       for result in self.results)
+
+    def format(self):
+        lines = ['Test bench report for {}'.format(self.root),
+                 '{:<12} {:>10} {:<16} {:>12} {:>10}'.format(
+                     'scenario', 'peak K', 'hottest', 'underpowered',
+                     'overheated')]
+        for result in self.results:
+            lines.append('{:<12} {:>10.1f} {:<16} {:>12} {:>10}'.format(
+                result.scenario, result.peak, result.hottest or '-',
+                len(result.underpowered), len(result.overheated)))
+        for result in self.results:
+            if result.overheated:
+                lines.append('{}: overheated {}'.format(
+                    result.scenario, ', '.join(result.overheated)))
+        lines.append('PASSED' if self.passed else 'FAILED')
+        return '\n'.join(lines)
+
+
+def run(component, scenarios, workers=None):
+    '''Runs every scenario on component's assembly, across workers
+    processes (default: one per CPU), and returns a Report'''
+    scenarios = list(scenarios)
+    data = pickle.dumps(Snapshot(assembly(component)),
+                        pickle.HIGHEST_PROTOCOL)
+    if workers is None:
+        workers = min(len(scenarios), os.cpu_count() or 1)
+    workers = max(1, workers)
+    with ProcessPoolExecutor(workers, initializer=_install,
+                             initargs=(data,)) as pool:
+        results = list(pool.map(_run, scenarios))
+    return Report(component.name, results)